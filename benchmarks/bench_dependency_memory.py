@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Memory held by the dependency maps of a workspace index, comparing the previous dataclass with
+ten booleans and five version strings per edge against the current RosDepDescription.
+
+    python benchmarks/bench_dependency_memory.py --repos ros2.repos --src src
+    python benchmarks/bench_dependency_memory.py --packages 10000 --fanout 15
+"""
+
+import argparse
+import os
+import random
+import sys
+import tracemalloc
+from dataclasses import dataclass
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ros2conan.rospackageparser import DepKind, RosDepDescription, VersionConstraint, version_attrib_ops
+
+@dataclass
+class LegacyRosDepDescription:
+    build_depend: bool = False
+    build_export_depend: bool = False
+    buildtool_depend: bool = False
+    buildtool_export_depend: bool = False
+    exec_depend: bool = False
+    depend: bool = False
+    doc_depend: bool = False
+    test_depend: bool = False
+    conflict: bool = False
+    replace: bool = False
+    version_lt: str|None = None
+    version_lte: str|None = None
+    version_eq: str|None = None
+    version_gte: str|None = None
+    version_gt: str|None = None
+
+def workspace_edges(repos_file: str, src: str) -> list[list[tuple[str, DepKind, dict[str, str]]]]:
+    from ros2conan.utils import read_repos
+    from ros2conan.workspace import scan_workspace
+
+    index = scan_workspace(read_repos(repos_file), src)
+    attrib_of_op = {op: attrib for attrib, op in version_attrib_ops.items()}
+    return [[(name, dep.kinds, {attrib_of_op[c.op]: c.version for c in dep.constraints})
+             for name, dep in parsed.dependencies.items()]
+            for parsed in index.values()]
+
+def synthetic_edges(packages: int, fanout: int) -> list[list[tuple[str, DepKind, dict[str, str]]]]:
+    rng = random.Random(0)
+    kinds = [kind for kind in DepKind if kind]
+    edges = []
+    for _ in range(packages):
+        pkg_edges = []
+        for dep in rng.sample(range(packages), min(fanout, packages)):
+            attribs = {"version_gte": f"{rng.randint(0, 3)}.{rng.randint(0, 20)}.0"} if rng.random() < 0.1 else {}
+            pkg_edges.append((f"package_{dep}", rng.choice(kinds), attribs))
+        edges.append(pkg_edges)
+    return edges
+
+def build_legacy(edges):
+    index = []
+    for pkg_edges in edges:
+        deps = {}
+        for name, kind, attribs in pkg_edges:
+            # str() copies, as str(element.text) did for every edge
+            dep = deps.setdefault("".join(name), LegacyRosDepDescription())
+            setattr(dep, kind.name.lower(), True)
+            for attrib, val in attribs.items():
+                setattr(dep, attrib, val)
+        index.append(deps)
+    return index
+
+def build_current(edges):
+    index = []
+    for pkg_edges in edges:
+        index.append({sys.intern("".join(name)): RosDepDescription(kind, tuple(VersionConstraint(version_attrib_ops[attrib], val) for attrib, val in attribs.items()))
+                      for name, kind, attribs in pkg_edges})
+    return index
+
+def traced_bytes(build, edges) -> int:
+    tracemalloc.start()
+    index = build(edges)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del index
+    return current
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repos", help=".repos file of a checked out workspace, synthetic edges are used when not given")
+    parser.add_argument("--src", default="src")
+    parser.add_argument("--packages", type=int, default=5000)
+    parser.add_argument("--fanout", type=int, default=15)
+    args = parser.parse_args()
+
+    edges = workspace_edges(args.repos, args.src) if args.repos else synthetic_edges(args.packages, args.fanout)
+    edge_count = sum(len(pkg_edges) for pkg_edges in edges)
+
+    legacy = traced_bytes(build_legacy, edges)
+    current = traced_bytes(build_current, edges)
+    print(f"{len(edges)} packages, {edge_count} dependency edges")
+    print(f"{'legacy dataclass':<18} {legacy / 1024:>10.1f} KiB {legacy / edge_count:>7.1f} B/edge")
+    print(f"{'RosDepDescription':<18} {current / 1024:>10.1f} KiB {current / edge_count:>7.1f} B/edge "
+          f"({100 * (1 - current / legacy):.0f}% less)")
+
+if __name__ == "__main__":
+    main()
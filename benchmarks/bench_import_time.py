@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Startup time of `ros2conan --help`, measured with -X importtime. Exits with an error when the
+startup exceeds --budget-ms or when a heavy module is imported just to print the help.
+
+    python benchmarks/bench_import_time.py --budget-ms 100
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Only the subcommands needing them may import these
+HEAVY_MODULES = ["jinja2", "yaml", "xml.etree.ElementTree", "sqlite3", "concurrent.futures", "subprocess"]
+
+def importtime(cmd: list[str]) -> dict[str, int]:
+    """Cumulative import time in microseconds of every top level import made by cmd"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])))
+    result = subprocess.run([sys.executable, "-X", "importtime"] + cmd, capture_output=True, text=True, env=env, check=True)
+    imports = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imports[name.strip()] = int(cumulative)
+    return imports
+
+def wall_time_ms(cmd: list[str], rounds: int) -> float:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])))
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + cmd, stdout=subprocess.DEVNULL, env=env, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=100.0, help="maximum median wall time of ros2conan --help")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--top", type=int, default=10, help="number of slowest imports to list")
+    args = parser.parse_args()
+
+    cmd = ["-m", "ros2conan", "--help"]
+    imports = importtime(cmd)
+    baseline_ms = wall_time_ms(["-c", "pass"], args.rounds)
+    help_ms = wall_time_ms(cmd, args.rounds)
+
+    print(f"python startup      {baseline_ms:>8.1f} ms")
+    print(f"ros2conan --help    {help_ms:>8.1f} ms (budget {args.budget_ms:.0f} ms)")
+    print("slowest imports:")
+    for name, cumulative in sorted(imports.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {cumulative / 1000:>8.2f} ms  {name}")
+
+    errors = [f"{module} is imported by ros2conan --help" for module in HEAVY_MODULES if module in imports]
+    if help_ms > args.budget_ms:
+        errors.append(f"ros2conan --help took {help_ms:.1f} ms, more than {args.budget_ms:.0f} ms")
+    for error in errors:
+        print(f"error: {error}", file=sys.stderr)
+    sys.exit(1 if errors else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Parsing time of rosdep resolve output for a synthetic output of --keys keys, comparing the
+previous character-by-character lexer with the current regex lexer.
+
+    python benchmarks/bench_rosdep_parse.py --keys 10000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ros2conan.system_dependencies import ros_dep_resolve_lexer, parser
+
+def synthetic_rosdep_output(keys: int) -> str:
+    blocks = []
+    for i in range(keys):
+        libs = " ".join(f"libkey{i}-{j}-dev" for j in range(1 + i % 3))
+        blocks.append(f"#ROSDEP[key{i}]\n#apt\n{libs}\n")
+    return "".join(blocks)
+
+def legacy_lexer(ros_dep_resolve_output: str):
+    seperators = ["\n", " ", "[", "]"]
+
+    current_token = ''
+    for char in ros_dep_resolve_output:
+        if char in seperators:
+            if current_token:
+                yield current_token
+                current_token = ''
+        else:
+            current_token += char
+
+def best_of(rounds: int, fn) -> float:
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--keys", type=int, default=10000)
+    arg_parser.add_argument("--rounds", type=int, default=5)
+    args = arg_parser.parse_args()
+
+    output = synthetic_rosdep_output(args.keys)
+    lines = output.splitlines(keepends=True)
+    assert len(parser(ros_dep_resolve_lexer(lines))) == args.keys
+
+    legacy = best_of(args.rounds, lambda: parser(legacy_lexer(output)))
+    whole = best_of(args.rounds, lambda: parser(ros_dep_resolve_lexer(output)))
+    streamed = best_of(args.rounds, lambda: parser(ros_dep_resolve_lexer(lines)))
+
+    print(f"{args.keys} keys, {len(output)} bytes")
+    print(f"{'legacy lexer':<20} {legacy * 1000:>9.2f} ms")
+    print(f"{'regex, whole output':<20} {whole * 1000:>9.2f} ms {legacy / whole:>6.1f}x")
+    print(f"{'regex, line stream':<20} {streamed * 1000:>9.2f} ms {legacy / streamed:>6.1f}x")
+
+if __name__ == "__main__":
+    main()
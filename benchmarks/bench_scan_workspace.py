@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Wall time of scan_workspace over a checked out workspace for several worker counts.
+
+    python benchmarks/bench_scan_workspace.py --repos ros2.repos --src src --workers 1 2 4 8
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ros2conan.utils import read_repos
+from ros2conan.workspace import scan_workspace
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repos", default="ros2.repos", help=".repos file listing the repositories to scan")
+    parser.add_argument("--src", default="src", help="workspace source directory the repositories are checked out in")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--executor", choices=["process", "thread"], default="process")
+    parser.add_argument("--rounds", type=int, default=3, help="best of this many rounds is reported")
+    args = parser.parse_args()
+
+    repos = read_repos(args.repos)
+    if not repos:
+        sys.exit(f"{args.repos} not found or empty")
+
+    print(f"{'workers':>8} {'packages':>9} {'best [s]':>10} {'speedup':>8}")
+    baseline = None
+    for workers in args.workers:
+        timings = []
+        for _ in range(args.rounds):
+            start = time.perf_counter()
+            index = scan_workspace(repos, args.src, workers=workers, executor=args.executor)
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        baseline = baseline or best
+        print(f"{workers:>8} {len(index):>9} {best:>10.3f} {baseline / best:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
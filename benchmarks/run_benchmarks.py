@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Times the parsing, resolution and rendering paths of ros2conan on synthetic workspaces of
+several sizes and writes the results as JSON. Given a previous results file with --compare,
+prints the change of every benchmark and exits with an error on regressions.
+
+    python benchmarks/run_benchmarks.py --scales 100 1000 10000 --output bench.json
+    python benchmarks/run_benchmarks.py --compare bench.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ros2conan.rospackageparser import package_metadata, get_dependencies, parse_package_xml, convert_to_conandeps
+from ros2conan.system_dependencies import ros_dep_resolve_lexer, parser
+from ros2conan.utils import read_repos, discover_packages
+from synthetic_workspace import generate_workspace
+from bench_rosdep_parse import synthetic_rosdep_output
+
+PACKAGES_PER_REPO = 8
+
+def best_of(rounds: int, fn) -> float:
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def run_scale(scale: int, rounds: int, tmp_root: str) -> list[dict]:
+    root = os.path.join(tmp_root, f"ws_{scale}")
+    repos_file = generate_workspace(root, max(1, scale // PACKAGES_PER_REPO), min(scale, PACKAGES_PER_REPO))
+    src = os.path.join(root, "src")
+    pkg_xmls = sorted(glob.glob(os.path.join(src, "*", "*", "*", "package.xml")))
+    parsed = [parse_package_xml(pkg_xml) for pkg_xml in pkg_xmls]
+    pkgs = {p.metadata.name: p.metadata for p in parsed}
+    rosdep_output = synthetic_rosdep_output(scale)
+
+    from ros2conan.generate_conanfiles import CMAKE_TEMPLATE, PYTHON_TEMPLATE, CONANDATA_TEMPLATE, get_template, render_package
+    from ros2conan.workspace import scan_workspace
+    repos = read_repos(repos_file)
+    index = scan_workspace(repos, src, workers=1)
+    conan_deps = {name: convert_to_conandeps(p.dependencies, pkgs) for name, p in index.items()}
+    for template_name in [CMAKE_TEMPLATE, PYTHON_TEMPLATE, CONANDATA_TEMPLATE]:
+        get_template(template_name)
+
+    benchmarks = {
+        "glob_package_xml": lambda: glob.glob(os.path.join(src, "**", "package.xml"), recursive=True),
+        "discover_packages": lambda: discover_packages(src),
+        "package_metadata": lambda: [package_metadata(pkg_xml) for pkg_xml in pkg_xmls],
+        "get_dependencies": lambda: [get_dependencies(pkg_xml) for pkg_xml in pkg_xmls],
+        "parse_package_xml": lambda: [parse_package_xml(pkg_xml) for pkg_xml in pkg_xmls],
+        "convert_to_conandeps": lambda: [convert_to_conandeps(p.dependencies, pkgs) for p in parsed],
+        "rosdep_output_parse": lambda: parser(ros_dep_resolve_lexer(rosdep_output)),
+        "render_recipes": lambda: [render_package(p, conan_deps[name], repos["repositories"][p.repo], src)
+                                   for name, p in index.items()],
+    }
+
+    results = []
+    for name, fn in benchmarks.items():
+        seconds = best_of(rounds, fn)
+        results.append({"benchmark": name, "scale": scale, "seconds": seconds, "per_item_us": seconds / scale * 1e6})
+        print(f"{name:<22} {scale:>7} {seconds * 1000:>10.2f} ms {seconds / scale * 1e6:>9.1f} us/item")
+    return results
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def compare(previous: dict, current: dict, threshold: float) -> list[str]:
+    """Prints the relative change of each benchmark, returns the ones slower than threshold"""
+    before = {(r["benchmark"], r["scale"]): r["seconds"] for r in previous["results"]}
+    regressions = []
+    for result in current["results"]:
+        key = (result["benchmark"], result["scale"])
+        if key not in before:
+            continue
+        change = result["seconds"] / before[key] - 1
+        marker = ""
+        if change > threshold:
+            marker = "  REGRESSION"
+            regressions.append(f"{key[0]} at {key[1]}: {change:+.0%}")
+        print(f"{key[0]:<22} {key[1]:>7} {before[key] * 1000:>10.2f} -> {result['seconds'] * 1000:>10.2f} ms {change:>+7.0%}{marker}")
+    return regressions
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--scales", type=int, nargs="+", default=[100, 1000, 10000], help="workspace sizes in packages")
+    arg_parser.add_argument("--rounds", type=int, default=3, help="best of this many rounds is reported")
+    arg_parser.add_argument("--output", default=None, help="JSON results file")
+    arg_parser.add_argument("--compare", default=None, help="previous JSON results file to compare against")
+    arg_parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown counted as a regression")
+    args = arg_parser.parse_args()
+
+    current = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": [],
+    }
+    with tempfile.TemporaryDirectory(prefix="ros2conan_bench_") as tmp_root:
+        for scale in args.scales:
+            current["results"] += run_scale(scale, args.rounds, tmp_root)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), current, args.threshold)
+        for regression in regressions:
+            print(f"error: {regression}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Writes a synthetic ROS 2 workspace: a .repos file and src/<repo>/<package>/package.xml for
+--repos repositories of --packages packages each.
+
+    python benchmarks/synthetic_workspace.py /tmp/synthetic_ws --repos 50 --packages 8
+"""
+
+import argparse
+import os
+import random
+
+SYSTEM_KEYS = ["eigen", "tinyxml2", "yaml-cpp", "curl", "libssl-dev", "python3-yaml", "python3-numpy",
+               "spdlog", "libsqlite3-dev", "pybind11-dev", "asio", "gtest", "benchmark", "python3-pytest"]
+
+DEPENDENCY_TAGS = ["depend", "depend", "depend", "build_depend", "build_export_depend", "exec_depend",
+                   "test_depend", "buildtool_depend"]
+
+def _package_xml(name: str, version: str, deps: list[tuple[str, str, dict[str, str]]], build_type: str) -> str:
+    dep_lines = []
+    for tag, dep, attribs in deps:
+        attrib_str = "".join(f' {key}="{val}"' for key, val in attribs.items())
+        dep_lines.append(f"  <{tag}{attrib_str}>{dep}</{tag}>")
+    return f"""<?xml version="1.0"?>
+<?xml-model href="http://download.ros.org/schema/package_format3.xsd" schematypens="http://www.w3.org/2001/XMLSchema"?>
+<package format="3">
+  <name>{name}</name>
+  <version>{version}</version>
+  <description>Synthetic package {name} used to benchmark ros2conan.</description>
+  <maintainer email="maintainer@example.com">Synthetic Maintainer</maintainer>
+  <license>Apache License 2.0</license>
+  <url type="website">https://example.com/{name}</url>
+  <buildtool_depend>ament_cmake</buildtool_depend>
+{chr(10).join(dep_lines)}
+  <export>
+    <build_type>{build_type}</build_type>
+  </export>
+</package>
+"""
+
+def generate_workspace(root: str, repos: int, packages: int, fanout: int = 6, seed: int = 0) -> str:
+    """
+    Writes the workspace under root and returns the path of its .repos file. Every package
+    depends on about fanout earlier packages, so the dependency graph is acyclic, plus a
+    couple of system keys. One in ten dependencies carries a version_gte or version_lt.
+    """
+    rng = random.Random(seed)
+    src = os.path.join(root, "src")
+    versions = {}
+    names = []
+    repos_lines = ["repositories:"]
+    for repo_id in range(repos):
+        repo = f"org/repo_{repo_id}"
+        repos_lines += [f"  {repo}:", "    type: git", f"    url: https://example.com/{repo}.git", f"    version: {rng.randint(0, 3)}.{rng.randint(0, 20)}.0"]
+        for pkg_id in range(packages):
+            name = f"pkg_{repo_id}_{pkg_id}"
+            version = f"{rng.randint(0, 3)}.{rng.randint(0, 20)}.{rng.randint(0, 9)}"
+            deps = []
+            for dep in rng.sample(names, min(fanout, len(names))):
+                attribs = {}
+                if rng.random() < 0.1:
+                    attribs = {"version_gte": versions[dep]} if rng.random() < 0.7 else {"version_lt": "99.0.0"}
+                deps.append((rng.choice(DEPENDENCY_TAGS), dep, attribs))
+            deps += [(rng.choice(DEPENDENCY_TAGS), key, {}) for key in rng.sample(SYSTEM_KEYS, 2)]
+
+            build_type = "ament_python" if rng.random() < 0.2 else "ament_cmake"
+            pkg_dir = os.path.join(src, repo, name)
+            os.makedirs(pkg_dir, exist_ok=True)
+            with open(os.path.join(pkg_dir, "package.xml"), "w") as f:
+                f.write(_package_xml(name, version, deps, build_type))
+            open(os.path.join(pkg_dir, "setup.py" if build_type == "ament_python" else "CMakeLists.txt"), "w").close()
+
+            versions[name] = version
+            names.append(name)
+
+    repos_file = os.path.join(root, "synthetic.repos")
+    with open(repos_file, "w") as f:
+        f.write("\n".join(repos_lines) + "\n")
+    return repos_file
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root")
+    parser.add_argument("--repos", type=int, default=50)
+    parser.add_argument("--packages", type=int, default=8, help="packages per repository")
+    parser.add_argument("--fanout", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(generate_workspace(args.root, args.repos, args.packages, args.fanout, args.seed))
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,9 @@ from conan.tools.scm import Git
 from conan.tools.files import copy
 from conan.tools.scm import Version
 from sys import version_info
+import glob
+import os
+import shutil
 
 class AmentPackageConan(ConanFile):
     name = "ament_package"
@@ -43,12 +46,32 @@ class AmentPackageConan(ConanFile):
     def source(self):
         url = "https://github.com/ament/ament_package.git"
         git = Git(self)
-        git.clone(url=url, target=self.source_folder)
-        git.folder = self.source_folder
-        git.checkout(commit="humble")
+        git.clone(url=url, target=self.source_folder, args=["--depth", "1", "--branch", "humble", "--single-branch"])
+
+    @property
+    def _wheel_dir(self):
+        # Wheel cache shared with the generated Python recipes. The humble branch moves, so the
+        # wheel is built once per cloned commit rather than per version
+        default = os.path.join(os.path.expanduser("~"), ".ros2conan", "wheels")
+        commit = Git(self, folder=self.source_folder).run("rev-parse HEAD")
+        return os.path.join(self.conf.get("user.ros2conan:wheel_cache", default=default), self.name, commit)
+
+    def build(self):
+        if glob.glob(os.path.join(self._wheel_dir, "*.whl")):
+            self.output.info(f"Using the cached wheel of {self.name} in {self._wheel_dir}")
+            return
+        tmp_dir = f"{self._wheel_dir}.{os.getpid()}.tmp"
+        self.run(f'pip3 wheel --no-deps --no-build-isolation --no-index --wheel-dir "{tmp_dir}" .', cwd=self.source_folder)
+        try:
+            os.replace(tmp_dir, self._wheel_dir)
+        except OSError:
+            # another build cached the wheel first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
 
     def package(self):
-        self.run(f"pip3 install --target={self.package_folder} .", cwd=self.source_folder)
+        wheels = " ".join(f'"{wheel}"' for wheel in sorted(glob.glob(os.path.join(self._wheel_dir, "*.whl"))))
+        self.run(f'pip3 install --no-index --no-deps --no-build-isolation --find-links "{self._wheel_dir}" '
+                 f'--target="{self.package_folder}" {wheels}')
         copy(self, "LICENSE", self.source_folder, self.package_folder)
 
     def package_info(self):
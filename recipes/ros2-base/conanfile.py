@@ -7,13 +7,26 @@
 #  You may use, distribute and modify this code under the BSD-3-Clause license.
 #
 
+import hashlib
 import os
+import re
+import shutil
+import subprocess
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from conan import ConanFile
-from conan.tools.files import mkdir, replace_in_file, chdir, copy, collect_libs
+from conan.errors import ConanException
+from conan.tools.files import mkdir, chdir, collect_libs
 import yaml
 
+try:
+    import fcntl
+except ImportError:
+    # No locking of the shared batch workspaces on Windows
+    fcntl = None
+
 class Ros2Base(object):
     tools_requires = "vcstool/system", "colcon/system"
 
@@ -43,29 +56,112 @@ class Ros2Base(object):
         with open(repos_path, 'w') as f:
             yaml.dump(repos_contents, f)
 
+    @property
+    def _git_mirrors_dir(self):
+        """Bare mirrors shared by all recipes, the same ones the generated recipes fetch through"""
+        default = os.path.join(os.path.expanduser("~"), ".ros2conan", "git_mirrors")
+        return self.conf.get("user.ros2conan:git_mirrors", default=default)
+
+    def _git(self, *args, cwd=None):
+        """Runs git without going through self.run, which is not meant to be called from several threads"""
+        result = subprocess.run(["git", *args], cwd=cwd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise ConanException("git {args} failed: {error}".format(args=" ".join(args), error=result.stderr.strip()))
+        return result.stdout.strip()
+
+    def _fetch_repository(self, source_dir, name, repo):
+        """
+        Checks out the version of one .repos entry in source_dir/name. The version is shallow fetched
+        into the bare mirror of the url first, a commit already in the mirror is not fetched from
+        the network again, and the checkout borrows the mirror's objects through git alternates. The
+        generated recipes fetch their sources the same way, see templates/fetch_sources.jinja.
+        """
+        if repo.get("type", "git") != "git":
+            raise ConanException("{name}: only git repositories can be imported, not {type}".format(name=name, type=repo["type"]))
+        url = repo["url"]
+        version = str(repo.get("version") or "HEAD")
+        mirror = os.path.abspath(os.path.join(self._git_mirrors_dir, hashlib.sha1(url.encode()).hexdigest() + ".git"))
+        mkdir(self, self._git_mirrors_dir)
+
+        target = os.path.join(source_dir, name)
+        if not os.path.isdir(os.path.join(target, ".git")):
+            mkdir(self, target)
+            self._git("init", cwd=target)
+        with open(os.path.join(target, ".git", "objects", "info", "alternates"), 'w') as alternates:
+            alternates.write(os.path.join(mirror, "objects") + "\n")
+
+        with open(mirror + ".lock", 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            if not os.path.isdir(mirror):
+                self._git("init", "--bare", mirror)
+            ref = "refs/ros2conan/{version}".format(version=version)
+            commit = None
+            # only commits are immutable, branches and tags are fetched again in case they moved
+            if re.fullmatch("[0-9a-f]{7,40}", version):
+                try:
+                    commit = self._git("rev-parse", "--verify", "{ref}^{{commit}}".format(ref=ref), cwd=mirror)
+                except ConanException:
+                    pass
+            if commit is None:
+                self._git("fetch", "--depth", "1", url, "+{version}:{ref}".format(version=version, ref=ref), cwd=mirror)
+                commit = self._git("rev-parse", "{ref}^{{commit}}".format(ref=ref), cwd=mirror)
+            # the objects are shared, the target only needs the shallow boundaries of the mirror
+            # for git not to look for parents that were never fetched
+            if os.path.isfile(os.path.join(mirror, "shallow")):
+                shutil.copyfile(os.path.join(mirror, "shallow"), os.path.join(target, ".git", "shallow"))
+
+        self._git("checkout", "--detach", commit, cwd=target)
+
     def _import_repositories(self, source_dir, repos_file, strict=True):
         """
-        Given a .repos file, uses vcs tool to import all the repositories into source_dir.
+        Given a .repos file, clones or updates all the repositories into source_dir, at most
+        user.ros2conan:import_workers (8 by default) at a time, through the shared git mirrors.
         If the strict flag is set to True, it raises an error if the .repos file is not found.
+        Returns the fetch time of every repository.
         """
-        if os.path.isfile(repos_file):
-            mkdir(self, source_dir)
-            self.run("vcs import {src_dir} < {repos_file}".format(src_dir=source_dir , repos_file=repos_file))
-        elif strict:
-            raise OSError("repository file not found")
+        if not os.path.isfile(repos_file):
+            if strict:
+                raise OSError("repository file not found")
+            return {}
+
+        with open(repos_file) as f:
+            repos = (yaml.safe_load(f) or {}).get("repositories", {})
+        mkdir(self, source_dir)
 
-    def _colcon_build_ws(self, colcon_args = [], cmake_args = []):
+        def fetch(name):
+            start = time.perf_counter()
+            self._fetch_repository(source_dir, name, repos[name])
+            return time.perf_counter() - start
+
+        workers = self.conf.get("user.ros2conan:import_workers", default=8, check_type=int)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            fetch_times = dict(zip(repos, pool.map(fetch, repos)))
+        for name, seconds in fetch_times.items():
+            self.output.info("{name} {version} fetched in {seconds:.1f}s".format(name=name, version=repos[name].get("version", ""), seconds=seconds))
+        return fetch_times
+
+    def _colcon_build_ws(self, colcon_args = [], cmake_args = [], build_base = "build", merge_install = True):
         """
         Builds a ROS 2 workspace using the colcon build tool. The provided CMake arguments are added
-        to some default colcon arguments.
+        to some default colcon arguments. CMake is only forced to reconfigure when build_base is
+        reused with different CMake arguments or dependencies.
         """
-        colcon_args += [
-            "--merge-install",
-            "--cmake-force-configure",
-        ]
+        colcon_args = list(colcon_args) + ["--build-base", build_base]
+        if merge_install:
+            colcon_args.append("--merge-install")
+
+        cmake_args_stamp = os.path.join(build_base, ".ros2conan_cmake_args")
+        cmake_args_string = ' '.join(cmake_args)
+        # a rebuilt dependency gets a new package folder, the cache would keep pointing at the old one
+        dependency_folders = sorted(dep.package_folder for dep in self.dependencies.values() if dep.package_folder)
+        stamp = "\n".join([cmake_args_string] + dependency_folders)
+        if os.path.isfile(cmake_args_stamp):
+            with open(cmake_args_stamp) as f:
+                if f.read() != stamp:
+                    colcon_args.append("--cmake-force-configure")
 
         if cmake_args:
-            cmake_args_string = ' '.join(cmake_args)
             colcon_args.append("--cmake-args {args}".format(args=cmake_args_string))
 
         colcon_args_string = ' '.join(colcon_args)
@@ -73,36 +169,230 @@ class Ros2Base(object):
         # Run the colcon command inside the workspace directory
         self.run("colcon build {args}".format(args=colcon_args_string))
 
+        mkdir(self, build_base)
+        with open(cmake_args_stamp, 'w') as f:
+            f.write(stamp)
+
+    @property
+    def _compiler_launcher(self):
+        """Compiler cache wrapping the compilers, e.g. ccache or sccache"""
+        return self.conf.get("user.ros2conan:compiler_launcher")
+
+    def _compiler_cache_args(self):
+        """CMake arguments selecting the compiler launcher and the CMake generator from the conf"""
+        cmake_args = []
+        launcher = self._compiler_launcher
+        if launcher:
+            cmake_args += ["-DCMAKE_{lang}_COMPILER_LAUNCHER={launcher}".format(lang=lang, launcher=launcher) for lang in ("C", "CXX")]
+        generator = self.conf.get("user.ros2conan:cmake_generator")
+        if generator:
+            cmake_args.append('-G "{generator}"'.format(generator=generator))
+        return cmake_args
+
+    def _report_compiler_cache_stats(self):
+        stats_args = {"ccache": "-s", "sccache": "--show-stats"}
+        launcher = self._compiler_launcher
+        if launcher and os.path.basename(launcher) in stats_args:
+            self.run("{launcher} {args}".format(launcher=launcher, args=stats_args[os.path.basename(launcher)]), ignore_errors=True)
+
+    @property
+    def _configuration(self):
+        """
+        Short hash of the settings, options and CMake generator, build directories are never shared
+        between configurations. CMake cannot switch the generator of an existing build directory.
+        """
+        configuration = "{settings}|{options}|{generator}".format(settings=self.settings.dumps(), options=self.options,
+                                                                 generator=self.conf.get("user.ros2conan:cmake_generator", default=""))
+        return hashlib.sha1(configuration.encode()).hexdigest()[:16]
+
+    @property
+    def _build_base(self):
+        """
+        colcon build base. With user.ros2conan:build_dirs set, build directories are kept there per
+        package and configuration and reused by later builds, so only changed sources recompile.
+        """
+        build_dirs = self.conf.get("user.ros2conan:build_dirs")
+        if not build_dirs:
+            return "build"
+        return os.path.join(build_dirs, self.name, self._configuration)
+
+    # Opt-in batched build: the packages of one repository listed here are built by a single colcon
+    # invocation in a workspace shared by their recipes, see _colcon_build_batch
+    ros2_batch_packages = []
+
+    @property
+    def _batch_ws_dir(self):
+        """
+        Workspace shared by the recipes of one repository checkout and configuration. It is keyed by
+        the checked out commits rather than the recipe version, packages of one repository may carry
+        different versions.
+        """
+        default = os.path.join(os.path.expanduser("~"), ".ros2conan", "batch_workspaces")
+        root = self.conf.get("user.ros2conan:batch_workspaces", default=default)
+        key = hashlib.sha1("{url}@{revision}|{configuration}".format(url=self.url, revision=self._source_revision(),
+                                                                    configuration=self._configuration).encode()).hexdigest()
+        return os.path.join(root, key)
+
+    def _source_revision(self):
+        """Commits of the repositories checked out in the source folder, what a batch build was built from"""
+        commits = []
+        for name in sorted(os.listdir(self.source_folder)):
+            checkout = os.path.join(self.source_folder, name)
+            if os.path.isdir(os.path.join(checkout, ".git")):
+                commits.append("{name}@{commit}".format(name=name, commit=self._git("rev-parse", "HEAD", cwd=checkout)))
+        return hashlib.sha1(" ".join(commits).encode()).hexdigest()
+
+    @property
+    def _install_prefix(self):
+        """Install prefix holding this package after the build"""
+        if self.ros2_batch_packages:
+            return os.path.join(self._batch_ws_dir, self._install_dir, self.name)
+        return os.path.join(self.build_folder, self._install_dir)
+
+    def _colcon_build_batch(self, cmake_args = []):
+        """
+        Builds all ros2_batch_packages (and this package) with one colcon invocation in the shared
+        workspace, using colcon's parallel workers. The first recipe of the group to get here does the
+        build, the others find the packages already built from the same source revision. Packages are
+        installed isolated, so every recipe packages only its own install/<name> prefix.
+        """
+        ws_dir = self._batch_ws_dir
+        mkdir(self, ws_dir)
+        packages = sorted(set(self.ros2_batch_packages) | {self.name})
+        built_stamp = os.path.join(ws_dir, ".ros2conan_built")
+        revision = self._source_revision()
+
+        with open(os.path.join(ws_dir, ".ros2conan_lock"), 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+
+            # one "<package> <source revision>" line per built package
+            built = {}
+            if os.path.isfile(built_stamp):
+                with open(built_stamp) as f:
+                    built = dict(fields for fields in map(str.split, f) if len(fields) == 2)
+            if built.get(self.name) == revision:
+                self.output.info("{name} already built in {ws}".format(name=self.name, ws=ws_dir))
+                return
+
+            workers = self.conf.get("user.ros2conan:parallel_workers", default=os.cpu_count(), check_type=int)
+            colcon_args = [
+                "--base-paths", self.source_folder,
+                "--install-base", os.path.join(ws_dir, self._install_dir),
+                "--parallel-workers", str(workers),
+                "--packages-select", *packages,
+            ]
+            self._colcon_build_ws(colcon_args, cmake_args + self._compiler_cache_args(),
+                                  build_base=os.path.join(ws_dir, "build"), merge_install=False)
+            self._report_compiler_cache_stats()
+
+            built.update(dict.fromkeys(packages, revision))
+            with open(built_stamp, 'w') as f:
+                f.write("".join("{name} {revision}\n".format(name=name, revision=built[name]) for name in sorted(built)))
+
     def _colcon_build(self, cmake_args = []):
         """
         Builds a ROS 2 workspace using the colcon build tool. The provided CMake arguments are added
         to some default colcon arguments.
         """
-        self._colcon_build_ws(['--packages-select', self.name], cmake_args)
+        if self.ros2_batch_packages:
+            self._colcon_build_batch(cmake_args)
+        else:
+            self._colcon_build_ws(['--packages-select', self.name], cmake_args + self._compiler_cache_args(),
+                                  build_base=self._build_base)
+            self._report_compiler_cache_stats()
 
-    def _replace_python_shebangs(self, python_scripts_dir, python_version):
+    def _relocated_shebang(self, filepath, python_version):
         """
-        Replaces the Python shebang that Setuptools adds to Python scripts entry points, as that one may use
-        the absolute paths and this makes the scripts non-relocatable.
+        Returns the relocatable replacement of the first line of filepath if it is one of the Python
+        shebangs Setuptools adds to Python scripts entry points, None otherwise. Those may use
+        absolute paths, which makes the scripts non-relocatable. Only the first line is read.
         Several discussions on the web, e.g. https://stackoverflow.com/questions/1530702/dont-touch-my-shebang 
         """
         virtual_env_shebang = "#!{python_executable}".format(python_executable=sys.executable)
         absolute_path_shebang = "#!/usr/bin/python3"
         generic_python_shebang = "#!/usr/bin/env {python_version}".format(python_version=python_version)
+        with open(filepath, 'rb') as f:
+            # bounded, binaries in bin/ may have no line break for a long way
+            first_line = f.readline(max(len(virtual_env_shebang), len(absolute_path_shebang)) + 2)
+        if first_line.rstrip(b"\r\n").decode(errors="replace") in (virtual_env_shebang, absolute_path_shebang):
+            return (generic_python_shebang + "\n").encode()
+        return None
+
+    def _replace_python_shebangs(self, python_scripts_dir, python_version):
+        """Replaces non-relocatable Python shebangs in place, see _relocated_shebang"""
         if os.path.isdir(python_scripts_dir):
             for filename in os.listdir(python_scripts_dir):
                 filepath = os.path.join(python_scripts_dir, filename)
-                replace_in_file(self, filepath, virtual_env_shebang, generic_python_shebang, strict=False)
-                replace_in_file(self, filepath, absolute_path_shebang, generic_python_shebang, strict=False)
+                if os.path.isfile(filepath) and self._relocated_shebang(filepath, python_version):
+                    self._write_relocated_script(filepath, filepath, python_version)
 
-    def package(self):
-        install_dir_path = os.path.join(self.build_folder, self._install_dir)
+    def _write_relocated_script(self, src, dst, python_version):
+        """Writes src to dst with its first line replaced by the relocatable shebang, returns the bytes written"""
+        tmp = dst + ".ros2conan_tmp"
+        with open(src, 'rb') as fsrc, open(tmp, 'wb') as fdst:
+            fsrc.readline()
+            fdst.write(self._relocated_shebang(src, python_version))
+            shutil.copyfileobj(fsrc, fdst)
+        shutil.copymode(src, tmp)
+        os.replace(tmp, dst)
+        return os.path.getsize(dst)
 
-        # Post build patch
-        ros2_bin_dir = os.path.join(install_dir_path, "bin")
-        self._replace_python_shebangs(ros2_bin_dir, self._python_version)
+    def _package_install_tree(self, install_dir_path, python_version):
+        """
+        Puts the install tree into the package folder. Files of an install tree in the build folder
+        are hard linked rather than copied whenever the file system allows it, only scripts in bin/
+        whose shebang must be relocated are rewritten, and for those only the first line is inspected.
+        Install trees outside the build folder, e.g. in a shared batch workspace, are copied: later
+        builds there would otherwise modify the packaged files through the links.
+        """
+        bin_dir = os.path.join(install_dir_path, "bin")
+        build_folder = os.path.realpath(self.build_folder)
+        link = os.path.commonpath([os.path.realpath(install_dir_path), build_folder]) == build_folder
+        linked_bytes = copied_bytes = 0
+        linked_files = copied_files = 0
+        for dirpath, dirnames, filenames in os.walk(install_dir_path):
+            dst_dir = os.path.join(self.package_folder, os.path.relpath(dirpath, install_dir_path))
+            os.makedirs(dst_dir, exist_ok=True)
+            for name in dirnames + filenames:
+                src = os.path.join(dirpath, name)
+                dst = os.path.join(dst_dir, name)
+                if os.path.islink(src):
+                    if os.path.lexists(dst):
+                        os.unlink(dst)
+                    os.symlink(os.readlink(src), dst)
+                    continue
+                if name in dirnames:
+                    continue
+                if os.path.lexists(dst):
+                    os.unlink(dst)
+
+                if dirpath == bin_dir and self._relocated_shebang(src, python_version):
+                    copied_bytes += self._write_relocated_script(src, dst, python_version)
+                    copied_files += 1
+                    continue
 
-        copy(self, "*", dst=self.package_folder , src=install_dir_path)
+                size = os.path.getsize(src)
+                if link:
+                    try:
+                        os.link(src, dst)
+                        linked_bytes += size
+                        linked_files += 1
+                        continue
+                    except OSError:
+                        # e.g. the build and package folders are on different file systems
+                        pass
+                shutil.copy2(src, dst)
+                copied_bytes += size
+                copied_files += 1
+
+        self.output.info("packaged {name}: {linked_files} files ({linked_bytes} bytes) linked, "
+                         "{copied_files} files ({copied_bytes} bytes) copied".format(
+                             name=self.name, linked_files=linked_files, linked_bytes=linked_bytes,
+                             copied_files=copied_files, copied_bytes=copied_bytes))
+
+    def package(self):
+        self._package_install_tree(self._install_prefix, self._python_version)
 
     def package_info(self):
         self.cpp_info.libs = collect_libs(self)
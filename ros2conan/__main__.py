@@ -0,0 +1,4 @@
+import sys
+from ros2conan.main import main
+
+sys.exit(main())
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+import time
+from ros2conan.rospackageparser import ParsedPackage, PARSER_VERSION
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS parsed_packages (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    parser_version INTEGER NOT NULL,
+    last_used INTEGER NOT NULL,
+    payload BLOB NOT NULL
+)
+"""
+
+def file_sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(64 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ParseCache:
+    """
+    Persistent cache of ParsedPackage objects stored in a SQLite database under cache_dir.
+
+    Entries are keyed by the absolute package.xml path and are valid while the file mtime and
+    size are unchanged. When those changed but the content hash did not (e.g. after a fresh
+    checkout), the entry is reused and its stat data refreshed. Entries written by another
+    PARSER_VERSION are dropped when the cache is opened. The least recently used entries are
+    evicted once the cache holds more than max_entries packages.
+    """
+    file_name = "parse_cache.sqlite"
+
+    def __init__(self, cache_dir=".ros2conan_cache", max_entries: int = 20000):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, self.file_name)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._connection = sqlite3.connect(self.path)
+        with self._connection:
+            self._connection.execute(_SCHEMA)
+            self._connection.execute("DELETE FROM parsed_packages WHERE parser_version != ?", (PARSER_VERSION,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._connection.commit()
+        self._connection.close()
+
+    def get(self, pkg_xml) -> ParsedPackage|None:
+        """Returns the cached parse of pkg_xml, or None if it is not cached or out of date"""
+        key = os.path.abspath(pkg_xml)
+        try:
+            stat = os.stat(key)
+        except OSError:
+            self.misses += 1
+            return None
+
+        row = self._connection.execute(
+            "SELECT mtime_ns, size, sha256, payload FROM parsed_packages WHERE path = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        mtime_ns, size, sha256, payload = row
+        if (mtime_ns, size) != (stat.st_mtime_ns, stat.st_size):
+            if size != stat.st_size or file_sha256(key) != sha256:
+                self.misses += 1
+                return None
+            logging.info(f"{pkg_xml} was touched but its content is unchanged")
+
+        # committed together with the next put or on close, one transaction per lookup is too slow
+        self._connection.execute(
+            "UPDATE parsed_packages SET mtime_ns = ?, size = ?, last_used = ? WHERE path = ?",
+            (stat.st_mtime_ns, stat.st_size, time.time_ns(), key))
+
+        try:
+            parsed: ParsedPackage = pickle.loads(payload)
+        except Exception as e:
+            logging.warning(f"Dropping unreadable cache entry of {pkg_xml}: {e}")
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        parsed.path = str(pkg_xml)
+        return parsed
+
+    def put_many(self, parsed_pkgs: list[ParsedPackage]):
+        """Stores parsed packages, keyed by their path, then evicts the least recently used entries"""
+        rows = []
+        for parsed in parsed_pkgs:
+            key = os.path.abspath(parsed.path)
+            stat = os.stat(key)
+            rows.append((key, stat.st_mtime_ns, stat.st_size, parsed.sha256, PARSER_VERSION,
+                         time.time_ns(), pickle.dumps(parsed, protocol=pickle.HIGHEST_PROTOCOL)))
+
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO parsed_packages VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._connection.execute(
+                """DELETE FROM parsed_packages WHERE path IN (
+                       SELECT path FROM parsed_packages ORDER BY last_used DESC LIMIT -1 OFFSET ?)""",
+                (self.max_entries,))
+
+    def put(self, parsed: ParsedPackage):
+        self.put_many([parsed])
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM parsed_packages").fetchone()[0]
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+import re
+from dataclasses import dataclass, field
+
+# Numeric release components a version is padded to, "2.0" and "2.0.0" are the same version
+RELEASE_COMPONENTS = 3
+
+def parse_version(version: str) -> tuple:
+    """
+    Sort key of a version string, numeric parts compare as numbers and sort before text parts.
+    The leading numeric parts are padded with zeros to RELEASE_COMPONENTS.
+    """
+    key = [(0, int(part), "") if part.isdigit() else (1, 0, part) for part in re.split(r"[.\-+~]", version)]
+    release = next((i for i, part in enumerate(key) if part[0]), len(key))
+    key[release:release] = [(0, 0, "")] * (RELEASE_COMPONENTS - release)
+    return tuple(key)
+
+@dataclass(frozen=True, slots=True)
+class VersionConstraint:
+    op: str
+    version: str
+
+    _compare = {
+        "<":  lambda a, b: a < b,
+        "<=": lambda a, b: a <= b,
+        "==": lambda a, b: a == b,
+        ">=": lambda a, b: a >= b,
+        ">":  lambda a, b: a > b,
+    }
+
+    def satisfied_by(self, version: str) -> bool:
+        return self._compare[self.op](parse_version(version), parse_version(self.version))
+
+    def __str__(self) -> str:
+        return f"{self.op}{self.version}"
+
+@dataclass(frozen=True, slots=True)
+class Bound:
+    version: str
+    inclusive: bool
+
+    @property
+    def key(self) -> tuple:
+        return parse_version(self.version)
+
+@dataclass(frozen=True, slots=True)
+class Interval:
+    """Versions between lower and upper, an unset bound is unbounded"""
+    lower: Bound|None = None
+    upper: Bound|None = None
+
+    @classmethod
+    def of(cls, constraints) -> 'Interval':
+        """Intersection of the VersionConstraint objects in constraints"""
+        interval = cls()
+        for constraint in constraints:
+            interval = interval.intersect(_constraint_intervals[constraint.op](constraint.version))
+        return interval
+
+    def intersect(self, other: 'Interval') -> 'Interval':
+        return Interval(_tighter(self.lower, other.lower, lower=True),
+                        _tighter(self.upper, other.upper, lower=False))
+
+    def is_empty(self) -> bool:
+        if self.lower is None or self.upper is None:
+            return False
+        if self.lower.key != self.upper.key:
+            return self.lower.key > self.upper.key
+        return not (self.lower.inclusive and self.upper.inclusive)
+
+    def is_unbounded(self) -> bool:
+        return self.lower is None and self.upper is None
+
+    def pinned(self) -> str|None:
+        """The only version of the interval if its bounds pin one"""
+        if self.lower and self.upper and self.lower.inclusive and self.upper.inclusive and self.lower.key == self.upper.key:
+            return self.lower.version
+        return None
+
+    def contains(self, version: str) -> bool:
+        key = parse_version(version)
+        if self.lower is not None and (key < self.lower.key or (key == self.lower.key and not self.lower.inclusive)):
+            return False
+        if self.upper is not None and (key > self.upper.key or (key == self.upper.key and not self.upper.inclusive)):
+            return False
+        return True
+
+    def to_conan(self) -> str:
+        """Conan reference version: a pinned version, a [range] or * when unbounded"""
+        if (pinned := self.pinned()) is not None:
+            return pinned
+        conditions = []
+        if self.lower is not None:
+            conditions.append(f"{'>=' if self.lower.inclusive else '>'}{self.lower.version}")
+        if self.upper is not None:
+            conditions.append(f"{'<=' if self.upper.inclusive else '<'}{self.upper.version}")
+        return f"[{' '.join(conditions)}]" if conditions else "*"
+
+    def __str__(self) -> str:
+        return self.to_conan()
+
+def _tighter(a: Bound|None, b: Bound|None, lower: bool) -> Bound|None:
+    if a is None or b is None:
+        return a or b
+    if a.key != b.key:
+        return max(a, b, key=lambda bound: bound.key) if lower else min(a, b, key=lambda bound: bound.key)
+    return a if not a.inclusive else b
+
+_constraint_intervals = {
+    "<":  lambda version: Interval(upper=Bound(version, False)),
+    "<=": lambda version: Interval(upper=Bound(version, True)),
+    "==": lambda version: Interval(Bound(version, True), Bound(version, True)),
+    ">=": lambda version: Interval(lower=Bound(version, True)),
+    ">":  lambda version: Interval(lower=Bound(version, False)),
+}
+
+@dataclass
+class Conflict:
+    package: str
+    version: str|None                       # workspace version of package, None when not in the workspace
+    required: list[tuple[str, Interval]]    # (dependent, interval) of every constraint on package
+    reason: str
+
+    def __str__(self) -> str:
+        requirements = ", ".join(f"{dependent} requires {interval}" for dependent, interval in self.required)
+        return f"{self.package}: {self.reason} ({requirements})"
+
+@dataclass
+class WorkspaceConstraints:
+    """
+    Version constraints placed on every package by the rest of the workspace, precomputed once
+    from a scan_workspace index: required_by[name] lists (dependent, interval) pairs and
+    intervals[name] is their intersection.
+    """
+    versions: dict[str, str] = field(default_factory=dict)
+    required_by: dict[str, list[tuple[str, Interval]]] = field(default_factory=dict)
+    intervals: dict[str, Interval] = field(default_factory=dict)
+
+    @classmethod
+    def from_index(cls, index) -> 'WorkspaceConstraints':
+        workspace = cls(versions={name: parsed.metadata.version for name, parsed in index.items()})
+        for name, parsed in index.items():
+            for dep_name, dep_desc in parsed.dependencies.items():
+                if dep_desc.constraints:
+                    interval = Interval.of(dep_desc.constraints)
+                    workspace.required_by.setdefault(dep_name, []).append((name, interval))
+                    workspace.intervals[dep_name] = workspace.intervals.get(dep_name, Interval()).intersect(interval)
+        return workspace
+
+    def conflicts(self) -> list[Conflict]:
+        """Packages whose constraints cannot be satisfied together or exclude the workspace version"""
+        conflicts = []
+        for name, interval in self.intervals.items():
+            version = self.versions.get(name)
+            if interval.is_empty():
+                conflicts.append(Conflict(name, version, self.required_by[name], "constraints exclude each other"))
+            elif version is not None and not interval.contains(version):
+                conflicts.append(Conflict(name, version, self.required_by[name], f"workspace version {version} is excluded"))
+        return conflicts
+
+    def pins(self) -> dict[str, dict[str, str]]:
+        """Pinned version of every workspace package with the range all its dependents accept"""
+        return {name: {"version": version, "range": self.intervals.get(name, Interval()).to_conan()}
+                for name, version in sorted(self.versions.items())}
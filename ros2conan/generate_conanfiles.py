@@ -1,56 +1,321 @@
 #!/usr/bin/env python3
 
+import functools
+import hashlib
+import json
+import logging
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from os import PathLike
 from pathlib import Path
-from jinja2 import Environment, FileSystemLoader
-from rospackageparser import *
-from dataclasses import asdict
-from utils import *
-from system_dependencies import *
+from jinja2 import Environment, FileSystemLoader, Template
+from ros2conan.rospackageparser import (PackageMetadata, ParsedPackage, ConanDeps, package_metadata,
+                                        get_dependencies, convert_to_conandeps)
+from dataclasses import dataclass, field, asdict
+from ros2conan.utils import read_repos, has_file, has_interfaces, has_compiled_sources, write_file_atomic
+from ros2conan.system_dependencies import RosdepResolver, load_replacements
+from ros2conan.workspace import scan_workspace
+from ros2conan.cache import ParseCache
+from ros2conan import tracing
 
-def render(metadata: PackageMetadata, deps: ConanDeps):
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+@functools.cache
+def get_template(name: str) -> Template:
+    """Compiled templates are cached, every template is only compiled once per process"""
     env = Environment(
-        loader=FileSystemLoader("templates")
+        loader=FileSystemLoader(TEMPLATES_DIR)
     )
-    template = env.get_template("cmake_conanfile.jinja")
+    return env.get_template(name)
+
+def _py_str(text: str) -> str:
+    """Collapses whitespace and escapes text to be placed inside a double quoted Python string"""
+    return " ".join(text.split()).replace("\\", "\\\\").replace('"', '\\"')
+
+def _class_name(pkg_name: str) -> str:
+    return "".join(part.capitalize() for part in pkg_name.replace("-", "_").split("_"))
+
+CMAKE_TEMPLATE = "cmake_conanfile.jinja"
+PYTHON_TEMPLATE = "python_conanfile.jinja"
+CONANDATA_TEMPLATE = "conandata_yml.jinja"
+# included by the recipe templates
+FETCH_SOURCES_TEMPLATE = "fetch_sources.jinja"
+
+def render(metadata: PackageMetadata, deps: ConanDeps, template_name: str = CMAKE_TEMPLATE, **kwargs) -> str:
+    template = get_template(template_name)
 
-    args = {'name': "Tanner Bitz" }
     all_deps = asdict(deps)
     conan_reqs = all_deps['requires']
     conan_build_requirements = all_deps['build_requirements']
-    print(template.render(requirements=conan_reqs,
-                          build_requirements=conan_build_requirements,
-                          **asdict(metadata)))
+    args = asdict(metadata)
+    args.update(
+        package_name=_class_name(metadata.name),
+        description=_py_str(metadata.description),
+        license=_py_str(", ".join(metadata.license)),
+        author=_py_str(", ".join(str(maintainer) for maintainer in metadata.maintainers)),
+        url=_py_str(metadata.url[0] if metadata.url else ""),
+    )
+    args.update(kwargs)
+    return template.render(requirements=conan_reqs,
+                           build_requirements=conan_build_requirements,
+                           **args)
+
+def render_conandata(metadata: PackageMetadata, url: str, git_ref: str, subfolder: str|None = None) -> str:
+    template = get_template(CONANDATA_TEMPLATE)
+    args = {'version': metadata.version, 'url': url, 'git_ref': git_ref}
+    if subfolder:
+        args['subfolder'] = subfolder
+    return template.render(**args)
+
+def package_subfolder(parsed: ParsedPackage, src_root: str) -> str:
+    """Directory of the package relative to the root of its repository"""
+    repo_dir = os.path.join(src_root, parsed.repo)
+    subfolder = os.path.relpath(os.path.dirname(parsed.path), repo_dir)
+    return "" if subfolder == "." else Path(subfolder).as_posix()
+
+# Build types built by CMake, packages declaring none are ament_cmake packages
+CMAKE_BUILD_TYPES = ("ament_cmake", "cmake")
+
+def recipe_template(parsed: ParsedPackage) -> str:
+    """
+    Conanfile template of the package: the declared build_type decides, packages declaring none
+    get the Python template when they have a setup.py or setup.cfg and no CMakeLists.txt
+    """
+    if parsed.build_types:
+        return PYTHON_TEMPLATE if "ament_python" in parsed.build_types else CMAKE_TEMPLATE
+    if parsed.type_meta is not None and parsed.type_meta.is_python_pkg() and not parsed.type_meta.is_cpp_pkg():
+        return PYTHON_TEMPLATE
+    return CMAKE_TEMPLATE
+
+def configuration_independence(parsed: ParsedPackage) -> str|None:
+    """
+    Why a single binary of the package serves every settings and options combination, or None.
+    Python packages are installed from a pure Python wheel, architecture_independent and
+    metapackage packages say so in their package.xml, and CMake packages without compiled
+    sources (CMake modules and macros, data) install the same files everywhere. Interface
+    packages are never independent, rosidl generates and compiles their typesupport libraries.
+    """
+    if recipe_template(parsed) == PYTHON_TEMPLATE:
+        return "pure Python"
+    pkg_dir = os.path.dirname(parsed.path)
+    if has_interfaces(pkg_dir):
+        return None
+    if "architecture_independent" in parsed.export_flags:
+        return "architecture_independent"
+    if "metapackage" in parsed.export_flags:
+        return "metapackage"
+    build_types = parsed.build_types or ["ament_cmake"]
+    if all(build_type in CMAKE_BUILD_TYPES for build_type in build_types) and not has_compiled_sources(pkg_dir):
+        return "no compiled sources"
+    return None
+
+@dataclass
+class GeneratedRecipe:
+    name: str
+    conanfile: str
+    conandata: str
+
+def render_package(parsed: ParsedPackage, conan_deps: ConanDeps, repo: dict, src_root: str,
+                   configuration_independent: bool = False) -> GeneratedRecipe:
+    metadata = package_metadata(parsed)
+    return GeneratedRecipe(
+        name=metadata.name,
+        conanfile=render(metadata, conan_deps, recipe_template(parsed), configuration_independent=configuration_independent),
+        conandata=render_conandata(metadata,
+                                   url=repo.get("url", ""),
+                                   git_ref=str(repo.get("version", "")),
+                                   subfolder=package_subfolder(parsed, src_root)),
+    )
+
+def _render_timed(parsed: ParsedPackage, conan_deps: ConanDeps, repo: dict, src_root: str,
+                  configuration_independent: bool) -> tuple[GeneratedRecipe, float]:
+    """render_package and the seconds it took, the time of a worker process is recorded by the caller"""
+    start = time.perf_counter()
+    recipe = render_package(parsed, conan_deps, repo, src_root, configuration_independent)
+    return recipe, time.perf_counter() - start
+
+def write_recipe(recipe: GeneratedRecipe, out_dir: PathLike):
+    recipe_dir = os.path.join(out_dir, recipe.name)
+    os.makedirs(recipe_dir, exist_ok=True)
+    write_file_atomic(os.path.join(recipe_dir, "conanfile.py"), recipe.conanfile)
+    write_file_atomic(os.path.join(recipe_dir, "conandata.yml"), recipe.conandata)
+
+def recipe_exists(name: str, out_dir: PathLike) -> bool:
+    recipe_dir = os.path.join(out_dir, name)
+    return has_file(recipe_dir, "conanfile.py") and has_file(recipe_dir, "conandata.yml")
+
+@functools.cache
+def template_hash(name: str) -> str:
+    with open(os.path.join(TEMPLATES_DIR, name), 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def recipe_fingerprint(parsed: ParsedPackage, conan_deps: ConanDeps, repo: dict, src_root: str,
+                       configuration_independent: bool = False) -> str:
+    """
+    Hash of everything a generated recipe depends on: the package.xml content, the resolved
+    dependency versions, the templates used, the repository url and ref, the package subfolder
+    and whether the package is configuration independent
+    """
+    inputs = {
+        "configuration_independent": configuration_independent,
+        "package_xml": parsed.sha256,
+        "deps": asdict(conan_deps),
+        "templates": [template_hash(recipe_template(parsed)), template_hash(FETCH_SOURCES_TEMPLATE),
+                      template_hash(CONANDATA_TEMPLATE)],
+        "repo": [repo.get("url", ""), str(repo.get("version", ""))],
+        "subfolder": package_subfolder(parsed, src_root),
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+MANIFEST_FILE = ".ros2conan_manifest.json"
+
+def _read_manifest_data(out_dir: PathLike) -> dict:
+    manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+    if not os.path.isfile(manifest_path):
+        return {}
+    with open(manifest_path, 'r') as f:
+        return json.load(f)
+
+def read_manifest(out_dir: PathLike) -> dict[str, str]:
+    return _read_manifest_data(out_dir).get("fingerprints", {})
+
+def independence_key(parsed: ParsedPackage, repo: dict, src_root: str) -> str:
+    """
+    Hash of what configuration_independence is cached by: the package.xml content and the
+    repository url, ref and package subfolder the sources are checked out from
+    """
+    inputs = [parsed.sha256, repo.get("url", ""), str(repo.get("version", "")), package_subfolder(parsed, src_root)]
+    return hashlib.sha256(json.dumps(inputs).encode()).hexdigest()
+
+@dataclass
+class GenerationReport:
+    added: list[str] = field(default_factory=list)
+    changed: list[str] = field(default_factory=list)
+    unchanged: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+
+def generate_all(index: dict[str, ParsedPackage], out_dir: PathLike, repos: dict|None = None,
+                 src_root: str = "src", workers: int|None = None, force: bool = False,
+                 replacements: dict[str, str]|None = None) -> GenerationReport:
+    """
+    Renders and writes out_dir/<pkg>/conanfile.py and conandata.yml for every package of index.
+
+    repos is the dictionary returned by read_repos and provides the url and ref of the
+    repository each package was found in. Rendering is CPU bound and spread over worker
+    processes (os.cpu_count() when workers is None, serial when 1), writing over a thread pool.
+    Every file is written atomically. Prints the time spent in each phase.
+
+    The fingerprint of each recipe is kept in out_dir/.ros2conan_manifest.json together with
+    the added, changed, unchanged and removed packages of the last run. Recipes whose
+    fingerprint did not change are neither rendered nor rewritten unless force is set. The
+    configuration_independence of each package, which walks its sources, is kept there too
+    and only computed again when its independence_key changed or force is set.
+
+    replacements maps rosdep keys to the Conan references required instead, see
+    convert_to_conandeps. The keys without one are printed.
+    """
+    repos = repos or {}
+    repo_infos = repos.get("repositories", {})
+    pkgs = {name: package_metadata(parsed) for name, parsed in index.items()}
+    timings = {}
+
+    with tracing.span("generate.compile_templates") as phase:
+        for template_name in [CMAKE_TEMPLATE, PYTHON_TEMPLATE, CONANDATA_TEMPLATE]:
+            get_template(template_name)
+    timings["compile templates"] = phase.wall
+
+    with tracing.span("generate.fingerprint") as phase:
+        manifest = _read_manifest_data(out_dir)
+        old_fingerprints = manifest.get("fingerprints", {})
+        old_independence = {} if force else manifest.get("independence", {})
+        fingerprints = {}
+        conan_deps = {}
+        independence = {}
+        independent = {}
+        report = GenerationReport()
+        for name, parsed in index.items():
+            conan_deps[name] = convert_to_conandeps(get_dependencies(parsed), pkgs, replacements)
+            key = independence_key(parsed, repo_infos.get(parsed.repo, {}), src_root)
+            cached = old_independence.get(name)
+            if cached is not None and cached["key"] == key:
+                independence[name] = cached
+            else:
+                independence[name] = {"key": key, "reason": configuration_independence(parsed)}
+            independent[name] = independence[name]["reason"] is not None
+            fingerprints[name] = recipe_fingerprint(parsed, conan_deps[name], repo_infos.get(parsed.repo, {}), src_root,
+                                                    independent[name])
+            if name not in old_fingerprints:
+                report.added.append(name)
+            elif force or old_fingerprints[name] != fingerprints[name] or not recipe_exists(name, out_dir):
+                report.changed.append(name)
+            else:
+                report.unchanged.append(name)
+        report.removed = [name for name in old_fingerprints if name not in index]
+    timings["fingerprint"] = phase.wall
+
+    outdated = report.added + report.changed
+    render_args = ([index[name] for name in outdated], [conan_deps[name] for name in outdated],
+                   [repo_infos.get(index[name].repo, {}) for name in outdated], [src_root] * len(outdated),
+                   [independent[name] for name in outdated])
+    workers = workers or os.cpu_count() or 1
+    with tracing.span("generate.render", recipes=len(outdated)) as phase:
+        if workers == 1 or len(outdated) <= 1:
+            rendered = list(map(_render_timed, *render_args))
+        else:
+            # threads would serialize on the GIL, Jinja rendering is pure Python
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                chunksize = max(1, len(outdated) // (workers * 4))
+                rendered = list(pool.map(_render_timed, *render_args, chunksize=chunksize))
+    timings["render"] = phase.wall
+    for recipe, seconds in rendered:
+        tracing.sample("render_package", recipe.name, seconds)
+    recipes = [recipe for recipe, _ in rendered]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        with tracing.span("generate.write") as phase:
+            list(pool.map(lambda recipe: write_recipe(recipe, out_dir), recipes))
+            os.makedirs(out_dir, exist_ok=True)
+            write_file_atomic(os.path.join(out_dir, MANIFEST_FILE),
+                              json.dumps({"fingerprints": fingerprints, "independence": independence, **asdict(report)}, indent=2))
+        timings["write"] = phase.wall
+    tracing.count("recipes_written", len(recipes))
+
+    print(f"{out_dir}: {len(report.added)} added, {len(report.changed)} changed, "
+          f"{len(report.unchanged)} unchanged, {len(report.removed)} removed, "
+          f"{sum(independent.values())} configuration independent")
+    for phase, seconds in timings.items():
+        print(f"  {phase:<20} {seconds * 1000:>9.1f} ms")
+    print(f"  {'total':<20} {sum(timings.values()) * 1000:>9.1f} ms")
+
+    if replacements is not None:
+        unmapped = {}
+        for name, deps in conan_deps.items():
+            for key in deps.unmapped:
+                unmapped.setdefault(key, []).append(name)
+        mapped = {key for parsed in index.values() for key in get_dependencies(parsed) if key in replacements and key not in index}
+        print(f"{len(mapped)} system dependencies mapped to Conan packages, {len(unmapped)} unmapped")
+        for key, names in sorted(unmapped.items(), key=lambda item: (-len(item[1]), item[0])):
+            print(f"  {key:<32} required by {len(names)}: {' '.join(sorted(names)[:5])}{' ...' if len(names) > 5 else ''}")
+
+    return report
 
 
 if __name__ == "__main__":
     repos = read_repos("ros2.repos")
 
+    with ParseCache() as cache:
+        index = scan_workspace(repos, "src", cache=cache)
+    logging.info(f"parse cache hits: {cache.hits} misses: {cache.misses}")
+
     all_deps = []
-    pkg_metadatas = {}
-    for repo in repos["repositories"]:
-        pkg_xmls = get_repo_packages("src", repo)
-        for pkg_xml in pkg_xmls:
-            pkg_xml_path = os.path.join("src", repo, pkg_xml)
-            pkg_meta = package_metadata(pkg_xml_path)
-            pkg_metadatas[pkg_meta.name] = pkg_meta
-
-            deps = get_dependencies(pkg_xml_path)
-            for dep, _ in deps.items():
-                all_deps.append(dep)
+    for name, parsed in index.items():
+        for dep, _ in get_dependencies(parsed).items():
+            all_deps.append(dep)
 
     skipped_keys = ["python-catkin-pkg"]
     all_deps = list(set(all_deps))
     deps = [x for x in all_deps if x not in skipped_keys]
-    get_system_libraries(deps)
-
-    src_dir = Path(__file__).parent.absolute() / "src"
-    package_xmls = get_package_xml_files(src_dir)
-
-    package = Path(src_dir, package_xmls[20])
-    metadata, deps = parse_package(package)
-
-    conan_deps = convert_to_conandeps(deps, pkg_metadatas)
-    # render(metadata, conan_deps)
-
+    RosdepResolver("system_libraries.json").resolve(sorted(deps))
 
+    generate_all(index, "recipes", repos, "src", replacements=load_replacements("system_libraries.json"))
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+from typing import Iterable
+from ros2conan.rospackageparser import ParsedPackage, get_dependencies, package_metadata, convert_to_conandeps
+
+REQUIRES = "requires"
+TOOL_REQUIRES = "tool_requires"
+TEST_REQUIRES = "test_requires"
+EDGE_KINDS = (REQUIRES, TOOL_REQUIRES, TEST_REQUIRES)
+
+# test_requires are left out of build ordering by default, ROS test dependencies are often cyclic
+BUILD_EDGE_KINDS = (REQUIRES, TOOL_REQUIRES)
+
+class CycleError(Exception):
+    def __init__(self, cycle: list[str]):
+        self.cycle = cycle
+        super().__init__(f"dependency cycle: {' -> '.join(cycle)}")
+
+class DependencyGraph:
+    """
+    Dependency graph of the workspace packages. Nodes are integer ids indexing names, and
+    adjacency[kind][node] lists the ids node depends on through that kind of requirement,
+    reverse_adjacency[kind][node] the ids depending on node, kept up to date by add_edge.
+    Only dependencies on packages of the graph are edges, system dependencies are left out.
+    """
+
+    def __init__(self, names: Iterable[str]):
+        self.names: list[str] = list(names)
+        self.ids: dict[str, int] = {name: node for node, name in enumerate(self.names)}
+        self.adjacency: dict[str, list[list[int]]] = {kind: [[] for _ in self.names] for kind in EDGE_KINDS}
+        self.reverse_adjacency: dict[str, list[list[int]]] = {kind: [[] for _ in self.names] for kind in EDGE_KINDS}
+
+    @classmethod
+    def from_index(cls, index: dict[str, ParsedPackage]) -> 'DependencyGraph':
+        graph = cls(index)
+        pkgs = {name: package_metadata(parsed) for name, parsed in index.items()}
+        for name, parsed in index.items():
+            conan_deps = convert_to_conandeps(get_dependencies(parsed), pkgs)
+            kind_reqs = {
+                REQUIRES: conan_deps.requires,
+                TOOL_REQUIRES: conan_deps.build_requirements.tool_requires,
+                TEST_REQUIRES: conan_deps.build_requirements.test_requires,
+            }
+            for kind, reqs in kind_reqs.items():
+                for req in reqs:
+                    if req.name in graph.ids and req.name != name:
+                        graph.add_edge(kind, name, req.name)
+        return graph
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add_edge(self, kind: str, name: str, dependency: str):
+        deps = self.adjacency[kind][self.ids[name]]
+        dep_id = self.ids[dependency]
+        if dep_id not in deps:
+            deps.append(dep_id)
+            self.reverse_adjacency[kind][dep_id].append(self.ids[name])
+
+    def dependencies(self, node: int, kinds: Iterable[str] = BUILD_EDGE_KINDS) -> list[int]:
+        """Ids node depends on through any of kinds, without duplicates"""
+        deps = []
+        for kind in kinds:
+            deps.extend(dep for dep in self.adjacency[kind][node] if dep not in deps)
+        return deps
+
+    def dependents(self, node: int, kinds: Iterable[str] = BUILD_EDGE_KINDS) -> list[int]:
+        """Ids depending on node through any of kinds, without duplicates"""
+        dependents = []
+        for kind in kinds:
+            dependents.extend(dependent for dependent in self.reverse_adjacency[kind][node] if dependent not in dependents)
+        return dependents
+
+    def reverse_closure(self, names: Iterable[str], kinds: Iterable[str] = BUILD_EDGE_KINDS) -> set[int]:
+        """Ids of the named packages and of every package depending on them, directly or transitively"""
+        kinds = tuple(kinds)
+        closure = {self.ids[name] for name in names}
+        pending = list(closure)
+        while pending:
+            for dependent in self.dependents(pending.pop(), kinds):
+                if dependent not in closure:
+                    closure.add(dependent)
+                    pending.append(dependent)
+        return closure
+
+    def rebuild_order(self, names: Iterable[str], kinds: Iterable[str] = BUILD_EDGE_KINDS) -> list[str]:
+        """
+        The packages to rebuild when the named packages change, i.e. their reverse closure, each
+        after all of its dependencies. Only the closure is visited. Raises CycleError
+        """
+        kinds = tuple(kinds)
+        closure = self.reverse_closure(names, kinds)
+        remaining = {node: sum(dep in closure for dep in self.dependencies(node, kinds)) for node in closure}
+        order = sorted(node for node, count in remaining.items() if count == 0)
+        for node in order:
+            for dependent in self.dependents(node, kinds):
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    order.append(dependent)
+
+        if len(order) != len(closure):
+            raise CycleError(self.find_cycle(kinds) or [])
+        return [self.names[node] for node in order]
+
+    def _merged_adjacency(self, kinds: Iterable[str]) -> list[list[int]]:
+        kinds = tuple(kinds)
+        return [self.dependencies(node, kinds) for node in range(len(self))]
+
+    def find_cycle(self, kinds: Iterable[str] = BUILD_EDGE_KINDS) -> list[str]|None:
+        """Returns one dependency cycle as [a, b, ..., a], or None if the graph is acyclic"""
+        adjacency = self._merged_adjacency(kinds)
+        unvisited, in_progress, done = 0, 1, 2
+        state = [unvisited] * len(self)
+        for root in range(len(self)):
+            if state[root] != unvisited:
+                continue
+            path = [root]
+            stack = [iter(adjacency[root])]
+            state[root] = in_progress
+            while stack:
+                dep = next(stack[-1], None)
+                if dep is None:
+                    state[path.pop()] = done
+                    stack.pop()
+                elif state[dep] == in_progress:
+                    cycle = path[path.index(dep):] + [dep]
+                    return [self.names[node] for node in cycle]
+                elif state[dep] == unvisited:
+                    state[dep] = in_progress
+                    path.append(dep)
+                    stack.append(iter(adjacency[dep]))
+        return None
+
+    def _levels(self, kinds: Iterable[str]) -> tuple[list[int], list[int]]:
+        """Kahn's algorithm, returns nodes in topological order and the wave each node is in"""
+        adjacency = self._merged_adjacency(kinds)
+        dependents = [[] for _ in range(len(self))]
+        remaining = [len(deps) for deps in adjacency]
+        for node, deps in enumerate(adjacency):
+            for dep in deps:
+                dependents[dep].append(node)
+
+        level = [0] * len(self)
+        order = [node for node in range(len(self)) if remaining[node] == 0]
+        for node in order:
+            for dependent in dependents[node]:
+                level[dependent] = max(level[dependent], level[node] + 1)
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    order.append(dependent)
+
+        if len(order) != len(self):
+            raise CycleError(self.find_cycle(kinds) or [])
+        return order, level
+
+    def topological_order(self, kinds: Iterable[str] = BUILD_EDGE_KINDS) -> list[str]:
+        """Package names, every package after all of its dependencies. Raises CycleError"""
+        order, _ = self._levels(kinds)
+        return [self.names[node] for node in order]
+
+    def waves(self, kinds: Iterable[str] = BUILD_EDGE_KINDS) -> list[list[str]]:
+        """
+        Groups packages in build waves, the packages of one wave only depend on packages of
+        earlier waves and can be built in parallel. Raises CycleError
+        """
+        order, level = self._levels(kinds)
+        waves = [[] for _ in range(max(level, default=-1) + 1)]
+        for node in order:
+            waves[level[node]].append(self.names[node])
+        return waves
+
+    def critical_path(self, kinds: Iterable[str] = BUILD_EDGE_KINDS, weights: dict[str, float]|None = None) -> tuple[float, list[str]]:
+        """
+        Longest dependency chain, from the package that is built first to the one built last.
+        Each package costs weights[name] (e.g. its build time), or 1 when not given.
+        Returns the chain's total cost and its packages. Raises CycleError
+        """
+        order, _ = self._levels(kinds)
+        adjacency = self._merged_adjacency(kinds)
+        cost = [1.0 if weights is None else weights.get(name, 1.0) for name in self.names]
+
+        finish = [0.0] * len(self)
+        previous = [-1] * len(self)
+        for node in order:
+            finish[node] = cost[node]
+            for dep in adjacency[node]:
+                if finish[dep] + cost[node] > finish[node]:
+                    finish[node] = finish[dep] + cost[node]
+                    previous[node] = dep
+
+        if not order:
+            return 0.0, []
+        node = max(range(len(self)), key=lambda node: finish[node])
+        length = finish[node]
+        path = []
+        while node != -1:
+            path.append(self.names[node])
+            node = previous[node]
+        return length, path[::-1]
+
+if __name__ == "__main__":
+    from ros2conan.utils import read_repos
+    from ros2conan.workspace import scan_workspace
+
+    graph = DependencyGraph.from_index(scan_workspace(read_repos("ros2.repos"), "src"))
+    edges = {kind: sum(len(deps) for deps in graph.adjacency[kind]) for kind in EDGE_KINDS}
+    print(f"{len(graph)} packages, edges: {edges}")
+    waves = graph.waves()
+    print(f"{len(waves)} build waves, widest has {max((len(wave) for wave in waves), default=0)} packages")
+    length, path = graph.critical_path()
+    print(f"critical path ({length:.0f}): {' -> '.join(path)}")
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+from dataclasses import dataclass, field
+from ros2conan.graph import DependencyGraph
+from ros2conan.rospackageparser import ParsedPackage
+
+# Fields of a .repos entry that change what is checked out
+REPO_FIELDS = ("type", "url", "version")
+
+@dataclass
+class RepoChange:
+    repo: str
+    old: dict|None          # .repos entry before, None for added repositories
+    new: dict|None          # .repos entry after, None for removed repositories
+
+    def __str__(self) -> str:
+        if self.old is None:
+            return f"+ {self.repo} {self.new.get('version', '')}"
+        if self.new is None:
+            return f"- {self.repo} {self.old.get('version', '')}"
+        changes = [f"{key} {self.old.get(key)} -> {self.new.get(key)}" for key in REPO_FIELDS
+                   if self.old.get(key) != self.new.get(key)]
+        return f"~ {self.repo} {', '.join(changes)}"
+
+def diff_repos(old_repos: dict, new_repos: dict) -> list[RepoChange]:
+    """Repositories added, removed or checked out at another url or version between two read_repos dictionaries"""
+    old = old_repos.get("repositories", {})
+    new = new_repos.get("repositories", {})
+    changes = [RepoChange(repo, old.get(repo), entry) for repo, entry in new.items()
+               if repo not in old or any(old[repo].get(key) != entry.get(key) for key in REPO_FIELDS)]
+    changes += [RepoChange(repo, entry, None) for repo, entry in old.items() if repo not in new]
+    return changes
+
+@dataclass
+class Impact:
+    changes: list[RepoChange] = field(default_factory=list)
+    changed_packages: list[str] = field(default_factory=list)   # packages of added or changed repositories
+    rebuild: list[str] = field(default_factory=list)            # changed packages and their dependents, in build order
+
+def rebuild_impact(old_repos: dict, new_repos: dict, index: dict[str, ParsedPackage],
+                   graph: DependencyGraph|None = None) -> Impact:
+    """
+    The packages to rebuild when moving from old_repos to new_repos. index is the workspace
+    scanned at new_repos. Removed repositories have no packages left in index, packages still
+    depending on them show up as missing dependencies when generating instead.
+    """
+    graph = graph or DependencyGraph.from_index(index)
+    changes = diff_repos(old_repos, new_repos)
+    changed_repos = {change.repo for change in changes if change.new is not None}
+    changed_packages = [name for name, parsed in index.items() if parsed.repo in changed_repos]
+    return Impact(changes, changed_packages, graph.rebuild_order(changed_packages))
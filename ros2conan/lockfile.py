@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+import subprocess
+from dataclasses import dataclass, field
+from os import PathLike
+from ros2conan.constraints import parse_version
+from ros2conan.graph import DependencyGraph, TOOL_REQUIRES
+from ros2conan.rospackageparser import (ParsedPackage, get_dependencies, REQUIRES_KINDS, TEST_REQUIRES_KINDS,
+                                        TOOL_REQUIRES_KINDS)
+from ros2conan.scheduler import conan_command
+from ros2conan.utils import write_file_atomic
+
+# Lockfile format version written by Conan 2
+CONAN_LOCKFILE_VERSION = "0.5"
+
+def _sorted_refs(refs) -> list[str]:
+    # Conan keeps lockfile references sorted newest first, i.e. in descending order
+    return sorted(set(refs), reverse=True)
+
+def used_replacements(index: dict[str, ParsedPackage], replacements: dict[str, str]) -> dict[str, str]:
+    """The replacements of the rosdep keys the workspace packages depend on, see convert_to_conandeps"""
+    return {key: replacements[key] for parsed in index.values() for key in get_dependencies(parsed)
+            if key in replacements and key not in index}
+
+def resolve_replacements(replacements: dict[str, str], conan_cmd: list[str]|None = None,
+                         remote: str|None = None) -> dict[str, str]:
+    """
+    {rosdep key: Conan reference} with the version ranges of replacements resolved by conan list
+    to the latest matching version, e.g. eigen/[>=3.4.0] to eigen/3.4.0. Keys whose range
+    matches nothing are left out. conan_cmd defaults to $ROS2CONAN_CONAN or conan.
+    """
+    conan_cmd = conan_cmd or conan_command()
+    latest = {}
+    for ref in set(replacements.values()):
+        if "[" not in ref:
+            latest[ref] = ref
+            continue
+        result = subprocess.run(conan_cmd + ["list", ref, "--format=json"] + (["--remote", remote] if remote else []),
+                                capture_output=True, text=True)
+        found = []
+        if result.returncode == 0:
+            for listing in json.loads(result.stdout).values():
+                found += [candidate for candidate in listing if candidate != "error"]
+        if found:
+            latest[ref] = max(found, key=lambda candidate: parse_version(candidate.partition("/")[2]))
+        else:
+            logging.warning(f"no Conan package matches {ref}: {result.stderr.strip()}")
+    return {key: latest[ref] for key, ref in replacements.items() if ref in latest}
+
+def conan_lockfile(index: dict[str, ParsedPackage], replacement_refs: dict[str, str]|None = None) -> dict:
+    """
+    Conan 2 lockfile locking every workspace package to its package.xml version, i.e. the
+    version of its generated recipe for the ref pinned in ros2.repos. Packages used as
+    tool_requires are locked in the build context too. replacement_refs, {rosdep key: Conan
+    reference} as given by resolve_replacements, locks the references replacing the system
+    dependencies of the workspace packages.
+    """
+    graph = DependencyGraph.from_index(index)
+    tool_required = {graph.names[dep] for deps in graph.adjacency[TOOL_REQUIRES] for dep in deps}
+    refs = {name: f"{name}/{parsed.metadata.version}" for name, parsed in index.items()}
+    requires = set(refs.values())
+    build_requires = {refs[name] for name in tool_required}
+    for parsed in index.values():
+        for key, dep in get_dependencies(parsed).items():
+            ref = (replacement_refs or {}).get(key)
+            if ref is None or key in index:
+                continue
+            if dep.kinds & (REQUIRES_KINDS | TEST_REQUIRES_KINDS):
+                requires.add(ref)
+            if dep.kinds & TOOL_REQUIRES_KINDS:
+                build_requires.add(ref)
+    return {
+        "version": CONAN_LOCKFILE_VERSION,
+        "requires": _sorted_refs(requires),
+        "build_requires": _sorted_refs(build_requires),
+        "python_requires": [],
+        "config_requires": [],
+    }
+
+def write_conan_lockfile(path: PathLike, index: dict[str, ParsedPackage], replacement_refs: dict[str, str]|None = None):
+    write_file_atomic(path, json.dumps(conan_lockfile(index, replacement_refs), indent=4))
+
+@dataclass
+class LockfileDiff:
+    missing: list[str] = field(default_factory=list)        # workspace packages not locked
+    extra: list[str] = field(default_factory=list)          # locked references not in the workspace
+    changed: list[tuple[str, str, str]] = field(default_factory=list)  # (name, locked, workspace version)
+
+    def is_empty(self) -> bool:
+        return not (self.missing or self.extra or self.changed)
+
+def diff_lockfile(lockfile: dict, index: dict[str, ParsedPackage], replacement_refs: dict[str, str]|None = None) -> LockfileDiff:
+    """Differences between the requires of lockfile and the conan_lockfile of index and replacement_refs"""
+    expected = conan_lockfile(index, replacement_refs)
+    diff = LockfileDiff()
+    for section in ("requires", "build_requires"):
+        locked = {}
+        for ref in lockfile.get(section, []):
+            name, _, version = ref.split("#")[0].partition("/")
+            locked[name] = version
+        wanted = dict(ref.partition("/")[::2] for ref in expected[section])
+        diff.missing += [f"{name}/{version}" for name, version in wanted.items() if name not in locked]
+        diff.extra += [f"{name}/{version}" for name, version in locked.items() if name not in wanted]
+        diff.changed += [(name, locked[name], version) for name, version in wanted.items()
+                         if name in locked and locked[name] != version]
+    diff.missing, diff.extra, diff.changed = sorted(set(diff.missing)), sorted(set(diff.extra)), sorted(set(diff.changed))
+    return diff
@@ -1,3 +1,273 @@
+import argparse
+import sys
 
-def main():
-    print("hello world!")
+# Subcommands import what they need when they run, so that e.g. `ros2conan --help` does not pay
+# for jinja2, yaml or the XML parser
+
+def _scan(args):
+    from ros2conan.cache import ParseCache
+    from ros2conan.rospackageparser import parse_stats
+    from ros2conan.utils import read_repos
+    from ros2conan.workspace import scan_workspace
+
+    repos = read_repos(args.repos)
+    if not repos:
+        sys.exit(f"{args.repos} not found or empty")
+
+    if args.no_cache:
+        index = scan_workspace(repos, args.src, workers=args.workers)
+    else:
+        with ParseCache(args.cache_dir) as cache:
+            index = scan_workspace(repos, args.src, workers=args.workers, cache=cache)
+        print(f"parse cache hits: {cache.hits} misses: {cache.misses}", file=sys.stderr)
+    print(f"{len(index)} packages, parsed {parse_stats.files_parsed} package.xml files "
+          f"({parse_stats.bytes_read} bytes) in {parse_stats.parse_time:.3f}s", file=sys.stderr)
+    return repos, index
+
+def scan(args) -> int:
+    _, index = _scan(args)
+    for name, parsed in index.items():
+        print(f"{name} {parsed.metadata.version} {parsed.path}")
+    return 0
+
+def resolve(args) -> int:
+    from ros2conan.rospackageparser import get_dependencies
+    from ros2conan.system_dependencies import RosdepResolver
+
+    _, index = _scan(args)
+    keys = {dep for parsed in index.values() for dep in get_dependencies(parsed) if dep not in index}
+    resolver = RosdepResolver(args.system_libraries,
+                              rosdep_cmd=args.rosdep.split() if args.rosdep else None,
+                              chunk_size=args.chunk_size,
+                              refresh=args.refresh)
+    resolver.resolve(sorted(keys - set(args.skip)))
+    print(f"rosdep cache hits: {resolver.hits} misses: {resolver.misses} unresolved: {len(resolver.unresolved)}")
+    return 1 if resolver.unresolved else 0
+
+def generate(args) -> int:
+    import os
+    from ros2conan.generate_conanfiles import generate_all
+    from ros2conan.system_dependencies import load_replacements
+
+    repos, index = _scan(args)
+    replacements = None
+    if args.system_libraries and os.path.isfile(args.system_libraries):
+        replacements = load_replacements(args.system_libraries)
+    generate_all(index, args.out, repos, args.src, force=args.force, replacements=replacements)
+    return 0
+
+def graph(args) -> int:
+    from ros2conan.graph import DependencyGraph, CycleError
+
+    _, index = _scan(args)
+    dependency_graph = DependencyGraph.from_index(index)
+    try:
+        waves = dependency_graph.waves()
+        length, path = dependency_graph.critical_path()
+    except CycleError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    if args.order:
+        print("\n".join(name for wave in waves for name in wave))
+        return 0
+    for number, wave in enumerate(waves):
+        print(f"wave {number}: {' '.join(wave)}")
+    print(f"critical path ({length:.0f}): {' -> '.join(path)}")
+    return 0
+
+def check(args) -> int:
+    import json
+    from ros2conan.constraints import WorkspaceConstraints
+    from ros2conan.utils import write_file_atomic
+
+    _, index = _scan(args)
+    workspace = WorkspaceConstraints.from_index(index)
+    conflicts = workspace.conflicts()
+    for conflict in conflicts:
+        print(conflict)
+    print(f"{len(workspace.required_by)} constrained packages, {len(conflicts)} conflicts", file=sys.stderr)
+    if args.pins:
+        write_file_atomic(args.pins, json.dumps(workspace.pins(), indent=2))
+    return 1 if conflicts else 0
+
+def lock(args) -> int:
+    import json
+    import os
+    from ros2conan.lockfile import diff_lockfile, resolve_replacements, used_replacements, write_conan_lockfile
+    from ros2conan.system_dependencies import load_replacements
+
+    _, index = _scan(args)
+    replacements = {}
+    if args.system_libraries and os.path.isfile(args.system_libraries):
+        replacements = used_replacements(index, load_replacements(args.system_libraries))
+    replacement_refs = resolve_replacements(replacements, remote=args.remote)
+    unlocked = sorted(set(replacements) - set(replacement_refs))
+    if unlocked:
+        print(f"not locked, install with --lockfile-partial: {', '.join(replacements[key] for key in unlocked)}", file=sys.stderr)
+
+    if not args.verify:
+        write_conan_lockfile(args.lockfile, index, replacement_refs)
+        print(f"locked {len(index)} packages and {len(set(replacement_refs.values()))} replacements in {args.lockfile}")
+        return 0
+
+    with open(args.lockfile) as f:
+        diff = diff_lockfile(json.load(f), index, replacement_refs)
+    for ref in diff.missing:
+        print(f"+ {ref}")
+    for ref in diff.extra:
+        print(f"- {ref}")
+    for name, locked, version in diff.changed:
+        print(f"~ {name}/{locked} -> {name}/{version}")
+    if diff.is_empty():
+        print(f"{args.lockfile} matches the workspace")
+    return 0 if diff.is_empty() else 1
+
+def impact(args) -> int:
+    from ros2conan.graph import CycleError
+    from ros2conan.impact import rebuild_impact
+    from ros2conan.utils import read_repos
+
+    old_repos = read_repos(args.old_repos)
+    if not old_repos:
+        sys.exit(f"{args.old_repos} not found or empty")
+    args.repos = args.new_repos
+    new_repos, index = _scan(args)
+
+    try:
+        result = rebuild_impact(old_repos, new_repos, index)
+    except CycleError as e:
+        print(e, file=sys.stderr)
+        return 1
+    for change in result.changes:
+        print(change, file=sys.stderr)
+    print(f"{len(result.changed_packages)} changed packages, {len(result.rebuild)} of {len(index)} to rebuild", file=sys.stderr)
+    print("\n".join(result.rebuild))
+    return 0
+
+def build(args) -> int:
+    from ros2conan.graph import CycleError
+    from ros2conan.scheduler import build_recipes
+
+    try:
+        results = build_recipes(args.recipes_dir,
+                                workers=args.jobs,
+                                keep_going=args.keep_going,
+                                conan_cmd=args.conan.split() if args.conan else None,
+                                conan_args=args.conan_args,
+                                logs_dir=args.logs_dir,
+                                packages=args.packages or None)
+    except ValueError as e:
+        sys.exit(str(e))
+    except CycleError as e:
+        print(e, file=sys.stderr)
+        return 1
+    statuses = [result.status for result in results.values()]
+    print(f"{statuses.count('success')} built, {statuses.count('failed')} failed, {statuses.count('skipped')} skipped")
+    return 0 if statuses.count('success') == len(statuses) else 1
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="ros2conan")
+    parser.add_argument("--trace", default=None, help="write the phase timings, counters and slowest packages to this JSON file")
+    parser.add_argument("--chrome-trace", default=None, help="write the timed spans in chrome://tracing format to this file")
+    parser.add_argument("--profile", default=None, help="run under cProfile and dump the stats to this file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    # impact takes its .repos files as positionals, every other workspace command takes --repos
+    checkout_parser = argparse.ArgumentParser(add_help=False)
+    checkout_parser.add_argument("--src", default="src", help="directory the repositories are checked out in")
+    checkout_parser.add_argument("-w", "--workers", type=int, default=None, help="parallel parse workers, defaults to the cpu count")
+    checkout_parser.add_argument("--cache-dir", default=".ros2conan_cache", help="package.xml parse cache directory")
+    checkout_parser.add_argument("--no-cache", action="store_true", help="parse every package.xml")
+
+    workspace_parser = argparse.ArgumentParser(add_help=False, parents=[checkout_parser])
+    workspace_parser.add_argument("--repos", default="ros2.repos", help=".repos file listing the workspace repositories")
+
+    scan_parser = subparsers.add_parser("scan", parents=[workspace_parser], help="list the workspace packages")
+    scan_parser.set_defaults(func=scan)
+
+    resolve_parser = subparsers.add_parser("resolve", parents=[workspace_parser], help="resolve system dependencies with rosdep")
+    resolve_parser.add_argument("--system-libraries", default="system_libraries.json", help="resolved keys, read and updated")
+    resolve_parser.add_argument("--rosdep", default=None, help="rosdep command to run, defaults to $ROS2CONAN_ROSDEP or rosdep")
+    resolve_parser.add_argument("--chunk-size", type=int, default=64, help="keys per rosdep invocation")
+    resolve_parser.add_argument("--refresh", action="store_true", help="pass keys cached as unresolved to rosdep again")
+    resolve_parser.add_argument("--skip", nargs="*", default=["python-catkin-pkg"], help="keys not to resolve")
+    resolve_parser.set_defaults(func=resolve)
+
+    generate_parser = subparsers.add_parser("generate", parents=[workspace_parser], help="generate the conan recipes")
+    generate_parser.add_argument("-o", "--out", default="recipes", help="recipes output directory")
+    generate_parser.add_argument("-f", "--force", action="store_true", help="regenerate unchanged recipes too")
+    generate_parser.add_argument("--system-libraries", default="system_libraries.json",
+                                 help="rosdep keys and their Conan replace_with references, empty to keep every key as a requirement")
+    generate_parser.set_defaults(func=generate)
+
+    graph_parser = subparsers.add_parser("graph", parents=[workspace_parser], help="show the build waves and critical path")
+    graph_parser.add_argument("--order", action="store_true", help="only print the packages in build order")
+    graph_parser.set_defaults(func=graph)
+
+    check_parser = subparsers.add_parser("check", parents=[workspace_parser], help="check the version constraints between workspace packages")
+    check_parser.add_argument("--pins", default=None, help="write the pinned version and accepted range of every package to this JSON file")
+    check_parser.set_defaults(func=check)
+
+    lock_parser = subparsers.add_parser("lock", parents=[workspace_parser], help="write a Conan lockfile of the workspace versions")
+    lock_parser.add_argument("lockfile", nargs="?", default="conan.lock")
+    lock_parser.add_argument("--verify", action="store_true", help="diff the lockfile against the workspace instead of writing it")
+    lock_parser.add_argument("--system-libraries", default="system_libraries.json",
+                             help="rosdep keys and their Conan replace_with references to lock, empty to lock the workspace packages only")
+    lock_parser.add_argument("--remote", default=None, help="Conan remote the version ranges of the replacements are resolved from")
+    lock_parser.set_defaults(func=lock)
+
+    impact_parser = subparsers.add_parser("impact", parents=[checkout_parser], help="list the packages to rebuild between two .repos files",
+                                          description="The workspace is scanned with the repositories of new_repos, checked out in --src")
+    impact_parser.add_argument("old_repos")
+    impact_parser.add_argument("new_repos")
+    impact_parser.set_defaults(func=impact)
+
+    build_parser = subparsers.add_parser("build", help="conan create the generated recipes in dependency order",
+                                         description="Extra conan create arguments can be given after --")
+    build_parser.add_argument("recipes_dir", nargs="?", default="recipes")
+    build_parser.add_argument("-j", "--jobs", type=int, default=None, help="concurrent conan create jobs, defaults to the cpu count")
+    build_parser.add_argument("-k", "--keep-going", action="store_true", help="keep building packages not depending on a failed one")
+    build_parser.add_argument("--conan", default=None, help="conan command to run, defaults to $ROS2CONAN_CONAN or conan")
+    build_parser.add_argument("--logs-dir", default=None, help="build logs and timings.json, defaults to <recipes_dir>/.build_logs")
+    build_parser.add_argument("--packages", nargs="+", help="only build these recipes")
+    build_parser.set_defaults(func=build)
+
+    # arguments after -- are passed through to the underlying tool, e.g. conan create
+    argv = sys.argv[1:] if argv is None else list(argv)
+    passthrough = []
+    if "--" in argv:
+        argv, passthrough = argv[:argv.index("--")], argv[argv.index("--") + 1:]
+
+    args = parser.parse_args(argv)
+    args.conan_args = passthrough
+    if not (args.trace or args.chrome_trace or args.profile):
+        return args.func(args)
+    return _run_traced(args)
+
+def _run_traced(args) -> int:
+    import cProfile
+    from ros2conan import tracing
+
+    tracing.enable()
+    profiler = cProfile.Profile() if args.profile else None
+    try:
+        with tracing.span(args.command):
+            if profiler is not None:
+                profiler.enable()
+            try:
+                return args.func(args)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+    finally:
+        print(tracing.tracer.format_summary(), file=sys.stderr)
+        if args.trace:
+            tracing.tracer.write_json(args.trace)
+        if args.chrome_trace:
+            tracing.tracer.write_chrome_trace(args.chrome_trace)
+        if profiler is not None:
+            profiler.dump_stats(args.profile)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,15 @@
 import xml.etree.ElementTree as ET
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
+from enum import IntFlag, auto
+from ros2conan.constraints import VersionConstraint, Interval, Bound
+from ros2conan.utils import PkgTypeMeta
+from ros2conan import tracing
 from typing import List, Dict
+import hashlib
 import logging
 import os
+import sys
+import time
 from os import PathLike
 from typing import Tuple
 
@@ -23,27 +30,181 @@ class PackageMetadata:
     license: list[str]
     url: list[str]
 
-def package_metadata(package) -> PackageMetadata|None:
-    """
-    Gather required tags as defined in https://ros.org/reps/rep-0149.html#required-tags
-    Required Tags
-        The required tags in a package.xml file provide package meta-data:
+class DepKind(IntFlag):
+    """Dependency tags as defined by https://ros.org/reps/rep-0149.html#dependency-tags"""
+    NONE = 0
+    BUILD_DEPEND = auto()
+    BUILD_EXPORT_DEPEND = auto()
+    BUILDTOOL_DEPEND = auto()
+    BUILDTOOL_EXPORT_DEPEND = auto()
+    EXEC_DEPEND = auto()
+    DEPEND = auto()
+    DOC_DEPEND = auto()
+    TEST_DEPEND = auto()
+    CONFLICT = auto()
+    REPLACE = auto()
+
+# package.xml tag -> DepKind
+dependency_tag_flags = {kind.name.lower(): kind for kind in DepKind if kind}
+
+# package.xml version attribute -> VersionConstraint.op
+version_attrib_ops = {
+    "version_lt": "<",
+    "version_lte": "<=",
+    "version_eq": "==",
+    "version_gte": ">=",
+    "version_gt": ">",
+}
+
+def _has_kind(kind: DepKind):
+    return property(lambda self: bool(self.kinds & kind))
+
+def _constraint_version(op: str):
+    def version(self) -> str|None:
+        for constraint in self.constraints:
+            if constraint.op == op:
+                return constraint.version
+        return None
+    return property(version)
 
-        <name>
-        <version>
-        <description>
-        <maintainer> (multiple, but at least one)
-        <license> (multiple, but at least one)
+@dataclass(frozen=True, slots=True)
+class RosDepDescription:
     """
-    tree = ET.parse(package)
-    root = tree.getroot()
+    How a package depends on one other package: the dependency tags it appears in as a DepKind
+    bitmask and its version constraints. The previous boolean and version_* attribute names are
+    available as read-only properties.
+    """
+    kinds: DepKind = DepKind.NONE
+    constraints: tuple[VersionConstraint, ...] = ()
+
+    build_depend = _has_kind(DepKind.BUILD_DEPEND)
+    build_export_depend = _has_kind(DepKind.BUILD_EXPORT_DEPEND)
+    buildtool_depend = _has_kind(DepKind.BUILDTOOL_DEPEND)
+    buildtool_export_depend = _has_kind(DepKind.BUILDTOOL_EXPORT_DEPEND)
+    exec_depend = _has_kind(DepKind.EXEC_DEPEND)
+    depend = _has_kind(DepKind.DEPEND)
+    doc_depend = _has_kind(DepKind.DOC_DEPEND)
+    test_depend = _has_kind(DepKind.TEST_DEPEND)
+    conflict = _has_kind(DepKind.CONFLICT)
+    replace = _has_kind(DepKind.REPLACE)
+    version_lt = _constraint_version("<")
+    version_lte = _constraint_version("<=")
+    version_eq = _constraint_version("==")
+    version_gte = _constraint_version(">=")
+    version_gt = _constraint_version(">")
+
+# Flag-like children of <export> as defined by https://ros.org/reps/rep-0149.html#export
+export_flag_names = [
+    "architecture_independent",
+    "deprecated",
+    "message_generator",
+    "metapackage",
+]
+
+@dataclass
+class ParsedPackage:
+    """Everything ros2conan reads from one package.xml, gathered in a single pass"""
+    path: str
+    metadata: PackageMetadata|None
+    repo: str = ""
+    type_meta: PkgTypeMeta|None = None
+    dependencies: Dict[str, RosDepDescription] = field(default_factory=dict)
+    build_types: list[str] = field(default_factory=list)
+    export_flags: Dict[str, str] = field(default_factory=dict)
+    sha256: str = ""
+    bytes_read: int = 0
+    parse_time: float = 0.0
 
-    name_element        = root.find('name')
-    version_element     = root.find('version')
-    description_element = root.find('description')
-    license_elements    = root.findall('license')
-    maintainer_elements = root.findall('maintainer')
-    url_elements        = root.findall('url')
+@dataclass
+class ParseStats:
+    files_parsed: int = 0
+    bytes_read: int = 0
+    parse_time: float = 0.0
+
+    def add(self, parsed: ParsedPackage):
+        self.files_parsed += 1
+        self.bytes_read += parsed.bytes_read
+        self.parse_time += parsed.parse_time
+        tracing.count("files_parsed")
+        tracing.count("bytes_read", parsed.bytes_read)
+        tracing.sample("parse_package_xml", parsed.path, parsed.parse_time)
+
+# Running totals for every package.xml parsed by this process
+parse_stats = ParseStats()
+
+# Bump whenever the parser or the parsed data structures change so stale cached parses are dropped
+PARSER_VERSION = 5
+
+_READ_CHUNK_SIZE = 64 * 1024
+
+def parse_package_xml(package) -> ParsedPackage:
+    """
+    Parse a package.xml in one streaming pass, collecting the required tags, the dependency
+    tags and the export section. See package_metadata, get_dependencies and get_build_types
+    for the tags that are gathered.
+    """
+    start = time.perf_counter()
+
+    name_element = None
+    version_element = None
+    description_element = None
+    license_elements = []
+    maintainer_elements = []
+    url_elements = []
+    dep_kinds: Dict[str, DepKind] = {}
+    dep_constraints: Dict[str, Dict[str, VersionConstraint]] = {}
+    build_types = []
+    export_flags = {}
+
+    def handle_end(element, depth, parent_tag):
+        nonlocal name_element, version_element, description_element
+        if depth == 1:
+            kind = dependency_tag_flags.get(element.tag)
+            if kind is not None:
+                dep_name = sys.intern(str(element.text))
+                dep_kinds[dep_name] = dep_kinds.get(dep_name, DepKind.NONE) | kind
+                for attrib, val in element.attrib.items():
+                    op = version_attrib_ops.get(attrib)
+                    if op is not None:
+                        dep_constraints.setdefault(dep_name, {})[op] = VersionConstraint(op, val)
+            elif element.tag == 'name':
+                name_element = element
+            elif element.tag == 'version':
+                version_element = element
+            elif element.tag == 'description':
+                description_element = element
+            elif element.tag == 'license':
+                license_elements.append(element)
+            elif element.tag == 'maintainer':
+                maintainer_elements.append(element)
+            elif element.tag == 'url':
+                url_elements.append(element)
+        elif depth == 2 and parent_tag == 'export':
+            if element.tag == 'build_type':
+                build_types.append(str(element.text))
+            elif element.tag in export_flag_names:
+                export_flags[element.tag] = (element.text or "").strip()
+
+    bytes_read = 0
+    digest = hashlib.sha256()
+    xml_parser = ET.XMLPullParser(events=("start", "end"))
+    open_tags = []
+    with open(package, 'rb') as f:
+        while chunk := f.read(_READ_CHUNK_SIZE):
+            bytes_read += len(chunk)
+            digest.update(chunk)
+            xml_parser.feed(chunk)
+            for event, element in xml_parser.read_events():
+                if event == "start":
+                    open_tags.append(element.tag)
+                else:
+                    open_tags.pop()
+                    depth = len(open_tags)
+                    handle_end(element, depth, open_tags[-1] if open_tags else None)
+    xml_parser.close()
+
+    dependencies = {dep_name: RosDepDescription(kinds, tuple(dep_constraints.get(dep_name, {}).values()))
+                    for dep_name, kinds in dep_kinds.items()}
 
     # required elements not found
     if (name_element        is None) or \
@@ -52,39 +213,51 @@ def package_metadata(package) -> PackageMetadata|None:
        (not license_elements)        or \
        (not maintainer_elements):
         logging.warning(f"{package} was missing a required tag")
-        return None
+        metadata = None
+    else:
+        logging.info(f"{package} had all required tags")
+        metadata = PackageMetadata(
+            name=str(name_element.text),
+            version=str(version_element.text),
+            description=str(description_element.text),
+            license= [str(license_element.text) for license_element in license_elements],
+            maintainers=[Maintainer(name=str(maintainer_el.text), email=maintainer_el.attrib['email']) for maintainer_el in maintainer_elements],
+            url=[str(url_element.text) for url_element in url_elements]
+        )
+
+    parsed = ParsedPackage(
+        path=str(package),
+        metadata=metadata,
+        dependencies=dependencies,
+        build_types=build_types,
+        export_flags=export_flags,
+        sha256=digest.hexdigest(),
+        bytes_read=bytes_read,
+        parse_time=time.perf_counter() - start,
+    )
+    parse_stats.add(parsed)
+    return parsed
 
-    logging.info(f"{package} had all required tags")
+def _as_parsed_package(package) -> ParsedPackage:
+    if isinstance(package, ParsedPackage):
+        return package
+    return parse_package_xml(package)
 
-    package_meta = PackageMetadata(
-        name=str(name_element.text),
-        version=str(version_element.text),
-        description=str(description_element.text),
-        license= [str(license_element.text) for license_element in license_elements],
-        maintainers=[Maintainer(name=str(maintainer_el.text), email=maintainer_el.attrib['email']) for maintainer_el in maintainer_elements],
-        url=[str(url_element.text) for url_element in url_elements]
-    )
- 
-    return package_meta
+def package_metadata(package) -> PackageMetadata|None:
+    """
+    Gather required tags as defined in https://ros.org/reps/rep-0149.html#required-tags
+    Required Tags
+        The required tags in a package.xml file provide package meta-data:
 
-@dataclass
-class RosDepDescription:
-    build_depend: bool = False
-    build_export_depend: bool = False
-    buildtool_depend: bool = False
-    buildtool_export_depend: bool = False
-    exec_depend: bool = False
-    depend: bool = False
-    doc_depend: bool = False
-    test_depend: bool = False
-    conflict: bool = False
-    replace: bool = False
-    version_lt: str|None = None
-    version_lte: str|None = None
-    version_eq: str|None = None
-    version_gte: str|None = None
-    version_gt: str|None = None
+        <name>
+        <version>
+        <description>
+        <maintainer> (multiple, but at least one)
+        <license> (multiple, but at least one)
 
+    package may be a path to a package.xml or an already parsed ParsedPackage.
+    """
+    return _as_parsed_package(package).metadata
 
 def get_dependencies(package) -> Dict[str, RosDepDescription]:
     """
@@ -110,61 +283,10 @@ def get_dependencies(package) -> Dict[str, RosDepDescription]:
             Attributes
         <replace> (multiple)
             Attributes
+
+    package may be a path to a package.xml or an already parsed ParsedPackage.
     """
-    tree = ET.parse(package)
-    root = tree.getroot()
-
-    dependency_tag_names = [
-        "build_depend" ,
-        "build_export_depend" ,
-        "buildtool_depend",
-        "buildtool_export_depend",
-        "exec_depend" ,
-        "depend" ,
-        "doc_depend",
-        "test_depend" ,
-        "conflict",
-        "replace",
-    ]
-
-    dependencies = {str(child.text): RosDepDescription() for child in root if child.tag in dependency_tag_names}
-
-    for child in root:
-        if child.tag in dependency_tag_names:
-            if child.tag == "build_depend":
-                dependencies[str(child.text)].build_depend = True
-            elif child.tag == "build_export_depend":
-                dependencies[str(child.text)].build_export_depend = True
-            elif child.tag == "buildtool_depend":
-                dependencies[str(child.text)].buildtool_depend = True
-            elif child.tag == "buildtool_export_depend":
-                dependencies[str(child.text)].buildtool_export_depend = True
-            elif child.tag == "exec_depend":
-                dependencies[str(child.text)].exec_depend = True
-            elif child.tag == "depend":
-                dependencies[str(child.text)].depend = True
-            elif child.tag == "doc_depend":
-                dependencies[str(child.text)].doc_depend = True
-            elif child.tag == "test_depend":
-                dependencies[str(child.text)].test_depend = True
-            elif child.tag == "conflict":
-                dependencies[str(child.text)].conflict = True
-            elif child.tag == "replace":
-                dependencies[str(child.text)].replace = True
-
-            for attrib, val in child.attrib.items():
-                if attrib in "version_lt":
-                    dependencies[str(child.text)].version_lt = val
-                elif attrib in "version_lte":
-                    dependencies[str(child.text)].version_lte = val
-                elif attrib in "version_eq":
-                    dependencies[str(child.text)].version_eq = val
-                elif attrib in "version_gte":
-                    dependencies[str(child.text)].version_gte = val
-                elif attrib in "version_gt":
-                    dependencies[str(child.text)].version_gt = val
-
-    return dependencies
+    return _as_parsed_package(package).dependencies
 
 def get_build_types(package) -> list[str]:
     """ 
@@ -176,32 +298,22 @@ def get_build_types(package) -> list[str]:
         <deprecated>
         <message_generator>
         <metapackage/>  - very very rarely used
-    """
-
-    tree = ET.parse(package)
-    root = tree.getroot()
 
-    build_types = []
-
-    export_element = root.find('export')
-    if export_element is not None:
-        build_types = [str(child.text) for child in export_element if child.tag == "build_type"]
-    
-    return build_types
+    package may be a path to a package.xml or an already parsed ParsedPackage.
+    """
+    return _as_parsed_package(package).build_types
 
 def parse_package(package: PathLike):
     if not os.path.isfile(package):
         logging.warn(f"{package} is not a file. Skipping package parse")
         return None
 
-    metadata = package_metadata(package)
-    if metadata is None:
+    parsed = parse_package_xml(package)
+    if parsed.metadata is None:
         logging.warn(f"Failed to get package metadata from {package}")
         return None
 
-    deps_map = get_dependencies(package)
-
-    return (metadata,deps_map)
+    return (parsed.metadata, parsed.dependencies)
 
 
 @dataclass
@@ -220,78 +332,84 @@ class ConanBuildRequirements:
 class ConanDeps:
     requires: list[ConanRequirement] = field(default_factory=list)
     build_requirements: ConanBuildRequirements = field(default_factory=ConanBuildRequirements)
+    unmapped: list[str] = field(default_factory=list)   # system dependencies without a Conan replacement
 
 def get_version_str(dep_name: str, dep_desc: RosDepDescription, pkgs: dict[str, PackageMetadata]) -> str:
-    version_str = ""
-    has_version_restriction = bool((dep_desc.version_lt  is not None) or
-                                   (dep_desc.version_eq  is not None) or
-                                   (dep_desc.version_gt  is not None) or 
-                                   (dep_desc.version_lte is not None) or
-                                   (dep_desc.version_gte is not None))
-    
-    if has_version_restriction:
-        if (dep_desc.version_eq is not None):
-            return str(dep_desc.version_eq)
-        if (dep_desc.version_lt is not None):
-            version_str += f"<{dep_desc.version_lt}"
-        if (dep_desc.version_lte is not None):
-            version_str += f"<={dep_desc.version_lte}"
-        if (dep_desc.version_gt is not None):
-            version_str += f">{dep_desc.version_gt}"
-        if (dep_desc.version_gte is not None):
-            version_str += f">={dep_desc.version_gte}"
-    else:
-        # impose current version of package as minimum
-        try:
-            dep_meta = pkgs[dep_name]
-            version_str += f">={dep_meta.version}"
-        except KeyError:
-            return "*"
-
-    return f"[{version_str}]"
-
-def convert_to_conandeps(pkg_ros_deps: dict[str, RosDepDescription], pkgs: dict[str, PackageMetadata]) -> ConanDeps:
+    """
+    Conan version of a dependency: pinned for version_eq, otherwise a range of the version_*
+    constraints. When those give no lower bound, the current version of a workspace package
+    that satisfies them is imposed as minimum. Packages outside the workspace without
+    constraints get *.
+    """
+    interval = Interval.of(dep_desc.constraints)
+    dep_meta = pkgs.get(dep_name)
+    if interval.lower is None and dep_meta is not None and interval.contains(dep_meta.version):
+        interval = interval.intersect(Interval(lower=Bound(dep_meta.version, True)))
+    return interval.to_conan()
+
+# DepKind masks of the Conan requirement traits and kinds a dependency maps to
+TRANSITIVE_KINDS = DepKind.BUILD_EXPORT_DEPEND | DepKind.DEPEND
+REQUIRES_KINDS = DepKind.BUILD_EXPORT_DEPEND | DepKind.BUILD_DEPEND | DepKind.EXEC_DEPEND | DepKind.DEPEND
+TOOL_REQUIRES_KINDS = DepKind.BUILDTOOL_DEPEND | DepKind.BUILDTOOL_EXPORT_DEPEND | DepKind.DOC_DEPEND
+TEST_REQUIRES_KINDS = DepKind.TEST_DEPEND
+
+def _add_requirement(reqs: list[ConanRequirement], conan_req: ConanRequirement):
+    # several rosdep keys can map to the same Conan package, e.g. libfreetype6 and libfreetype6-dev
+    for req in reqs:
+        if req.name == conan_req.name:
+            req.transitive_headers = req.transitive_headers or conan_req.transitive_headers
+            req.transitive_libs = req.transitive_libs or conan_req.transitive_libs
+            return
+    reqs.append(conan_req)
+
+def convert_to_conandeps(pkg_ros_deps: dict[str, RosDepDescription], pkgs: dict[str, PackageMetadata],
+                         replacements: dict[str, str]|None = None) -> ConanDeps:
+    """
+    Conan requirements of a package's dependencies. With replacements, the index of rosdep keys
+    to Conan references built by system_dependencies.replacement_index, dependencies outside
+    the workspace with a replacement require that reference instead, e.g. eigen/[>=3.4.0], and
+    those without one are listed in unmapped.
+    """
     conan_deps = ConanDeps()
     for dep_name, ros_deps in pkg_ros_deps.items():
-        version_str = get_version_str(dep_name, ros_deps, pkgs)
-        conan_req = ConanRequirement(dep_name, version_str)
+        replacement = None
+        if replacements is not None and dep_name not in pkgs:
+            replacement = replacements.get(dep_name)
+            if replacement is None:
+                conan_deps.unmapped.append(dep_name)
+        if replacement is not None:
+            # ROS version constraints of a system dependency are about the system package, not the Conan one
+            name, _, version_str = replacement.partition("/")
+        else:
+            name, version_str = dep_name, get_version_str(dep_name, ros_deps, pkgs)
+        conan_req = ConanRequirement(name, version_str)
         # define requirements traits
-        if ros_deps.build_export_depend or ros_deps.depend:
+        if ros_deps.kinds & TRANSITIVE_KINDS:
             conan_req.transitive_headers = True
             conan_req.transitive_libs = True
-        # place into conan requirements
-        if ( ros_deps.build_export_depend or
-             ros_deps.build_depend or
-             ros_deps.exec_depend or
-             ros_deps.depend ):
-            conan_deps.requires.append(conan_req)
-        if ( ros_deps.buildtool_depend or ros_deps.buildtool_export_depend or ros_deps.doc_depend):
-            conan_deps.build_requirements.tool_requires.append(conan_req)
-        if ( ros_deps.test_depend ):
-            conan_deps.build_requirements.test_requires.append(conan_req)
+        # place into conan requirements, a copy in each list as merging updates them in place
+        if ros_deps.kinds & REQUIRES_KINDS:
+            _add_requirement(conan_deps.requires, replace(conan_req))
+        if ros_deps.kinds & TOOL_REQUIRES_KINDS:
+            _add_requirement(conan_deps.build_requirements.tool_requires, replace(conan_req))
+        if ros_deps.kinds & TEST_REQUIRES_KINDS:
+            _add_requirement(conan_deps.build_requirements.test_requires, replace(conan_req))
     return conan_deps
 
 if __name__ == "__main__":
-    import glob
-    import os
-    packages = glob.glob('**/package.xml', root_dir=os.path.dirname(__file__), recursive=True)
-    print(f"{len(packages)} packages found")
-
-    package_has_ignore_file = lambda package_xml: glob.glob("*_IGNORE", root_dir=os.path.dirname(package_xml))
-    package_without_ignore_file = lambda package_xml: not package_has_ignore_file(package_xml)
+    from ros2conan.utils import discover_packages
 
-    non_ignored_packages = list(filter(package_without_ignore_file, packages))
+    root = os.path.dirname(__file__)
+    non_ignored_packages = [os.path.join(root, pkg.path, "package.xml") for pkg in discover_packages(root)]
     print(f"{len(non_ignored_packages)} packages without *_IGNORE")
 
-    packages_with_build_type = list(filter(lambda x: get_build_types(x), non_ignored_packages))
+    parsed_packages = [parse_package_xml(x) for x in non_ignored_packages]
+    packages_with_build_type = list(filter(lambda x: get_build_types(x), parsed_packages))
     print(f"{len(packages_with_build_type)} packages without *_IGNORE and with defined build_type")
 
-    ignored_packages = list(filter(package_has_ignore_file, packages))
-    print(f"ignored packages: {ignored_packages}")
-
     deps = get_dependencies(packages_with_build_type[-1])
     for dep, dep_info in deps.items():
         print("\n{}\n\t{}".format(dep, dep_info))
 
-
-
+    print(f"\nparsed {parse_stats.files_parsed} package.xml files, "
+          f"{parse_stats.bytes_read} bytes in {parse_stats.parse_time:.3f}s")
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+import os
+import re
+import shlex
+import subprocess
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, asdict
+from typing import Iterable
+from ros2conan.utils import write_file_atomic
+from ros2conan.graph import DependencyGraph, BUILD_EDGE_KINDS, REQUIRES, TOOL_REQUIRES, TEST_REQUIRES
+
+# Overrides the conan executable, e.g. with a fake for tests
+CONAN_ENV_VAR = "ROS2CONAN_CONAN"
+
+_NAME_RE = re.compile(r'^\s*name\s*=\s*"([^"]+)"', re.MULTILINE)
+_REQUIRE_RE = re.compile(r'self\.(requires|tool_requires|test_requires)\(\s*"([^/"]+)/')
+_REQUIRE_KINDS = {"requires": REQUIRES, "tool_requires": TOOL_REQUIRES, "test_requires": TEST_REQUIRES}
+
+def conan_command() -> list[str]:
+    return shlex.split(os.environ.get(CONAN_ENV_VAR, "conan"))
+
+@dataclass
+class Recipe:
+    name: str
+    path: str
+    requires: dict[str, list[str]]
+
+def read_recipes(recipes_dir: str) -> dict[str, Recipe]:
+    """Reads the name and requirements of every <recipes_dir>/<pkg>/conanfile.py"""
+    recipes = {}
+    for entry in sorted(os.scandir(recipes_dir), key=lambda entry: entry.name):
+        conanfile = os.path.join(entry.path, "conanfile.py")
+        if not entry.is_dir() or not os.path.isfile(conanfile):
+            continue
+        with open(conanfile, 'r') as f:
+            content = f.read()
+        name_match = _NAME_RE.search(content)
+        requires = {kind: [] for kind in _REQUIRE_KINDS.values()}
+        for method, dep_name in _REQUIRE_RE.findall(content):
+            requires[_REQUIRE_KINDS[method]].append(dep_name)
+        name = name_match.group(1) if name_match else entry.name
+        recipes[name] = Recipe(name=name, path=entry.path, requires=requires)
+    return recipes
+
+def recipes_graph(recipes: dict[str, Recipe]) -> DependencyGraph:
+    graph = DependencyGraph(recipes)
+    for recipe in recipes.values():
+        for kind, dep_names in recipe.requires.items():
+            for dep_name in dep_names:
+                if dep_name in recipes and dep_name != recipe.name:
+                    graph.add_edge(kind, recipe.name, dep_name)
+    return graph
+
+@dataclass
+class BuildResult:
+    name: str
+    status: str             # "success", "failed" or "skipped"
+    returncode: int|None = None
+    start: float = 0.0      # seconds since the start of the whole build
+    duration: float = 0.0
+    log: str = ""
+
+def _create(recipe: Recipe, conan_cmd: list[str], conan_args: list[str], logs_dir: str, t0: float) -> BuildResult:
+    log_path = os.path.join(logs_dir, f"{recipe.name}.log")
+    start = time.perf_counter()
+    with open(log_path, 'w') as log:
+        try:
+            returncode = subprocess.call(conan_cmd + ["create", recipe.path] + conan_args, stdout=log, stderr=subprocess.STDOUT)
+        except OSError as e:
+            log.write(f"failed to run {shlex.join(conan_cmd)}: {e}\n")
+            returncode = None
+    return BuildResult(name=recipe.name,
+                       status="success" if returncode == 0 else "failed",
+                       returncode=returncode,
+                       start=start - t0,
+                       duration=time.perf_counter() - start,
+                       log=log_path)
+
+def build_recipes(recipes_dir: str, workers: int|None = None, keep_going: bool = False,
+                  conan_cmd: list[str]|None = None, conan_args: Iterable[str] = (),
+                  kinds: Iterable[str] = BUILD_EDGE_KINDS, logs_dir: str|None = None,
+                  packages: Iterable[str]|None = None) -> dict[str, BuildResult]:
+    """
+    Runs conan create on the recipes of recipes_dir in dependency order, a package starts as
+    soon as all the recipes it requires were built. Up to workers builds run concurrently.
+
+    On a failure, no new builds are started unless keep_going is set, in which case only the
+    packages depending on the failed one are skipped. The output of every build goes to
+    <logs_dir>/<pkg>.log and the timings to <logs_dir>/timings.json. packages restricts the
+    build to those recipes (their in-directory requirements are expected to exist already),
+    a ValueError is raised when one of them has no recipe.
+    """
+    conan_cmd = conan_cmd or conan_command()
+    conan_args = list(conan_args)
+    workers = workers or os.cpu_count() or 1
+    kinds = tuple(kinds)
+    logs_dir = logs_dir or os.path.join(recipes_dir, ".build_logs")
+    os.makedirs(logs_dir, exist_ok=True)
+
+    recipes = read_recipes(recipes_dir)
+    if packages is not None:
+        unknown = [name for name in packages if name not in recipes]
+        if unknown:
+            raise ValueError(f"no recipe in {recipes_dir} for: {', '.join(unknown)}")
+        recipes = {name: recipes[name] for name in packages}
+    graph = recipes_graph(recipes)
+    graph.topological_order(kinds)  # raises CycleError before anything is built
+
+    dependents = [[] for _ in range(len(graph))]
+    remaining = [0] * len(graph)
+    for node in range(len(graph)):
+        for dep in graph.dependencies(node, kinds):
+            dependents[dep].append(node)
+            remaining[node] += 1
+
+    results: dict[str, BuildResult] = {}
+    t0 = time.perf_counter()
+
+    def skip_dependents(node: int):
+        stack = list(dependents[node])
+        while stack:
+            dependent = stack.pop()
+            name = graph.names[dependent]
+            if name not in results:
+                results[name] = BuildResult(name=name, status="skipped")
+                stack.extend(dependents[dependent])
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        running: dict[Future, int] = {}
+        # only as many builds as workers are submitted, so that a failure stops the queued ones
+        ready = [node for node in range(len(graph)) if remaining[node] == 0]
+        stop = False
+
+        def submit_ready():
+            while ready and len(running) < workers and not stop:
+                recipe = recipes[graph.names[ready.pop(0)]]
+                logging.info(f"building {recipe.name}")
+                running[pool.submit(_create, recipe, conan_cmd, conan_args, logs_dir, t0)] = graph.ids[recipe.name]
+
+        submit_ready()
+        while running:
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                node = running.pop(future)
+                result = future.result()
+                results[result.name] = result
+                print(f"[{len(results)}/{len(graph)}] {result.name}: {result.status} in {result.duration:.1f}s")
+                if result.status != "success":
+                    logging.error(f"conan create of {result.name} failed, see {result.log}")
+                    skip_dependents(node)
+                    stop = stop or not keep_going
+                    continue
+                for dependent in dependents[node]:
+                    remaining[dependent] -= 1
+                    if remaining[dependent] == 0 and graph.names[dependent] not in results:
+                        ready.append(dependent)
+            submit_ready()
+
+    for name in graph.names:
+        results.setdefault(name, BuildResult(name=name, status="skipped"))
+
+    write_file_atomic(os.path.join(logs_dir, "timings.json"),
+                      json.dumps([asdict(results[name]) for name in graph.names], indent=2))
+    return results
@@ -1,44 +1,54 @@
 #!/usr/bin/env python3
 
-from typing import Generator
+from typing import Generator, Iterable
+import itertools
+import logging
+import os
+import re
+import shlex
 import subprocess
-from utils import *
-from rospackageparser import *
-from dataclasses import dataclass, asdict
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from os import PathLike
+from ros2conan.utils import read_repos, write_file_atomic
+from ros2conan.rospackageparser import package_metadata, get_dependencies
+from ros2conan.workspace import scan_workspace
+from ros2conan.cache import ParseCache
+from ros2conan import tracing
+from dataclasses import dataclass, field, asdict
 import json
 
-def run_rosdep_resolve_on_deps(deps: list[str]) -> str:
-    result = subprocess.run(["rosdep", "resolve"] + deps, capture_output=True, text=True)
-    return result.stdout
+# Overrides the rosdep executable, e.g. with a stub for offline runs
+ROSDEP_ENV_VAR = "ROS2CONAN_ROSDEP"
 
-def ros_dep_resolve_lexer(ros_dep_resolve_output: str) -> Generator[str, None, None]:
-    seperators = ["\n", " ", "[", "]"]
+def rosdep_command() -> list[str]:
+    return shlex.split(os.environ.get(ROSDEP_ENV_VAR, "rosdep"))
 
-    current_token = ''
-    for char in ros_dep_resolve_output:
-        if char in seperators:
-            if current_token:
-                yield current_token
-                current_token = ''
-        else:
-            current_token += char
+# Tokens are separated by whitespace and the brackets around the key in #ROSDEP[key]
+_TOKEN_RE = re.compile(r"[^\s\[\]]+")
+
+def ros_dep_resolve_lexer(ros_dep_resolve_output: str | Iterable[str]) -> Generator[str, None, None]:
+    """Tokenizes rosdep resolve output given as a whole string or as an iterable of lines"""
+    lines = [ros_dep_resolve_output] if isinstance(ros_dep_resolve_output, str) else ros_dep_resolve_output
+    for line in lines:
+        yield from _TOKEN_RE.findall(line)
 
 @dataclass
 class SystemDep:
     name: str = ""
     system_libs: list[str] = field(default_factory=list)
     replace_with: str = ""
+    unresolved: bool = False    # negative cache entry of a key rosdep could not resolve
 
-def parser(tokens: Generator[str, None, None]) -> list[SystemDep]:
-
+def iter_system_deps(tokens: Iterable[str]) -> Generator[SystemDep, None, None]:
+    """Yields a SystemDep as soon as its #ROSDEP block is complete"""
     start_token = "#ROSDEP"
 
-    system_deps: list[SystemDep] = []
     dep = SystemDep()
     for token in tokens:
         if token == start_token:
             if dep.name and dep.system_libs:
-                system_deps.append(dep)
+                yield dep
             dep = SystemDep()
         elif token.startswith("#"):
             continue
@@ -48,38 +58,132 @@ def parser(tokens: Generator[str, None, None]) -> list[SystemDep]:
             else:
                 dep.system_libs.append(token)
 
-    return system_deps
-
-
-def get_system_libraries(deps: list[str]) -> list[SystemDep]:
-    result = subprocess.run(["rosdep", "resolve"] + deps, capture_output=True, text=True)
-
-    tokens = ros_dep_resolve_lexer(result.stdout)
-    system_libs = parser(tokens)
-    return system_libs
+    if dep.name and dep.system_libs:
+        yield dep
+
+def parser(tokens: Iterable[str]) -> list[SystemDep]:
+    return list(iter_system_deps(tokens))
+
+def stream_rosdep_resolve(deps: list[str], rosdep_cmd: list[str]|None = None) -> Generator[SystemDep, None, None]:
+    """
+    Runs rosdep resolve on deps and yields each SystemDep while rosdep is still writing its output.
+    rosdep only prints the #ROSDEP[key] header when given several keys, the output for a single
+    key is read as the block of that key.
+    """
+    rosdep_cmd = rosdep_cmd or rosdep_command()
+    # stderr goes to a file so a chatty rosdep cannot block on a full pipe while stdout is read
+    with tempfile.TemporaryFile(mode="w+") as stderr:
+        with tracing.span("rosdep_resolve", keys=len(deps)) as rosdep_span:
+            with subprocess.Popen(rosdep_cmd + ["resolve"] + deps, stdout=subprocess.PIPE, stderr=stderr, text=True) as process:
+                tokens = ros_dep_resolve_lexer(process.stdout)
+                if len(deps) == 1:
+                    # a header printed anyway only leaves an empty block, which is skipped
+                    tokens = itertools.chain(["#ROSDEP", deps[0]], tokens)
+                yield from iter_system_deps(tokens)
+        tracing.count("rosdep_invocations")
+        tracing.count("rosdep_subprocess_seconds", rosdep_span.wall)
+        if process.returncode != 0:
+            stderr.seek(0)
+            logging.warning(f"rosdep resolve exited with {process.returncode}: {stderr.read().strip()}")
+
+def get_system_libraries(deps: list[str], rosdep_cmd: list[str]|None = None) -> list[SystemDep]:
+    return list(stream_rosdep_resolve(deps, rosdep_cmd))
+
+def load_system_libraries(json_path: PathLike) -> list[SystemDep]:
+    if not os.path.isfile(json_path):
+        return []
+    with open(json_path, 'r') as json_file:
+        return [SystemDep(**dep) for dep in json.load(json_file)]
+
+def _system_dep_json(dep: SystemDep) -> dict:
+    # unresolved is only written for negative entries, keeping the resolved ones as they were
+    entry = asdict(dep)
+    if not dep.unresolved:
+        del entry["unresolved"]
+    return entry
+
+def save_system_libraries(json_path: PathLike, system_libs: Iterable[SystemDep]):
+    write_file_atomic(json_path, json.dumps([_system_dep_json(dep) for dep in system_libs], indent=2))
+
+def replacement_index(system_libs: Iterable[SystemDep]) -> dict[str, str]:
+    """{rosdep key: Conan reference replacing it}, e.g. {"eigen": "eigen/[>=3.4.0]"}, for the keys with a replace_with"""
+    return {dep.name: dep.replace_with for dep in system_libs if dep.replace_with}
+
+def load_replacements(json_path: PathLike) -> dict[str, str]:
+    return replacement_index(load_system_libraries(json_path))
+
+class RosdepResolver:
+    """
+    Resolves rosdep keys to system libraries, using a system_libraries.json file as a warm cache.
+
+    Only keys missing from the cache are passed to rosdep, split into chunks of at most
+    chunk_size keys that are resolved concurrently by up to workers rosdep processes. Newly
+    resolved keys are appended to the cache file, which is replaced atomically, and existing
+    entries (including their replace_with) are left untouched. Keys rosdep could not resolve
+    are kept in unresolved and cached as negative entries, they are only passed to rosdep again
+    when refresh is set. A run over cached keys does not start rosdep at all.
+
+    rosdep_cmd replaces the rosdep executable, it defaults to $ROS2CONAN_ROSDEP or rosdep.
+    """
+
+    def __init__(self, cache_file: PathLike = "system_libraries.json", rosdep_cmd: list[str]|None = None,
+                 chunk_size: int = 64, workers: int = 4, refresh: bool = False):
+        self.cache_file = cache_file
+        self.rosdep_cmd = rosdep_cmd or rosdep_command()
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.refresh = refresh
+        self.system_deps: dict[str, SystemDep] = {dep.name: dep for dep in load_system_libraries(cache_file)}
+        self.unresolved: set[str] = set()
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, keys: Iterable[str]) -> list[SystemDep]:
+        """Returns the SystemDep of each resolvable key, in the order of keys"""
+        keys = list(dict.fromkeys(keys))
+        misses = [key for key in keys if key not in self.system_deps
+                  or (self.refresh and self.system_deps[key].unresolved)]
+        self.hits += len(keys) - len(misses)
+        self.misses += len(misses)
+        tracing.count("rosdep_cache_hits", len(keys) - len(misses))
+        tracing.count("rosdep_cache_misses", len(misses))
+
+        if misses:
+            chunks = [misses[i:i + self.chunk_size] for i in range(0, len(misses), self.chunk_size)]
+            with tracing.span("resolve.rosdep", chunks=len(chunks)), ThreadPoolExecutor(max_workers=self.workers) as pool:
+                resolved_chunks = list(pool.map(lambda chunk: get_system_libraries(chunk, self.rosdep_cmd), chunks))
+
+            resolved = {dep.name: dep for chunk in resolved_chunks for dep in chunk
+                        if dep.name not in self.system_deps or self.system_deps[dep.name].unresolved}
+            self.system_deps.update(resolved)
+            failed = [key for key in misses if key not in resolved]
+            for key in failed:
+                self.system_deps[key] = SystemDep(name=key, unresolved=True)
+            if failed:
+                logging.warning(f"rosdep could not resolve: {', '.join(sorted(failed))}")
+            save_system_libraries(self.cache_file, self.system_deps.values())
+
+        self.unresolved.update(key for key in keys if self.system_deps[key].unresolved)
+        return [self.system_deps[key] for key in keys if not self.system_deps[key].unresolved]
 
 if __name__ == "__main__":
     repos = read_repos("ros2.repos")
 
+    with ParseCache() as cache:
+        index = scan_workspace(repos, "src", cache=cache)
+    logging.info(f"parse cache hits: {cache.hits} misses: {cache.misses}")
+
     all_deps = []
     pkg_metadatas = {}
-    for repo in repos["repositories"]:
-        pkg_xmls = get_repo_packages("src", repo)
-        for pkg_xml in pkg_xmls:
-            pkg_xml_path = os.path.join("src", repo, pkg_xml)
-            pkg_meta = package_metadata(pkg_xml_path)
-            pkg_metadatas[pkg_meta.name] = pkg_meta
-
-            deps = get_dependencies(pkg_xml_path)
-            for dep, _ in deps.items():
-                all_deps.append(dep)
+    for name, parsed in index.items():
+        pkg_metadatas[name] = package_metadata(parsed)
+        for dep, _ in get_dependencies(parsed).items():
+            all_deps.append(dep)
 
     skipped_keys = ["python-catkin-pkg"]
     all_deps = list(set(all_deps))
     deps = [x for x in all_deps if x not in skipped_keys]
-    system_libs = get_system_libraries(deps)
 
-    system_libs = [asdict(dep) for dep in system_libs]
-    with open("system_libraries.json", "w") as json_file:
-        json.dump(system_libs, json_file, indent=2)
-    
+    resolver = RosdepResolver("system_libraries.json")
+    resolver.resolve(sorted(deps))
+    print(f"rosdep cache hits: {resolver.hits} misses: {resolver.misses} unresolved: {len(resolver.unresolved)}")
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field, asdict
+from os import PathLike
+
+@dataclass
+class SpanRecord:
+    name: str
+    start: float            # seconds since the tracer was created
+    wall: float
+    cpu: float              # cpu time of the thread that ran the span
+    thread: int
+    key: str|None = None
+    args: dict = field(default_factory=dict)
+
+class Span:
+    """
+    Measures the wall and thread cpu time of a with block. The times are available as wall
+    and cpu after the block, and are recorded by the tracer only while it is enabled.
+    """
+    __slots__ = ("tracer", "name", "key", "args", "start", "cpu_start", "wall", "cpu")
+
+    def __init__(self, tracer: "Tracer", name: str, key: str|None, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.key = key
+        self.args = args
+        self.wall = 0.0
+        self.cpu = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.cpu_start = time.thread_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.wall = time.perf_counter() - self.start
+        self.cpu = time.thread_time() - self.cpu_start
+        if self.tracer.enabled:
+            self.tracer.record(SpanRecord(self.name, self.start - self.tracer.origin, self.wall, self.cpu,
+                                          threading.get_ident(), self.key, self.args))
+        return False
+
+class Tracer:
+    """
+    Collects spans, counters and per-key samples of one run. Everything is thread safe.
+    Work done in worker processes is not seen here, callers account for its results instead
+    (see ParseStats.add).
+
+    Spans given a key, e.g. a package name, also become samples of that key so the slowest
+    packages of each phase can be listed by outliers().
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.origin = time.perf_counter()
+        self.spans: list[SpanRecord] = []
+        self.counters: dict[str, float] = {}
+        self.samples: dict[str, list[tuple[float, str]]] = {}
+        self._lock = threading.Lock()
+
+    def span(self, name: str, key: str|None = None, **args) -> Span:
+        return Span(self, name, key, args)
+
+    def record(self, span: SpanRecord):
+        with self._lock:
+            self.spans.append(span)
+            if span.key is not None:
+                self.samples.setdefault(span.name, []).append((span.wall, span.key))
+
+    def count(self, name: str, value: float = 1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def sample(self, name: str, key: str, seconds: float):
+        if self.enabled:
+            with self._lock:
+                self.samples.setdefault(name, []).append((seconds, key))
+
+    def summary(self) -> dict[str, dict]:
+        """{span name: count, total wall and cpu time and longest wall time}, in order of first occurrence"""
+        phases = {}
+        for span in self.spans:
+            phase = phases.setdefault(span.name, {"count": 0, "wall": 0.0, "cpu": 0.0, "max_wall": 0.0})
+            phase["count"] += 1
+            phase["wall"] += span.wall
+            phase["cpu"] += span.cpu
+            phase["max_wall"] = max(phase["max_wall"], span.wall)
+        return phases
+
+    def outliers(self, top: int = 10) -> dict[str, list[tuple[str, float]]]:
+        """The top slowest keys of every sampled name, slowest first"""
+        return {name: [(key, seconds) for seconds, key in sorted(samples, reverse=True)[:top]]
+                for name, samples in self.samples.items()}
+
+    def to_json(self) -> dict:
+        return {
+            "phases": self.summary(),
+            "counters": self.counters,
+            "outliers": {name: [{"key": key, "seconds": seconds} for key, seconds in keys]
+                         for name, keys in self.outliers().items()},
+            "spans": [asdict(span) for span in self.spans],
+        }
+
+    def to_chrome_trace(self) -> dict:
+        """Trace event format, loadable in chrome://tracing or Perfetto"""
+        pid = os.getpid()
+        events = [{"name": span.name, "cat": "ros2conan", "ph": "X", "pid": pid, "tid": span.thread,
+                   "ts": span.start * 1e6, "dur": span.wall * 1e6,
+                   "args": {**span.args, **({"key": span.key} if span.key is not None else {}), "cpu_ms": span.cpu * 1e3}}
+                  for span in self.spans]
+        end = max((span.start + span.wall for span in self.spans), default=0.0)
+        events += [{"name": name, "ph": "C", "pid": pid, "ts": end * 1e6, "args": {name: value}}
+                   for name, value in self.counters.items()]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_json(self, path: PathLike):
+        from ros2conan.utils import write_file_atomic
+        write_file_atomic(path, json.dumps(self.to_json(), indent=2))
+
+    def write_chrome_trace(self, path: PathLike):
+        from ros2conan.utils import write_file_atomic
+        write_file_atomic(path, json.dumps(self.to_chrome_trace()))
+
+    def format_summary(self, top: int = 5) -> str:
+        lines = [f"{'phase':<32} {'count':>7} {'wall ms':>10} {'cpu ms':>10} {'max ms':>10}"]
+        for name, phase in self.summary().items():
+            lines.append(f"{name:<32} {phase['count']:>7} {phase['wall'] * 1e3:>10.1f} "
+                         f"{phase['cpu'] * 1e3:>10.1f} {phase['max_wall'] * 1e3:>10.1f}")
+        for name, value in self.counters.items():
+            lines.append(f"{name:<32} {value:>7g}")
+        for name, keys in self.outliers(top).items():
+            lines.append(f"slowest {name}: " + ", ".join(f"{key} ({seconds * 1e3:.1f} ms)" for key, seconds in keys))
+        return "\n".join(lines)
+
+# The tracer of this process, disabled until enable() is called
+tracer = Tracer()
+
+def enable():
+    tracer.enabled = True
+
+def span(name: str, key: str|None = None, **args) -> Span:
+    """with span("phase", key=package_name): ... times the block, see Span"""
+    return tracer.span(name, key, **args)
+
+def count(name: str, value: float = 1):
+    tracer.count(name, value)
+
+def sample(name: str, key: str, seconds: float):
+    """Records seconds spent on key in name, for work timed elsewhere such as in a worker process"""
+    tracer.sample(name, key, seconds)
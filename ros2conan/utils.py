@@ -1,28 +1,89 @@
 #!/usr/bin/env python3
 
-import yaml
 from os import PathLike
 import os
-import glob
+import tempfile
 from typing import Union
 from pathlib import Path
 from dataclasses import dataclass, asdict
 import json
+from ros2conan import tracing
 
 def read_repos(repos_file: str) -> dict:
+    import yaml
+
     is_file = os.path.isfile(repos_file)
     if (not is_file):
         return {}
 
-    with open(repos_file, 'r') as file:
+    with tracing.span("read_repos"), open(repos_file, 'r') as file:
         repos = yaml.safe_load(file)
         return repos
 
+def write_file_atomic(path: PathLike, content: str):
+    """Writes content to path through a temporary file in the same directory, so readers never see a partial file"""
+    dirname = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        os.chmod(tmp_path, os.stat(path).st_mode & 0o777 if os.path.exists(path) else 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
 def get_repo_packages(root_path: PathLike, repo_dir: PathLike) -> list[str]:
     return get_package_xml_files(os.path.join(root_path, repo_dir))
 
 def get_package_xml_files(root_path) -> list[str]:
-    return glob.glob("**/package.xml", root_dir=root_path, recursive=True)
+    return [os.path.join(pkg.path, "package.xml") for pkg in discover_packages(root_path)]
+
+# Marker files excluding a directory and everything below it from a workspace
+IGNORE_MARKERS = ("COLCON_IGNORE", "AMENT_IGNORE", "CATKIN_IGNORE")
+
+@dataclass
+class DiscoveredPackage:
+    path: str               # package directory relative to the discovery root
+    type_meta: 'PkgTypeMeta'
+
+def discover_packages(root_path) -> list[DiscoveredPackage]:
+    """
+    Finds the packages below root_path the way colcon does: a directory holding a package.xml is
+    a package and is not descended into, directories holding an ignore marker and hidden
+    directories (.git, ...) are pruned. Every directory is listed exactly once and the package
+    type files are recorded from that same listing.
+    """
+    with tracing.span("discover_packages", key=str(root_path)):
+        packages = _walk_packages(root_path)
+    tracing.count("packages_discovered", len(packages))
+    return sorted(packages, key=lambda pkg: pkg.path)
+
+def _walk_packages(root_path) -> list[DiscoveredPackage]:
+    packages = []
+    pending = [""]
+    listed = 0
+    while pending:
+        rel_dir = pending.pop()
+        listed += 1
+        try:
+            with os.scandir(os.path.join(root_path, rel_dir)) as it:
+                entries = list(it)
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            continue
+
+        names = {entry.name for entry in entries}
+        if any(marker in names for marker in IGNORE_MARKERS):
+            continue
+        if "package.xml" in names:
+            packages.append(DiscoveredPackage(rel_dir, PkgTypeMeta.from_names(names)))
+            continue
+
+        pending.extend(os.path.join(rel_dir, entry.name) for entry in entries
+                       if entry.is_dir() and not entry.name.startswith(".") and entry.name != "__pycache__")
+
+    tracing.count("directories_listed", listed)
+    return packages
 
 
 def has_file(dirname: PathLike, fname: Union[PathLike, str]) -> bool:
@@ -41,6 +102,33 @@ def has_setup_cfg(dirname: PathLike) -> bool:
 def has_colcon_ignore(dirname: PathLike) -> bool:
     return has_file(dirname, "COLCON_IGNORE")
 
+# Sources compiled for a specific compiler and architecture, templates such as config.h.in included
+COMPILED_SOURCE_SUFFIXES = (".c", ".cc", ".cpp", ".cxx", ".c++", ".h", ".hh", ".hpp", ".hxx", ".ipp", ".inl",
+                            ".cu", ".f", ".f90", ".rs", ".s", ".asm", ".h.in", ".hpp.in")
+
+# Directories of ROS interface definitions, rosidl generates and compiles code for them
+INTERFACE_DIRS = ("msg", "srv", "action", "idl")
+
+def has_interfaces(dirname: PathLike) -> bool:
+    return any(os.path.isdir(os.path.join(dirname, interface_dir)) for interface_dir in INTERFACE_DIRS)
+
+def has_compiled_sources(dirname: PathLike) -> bool:
+    """Whether any file below dirname, hidden directories excluded, is a compiled language source"""
+    pending = [dirname]
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as it:
+                for entry in it:
+                    if entry.name.startswith("."):
+                        continue
+                    if entry.is_dir():
+                        pending.append(entry.path)
+                    elif entry.name.lower().endswith(COMPILED_SOURCE_SUFFIXES):
+                        return True
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            continue
+    return False
+
 @dataclass
 class PkgTypeMeta:
     setup_py: bool = False
@@ -54,6 +142,16 @@ class PkgTypeMeta:
         self.cmakelists = has_cmakelists(pkg_root)
         self.ignore = has_colcon_ignore(pkg_root)
 
+    @classmethod
+    def from_names(cls, names: set[str]) -> 'PkgTypeMeta':
+        """Same as PkgTypeMeta(pkg_root), from the file names of an existing listing of pkg_root"""
+        meta = cls.__new__(cls)
+        meta.setup_py = "setup.py" in names
+        meta.setup_cfg = "setup.cfg" in names
+        meta.cmakelists = "CMakeLists.txt" in names
+        meta.ignore = "COLCON_IGNORE" in names
+        return meta
+
     def is_python_pkg(self):
         return self.setup_cfg or self.setup_py
 
@@ -62,21 +160,9 @@ class PkgTypeMeta:
 
 if __name__ == "__main__":
     dir = Path(__file__).parent
-    pkgs = get_repo_packages(dir, "src")
+    pkgs = discover_packages(os.path.join(dir, "src"))
 
-    pkg_type_metas = {}
-    for pkg in pkgs:
-        pkg_xml = os.path.join(dir, "src", pkg)
-        pkg_dir = Path(pkg_xml).parent
-
-        pkg_name = pkg_dir.name
-        pkg_type_metas[pkg_name] = PkgTypeMeta(pkg_dir)
+    pkg_type_metas = {Path(pkg.path).name: pkg.type_meta for pkg in pkgs}
 
     python_and_cpp_pkgs = { k:asdict(v) for k,v in pkg_type_metas.items() if v.is_python_pkg() and v.is_cpp_pkg() }
     print(json.dumps(python_and_cpp_pkgs, indent=2))
-
-    
-
-
-
-
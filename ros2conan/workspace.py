@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Iterable
+from ros2conan.utils import PkgTypeMeta, read_repos, discover_packages
+from ros2conan.rospackageparser import ParsedPackage, parse_package_xml, parse_stats
+from ros2conan.cache import ParseCache
+from ros2conan import tracing
+
+def _repo_names(repos: dict | Iterable[str]) -> list[str]:
+    if isinstance(repos, dict):
+        return list(repos.get("repositories", repos))
+    return list(repos)
+
+def _discover_repo(src_root: str, repo: str) -> dict[str, PkgTypeMeta]:
+    """package.xml paths of the packages of repo, mapped to their package type"""
+    return {os.path.join(src_root, repo, pkg.path, "package.xml"): pkg.type_meta
+            for pkg in discover_packages(os.path.join(src_root, repo))}
+
+def _make_executor(workers: int, executor: str) -> Executor:
+    if executor == "process":
+        return ProcessPoolExecutor(max_workers=workers)
+    if executor == "thread":
+        return ThreadPoolExecutor(max_workers=workers)
+    raise ValueError(f"unknown executor type '{executor}', expected 'process' or 'thread'")
+
+def scan_workspace(repos: dict | Iterable[str], src_root: str = "src", workers: int | None = None, executor: str = "process", cache: ParseCache | None = None) -> dict[str, ParsedPackage]:
+    """
+    Discover and parse every package.xml of the given repositories under src_root.
+
+    repos is either the dictionary returned by read_repos or an iterable of repository
+    directories relative to src_root. Discovery is fanned out per repository and parsing
+    per package over a pool of workers (os.cpu_count() when None, serial when 1). When a
+    ParseCache is given, only package.xml files missing from it or changed are parsed.
+
+    Returns {package name: ParsedPackage} ordered by repository order in repos and then by
+    package.xml path, independent of the number of workers. Packages missing required tags
+    are skipped, and duplicated package names keep the first occurrence.
+    """
+    repo_names = _repo_names(repos)
+    workers = workers or os.cpu_count() or 1
+
+    with tracing.span("scan.discover", repos=len(repo_names)):
+        if workers == 1:
+            repo_pkg_xmls = [_discover_repo(src_root, repo) for repo in repo_names]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                repo_pkg_xmls = list(pool.map(_discover_repo, [src_root] * len(repo_names), repo_names))
+    pkg_xmls = [pkg_xml for pkg_xmls in repo_pkg_xmls for pkg_xml in pkg_xmls]
+
+    cached_pkgs = {}
+    if cache is not None:
+        with tracing.span("scan.cache_lookup"):
+            for pkg_xml in pkg_xmls:
+                parsed = cache.get(pkg_xml)
+                if parsed is not None:
+                    cached_pkgs[pkg_xml] = parsed
+        tracing.count("parse_cache_hits", len(cached_pkgs))
+        tracing.count("parse_cache_misses", len(pkg_xmls) - len(cached_pkgs))
+    missing_pkg_xmls = [pkg_xml for pkg_xml in pkg_xmls if pkg_xml not in cached_pkgs]
+
+    with tracing.span("scan.parse", files=len(missing_pkg_xmls)):
+        if workers == 1 or len(missing_pkg_xmls) <= 1:
+            new_pkgs = [parse_package_xml(pkg_xml) for pkg_xml in missing_pkg_xmls]
+        else:
+            with _make_executor(workers, executor) as pool:
+                chunksize = max(1, len(missing_pkg_xmls) // (workers * 4))
+                new_pkgs = list(pool.map(parse_package_xml, missing_pkg_xmls, chunksize=chunksize))
+            if executor == "process":
+                # stats of the worker processes are lost with them, account for them here
+                for parsed in new_pkgs:
+                    parse_stats.add(parsed)
+
+    if cache is not None and new_pkgs:
+        with tracing.span("scan.cache_store"):
+            cache.put_many(new_pkgs)
+
+    new_pkgs = {parsed.path: parsed for parsed in new_pkgs}
+    parsed_pkgs = [cached_pkgs.get(pkg_xml) or new_pkgs[pkg_xml] for pkg_xml in pkg_xmls]
+
+    repo_of_pkg_xml = {pkg_xml: repo for repo, pkg_xmls in zip(repo_names, repo_pkg_xmls) for pkg_xml in pkg_xmls}
+
+    index: dict[str, ParsedPackage] = {}
+    type_metas = {pkg_xml: type_meta for pkg_xmls in repo_pkg_xmls for pkg_xml, type_meta in pkg_xmls.items()}
+    for parsed in parsed_pkgs:
+        parsed.repo = repo_of_pkg_xml[parsed.path]
+        parsed.type_meta = type_metas[parsed.path]
+        if parsed.metadata is None:
+            logging.warning(f"Skipping {parsed.path}, failed to get package metadata")
+            continue
+        name = parsed.metadata.name
+        if name in index:
+            logging.warning(f"Package {name} found in {parsed.path} and {index[name].path}, keeping the latter")
+            continue
+        index[name] = parsed
+
+    return index
+
+if __name__ == "__main__":
+    with ParseCache() as cache:
+        index = scan_workspace(read_repos("ros2.repos"), "src", cache=cache)
+    print(f"{len(index)} packages scanned, parse cache hits: {cache.hits} misses: {cache.misses}")
+    print(f"parsed {parse_stats.files_parsed} package.xml files, "
+          f"{parse_stats.bytes_read} bytes in {parse_stats.parse_time:.3f}s")
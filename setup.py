@@ -26,7 +26,7 @@ dev_requirements = load_requirements(os.path.join(root_dir, "dev_requirements.tx
 
 setup(
     name='ros2conan',
-    python_requires='>=3.6',
+    python_requires='>=3.10',
     # Versions should comply with PEP440.  For a discussion on single-sourcing
     # the version across setup.py and the project code, see
     # https://packaging.python.org/en/latest/single_source_version.html
@@ -50,6 +50,7 @@ setup(
     # You can just specify the packages manually here if your project is
     # simple. Or you can use find_packages().
     packages=find_packages(),
+    package_data={'ros2conan': ['templates/*.jinja']},
 
     # Alternatively, if you want to distribute just a my_module.py, uncomment
     # this:
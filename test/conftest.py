@@ -0,0 +1,71 @@
+import importlib.util
+import subprocess
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+RECIPES_DIR = Path(__file__).parent.parent / "recipes"
+
+def write_package_xml(package_dir, name, version="1.0.0", deps=(), export=""):
+    """Writes package_dir/package.xml, deps are (tag, name) or (tag, name, attributes) tuples"""
+    lines = ['<?xml version="1.0"?>', '<package format="3">', f"  <name>{name}</name>", f"  <version>{version}</version>",
+             f"  <description>The {name} package</description>", '  <maintainer email="dev@example.com">Dev</maintainer>',
+             "  <license>Apache-2.0</license>"]
+    for tag, dep, *attributes in deps:
+        attrs = "".join(f' {key}="{value}"' for key, value in (attributes[0] if attributes else {}).items())
+        lines.append(f"  <{tag}{attrs}>{dep}</{tag}>")
+    lines += [f"  <export>{export}</export>", "</package>"]
+    package_dir.mkdir(parents=True, exist_ok=True)
+    (package_dir / "package.xml").write_text("\n".join(lines) + "\n")
+    return package_dir / "package.xml"
+
+def git(*args, cwd=None):
+    return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+@pytest.fixture
+def upstream(tmp_path):
+    """
+    file:// url of a bare repository with a tagged commit, a newer commit on main and one
+    on the devel branch. Returns the url and {name: commit}.
+    """
+    work = tmp_path / "work"
+    git("init", "-b", "main", str(work))
+    git("config", "user.email", "test@example.com", cwd=work)
+    git("config", "user.name", "test", cwd=work)
+    commits = {}
+
+    def commit(name):
+        for package in ("pkg", "other"):
+            (work / package).mkdir(exist_ok=True)
+            (work / package / "version.txt").write_text(name)
+        git("add", "-A", cwd=work)
+        git("commit", "-m", name, cwd=work)
+        commits[name] = git("rev-parse", "HEAD", cwd=work)
+
+    commit("tagged")
+    git("tag", "v1", cwd=work)
+    commit("main")
+    git("checkout", "-b", "devel", cwd=work)
+    commit("devel")
+    git("checkout", "main", cwd=work)
+
+    bare = tmp_path / "upstream.git"
+    git("clone", "--bare", str(work), str(bare))
+    return f"file://{bare}", commits
+
+@pytest.fixture
+def ros2_base(tmp_path):
+    """An instance of the Ros2Base python_requires class, mirroring into tmp_path"""
+    pytest.importorskip("conan")
+    from conan.internal.model.conf import Conf
+
+    spec = importlib.util.spec_from_file_location("ros2_base_recipe", RECIPES_DIR / "ros2-base" / "conanfile.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    base = module.Ros2Base()
+    base.conf = Conf()
+    base.conf.define("user.ros2conan:git_mirrors", str(tmp_path / "mirrors"))
+    base.output = SimpleNamespace(info=lambda message: None)
+    base.dependencies = {}
+    return base
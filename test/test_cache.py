@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+from ros2conan import cache as cache_module
+from ros2conan.cache import ParseCache
+from ros2conan.rospackageparser import parse_package_xml
+
+from .conftest import write_package_xml
+
+@pytest.fixture
+def pkg_xml(tmp_path):
+    return write_package_xml(tmp_path / "src" / "pkg", "pkg", "1.0.0")
+
+def test_cached_parse_is_reused(tmp_path, pkg_xml):
+    with ParseCache(tmp_path / "cache") as cache:
+        assert cache.get(pkg_xml) is None
+        cache.put(parse_package_xml(pkg_xml))
+    with ParseCache(tmp_path / "cache") as cache:
+        parsed = cache.get(pkg_xml)
+
+    assert parsed.metadata.version == "1.0.0"
+    assert parsed.path == str(pkg_xml)
+    assert (cache.hits, cache.misses) == (1, 0)
+
+def test_touched_file_with_same_content_is_a_hit(tmp_path, pkg_xml):
+    with ParseCache(tmp_path / "cache") as cache:
+        cache.put(parse_package_xml(pkg_xml))
+        stat = pkg_xml.stat()
+        os.utime(pkg_xml, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert cache.get(pkg_xml) is not None
+        assert cache.hits == 1
+
+@pytest.mark.parametrize("new_version", ["2.0.0", "10.0.0"], ids=["same_size", "other_size"])
+def test_changed_file_is_a_miss(tmp_path, pkg_xml, new_version):
+    with ParseCache(tmp_path / "cache") as cache:
+        cache.put(parse_package_xml(pkg_xml))
+        stat = pkg_xml.stat()
+        pkg_xml.write_text(pkg_xml.read_text().replace("1.0.0", new_version))
+        # a same-size rewrite within the mtime granularity is only noticed by its content hash
+        os.utime(pkg_xml, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert cache.get(pkg_xml) is None
+        assert cache.misses == 1
+
+def test_entries_of_another_parser_version_are_dropped(tmp_path, pkg_xml, monkeypatch):
+    with ParseCache(tmp_path / "cache") as cache:
+        cache.put(parse_package_xml(pkg_xml))
+        assert len(cache) == 1
+
+    monkeypatch.setattr(cache_module, "PARSER_VERSION", cache_module.PARSER_VERSION + 1)
+    with ParseCache(tmp_path / "cache") as cache:
+        assert len(cache) == 0
+        assert cache.get(pkg_xml) is None
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    pkg_xmls = [write_package_xml(tmp_path / "src" / name, name) for name in ("a", "b", "c")]
+    with ParseCache(tmp_path / "cache", max_entries=2) as cache:
+        cache.put(parse_package_xml(pkg_xmls[0]))
+        cache.put(parse_package_xml(pkg_xmls[1]))
+        assert cache.get(pkg_xmls[0]) is not None
+        cache.put(parse_package_xml(pkg_xmls[2]))
+
+        assert len(cache) == 2
+        assert cache.get(pkg_xmls[1]) is None
+        assert cache.get(pkg_xmls[0]) is not None
+        assert cache.get(pkg_xmls[2]) is not None
@@ -0,0 +1,97 @@
+import pytest
+
+from ros2conan.constraints import Bound, Interval, VersionConstraint, WorkspaceConstraints, parse_version
+from ros2conan.rospackageparser import parse_package_xml
+
+from .conftest import write_package_xml
+
+@pytest.mark.parametrize("smaller, larger", [("1.9.0", "1.10.0"), ("2.0.0", "2.0.1"), ("2.0", "2.0.1"),
+                                             ("2.0.0", "2.0.0-rc1"), ("2.0.0-alpha", "2.0.0-beta"), ("2", "10")])
+def test_parse_version_order(smaller, larger):
+    assert parse_version(smaller) < parse_version(larger)
+
+@pytest.mark.parametrize("a, b", [("2.0", "2.0.0"), ("2", "2.0.0"), ("2.0-rc1", "2.0.0-rc1")])
+def test_parse_version_pads_release(a, b):
+    assert parse_version(a) == parse_version(b)
+
+def test_satisfied_by():
+    assert VersionConstraint("==", "2.0").satisfied_by("2.0.0")
+    assert VersionConstraint(">=", "2.0.0").satisfied_by("2.0")
+    assert not VersionConstraint("<", "2.0.0").satisfied_by("2.0")
+    assert str(VersionConstraint(">=", "1.2")) == ">=1.2"
+
+def interval(*constraints):
+    return Interval.of(VersionConstraint(op, version) for op, version in constraints)
+
+def test_intersect():
+    merged = interval((">=", "1.0.0"), ("<", "3.0.0")).intersect(interval((">", "2.0.0"), ("<=", "4.0.0")))
+    assert merged == Interval(Bound("2.0.0", False), Bound("3.0.0", False))
+    # of equal bounds the exclusive one is tighter
+    assert interval((">=", "1.0.0"), (">", "1.0.0")).lower == Bound("1.0.0", False)
+    assert interval(("<", "2.0.0"), ("<=", "2.0.0")).upper == Bound("2.0.0", False)
+    assert Interval().intersect(Interval()).is_unbounded()
+
+@pytest.mark.parametrize("constraints, empty", [
+    ([(">=", "2.0.0"), ("<", "1.0.0")], True),
+    ([(">=", "1.0.0"), ("<", "1.0.0")], True),
+    ([(">", "1.0.0"), ("<=", "1.0")], True),
+    ([(">=", "1.0.0"), ("<=", "1.0")], False),
+    ([("==", "1.0.0"), ("==", "1.0.1")], True),
+    ([("==", "1.0"), ("==", "1.0.0")], False),
+    ([(">=", "1.0.0")], False),
+    ([], False),
+])
+def test_is_empty(constraints, empty):
+    assert interval(*constraints).is_empty() == empty
+
+@pytest.mark.parametrize("constraints, conan", [
+    ([], "*"),
+    ([(">=", "1.0.0")], "[>=1.0.0]"),
+    ([(">", "1.0.0"), ("<=", "2.0.0")], "[>1.0.0 <=2.0.0]"),
+    ([("<", "2.0.0")], "[<2.0.0]"),
+    ([("==", "1.2.3")], "1.2.3"),
+    ([(">=", "1.2.3"), ("<=", "1.2.3")], "1.2.3"),
+])
+def test_to_conan(constraints, conan):
+    assert interval(*constraints).to_conan() == conan
+
+def test_contains():
+    assert interval((">=", "1.0"), ("<", "2.0")).contains("1.0.0")
+    assert not interval((">=", "1.0"), ("<", "2.0")).contains("2.0.0")
+    assert interval(("==", "2.0")).contains("2.0.0")
+
+@pytest.fixture
+def make_index(tmp_path):
+    def make_index(packages):
+        """packages maps name to (version, deps)"""
+        return {name: parse_package_xml(write_package_xml(tmp_path / name, name, version, deps))
+                for name, (version, deps) in packages.items()}
+    return make_index
+
+def test_no_conflicts(make_index):
+    index = make_index({
+        "a": ("1.2.0", []),
+        "b": ("1.0.0", [("depend", "a", {"version_gte": "1.0", "version_lt": "2.0"})]),
+        "c": ("1.0.0", [("depend", "a", {"version_eq": "1.2"}), ("depend", "b")]),
+    })
+    workspace = WorkspaceConstraints.from_index(index)
+
+    assert workspace.conflicts() == []
+    assert workspace.required_by["a"] == [("b", interval((">=", "1.0"), ("<", "2.0"))), ("c", interval(("==", "1.2")))]
+    assert workspace.pins() == {"a": {"version": "1.2.0", "range": "1.2"},
+                                "b": {"version": "1.0.0", "range": "*"},
+                                "c": {"version": "1.0.0", "range": "*"}}
+
+def test_conflicts(make_index):
+    index = make_index({
+        "a": ("3.0.0", []),
+        "b": ("1.0.0", [("depend", "a", {"version_lt": "2.0.0"}), ("depend", "eigen", {"version_gte": "3.4"})]),
+        "c": ("1.0.0", [("depend", "a", {"version_gte": "1.0.0"}), ("depend", "eigen", {"version_lt": "3.3"})]),
+    })
+    conflicts = {conflict.package: conflict for conflict in WorkspaceConstraints.from_index(index).conflicts()}
+
+    assert sorted(conflicts) == ["a", "eigen"]
+    assert conflicts["a"].version == "3.0.0"
+    assert str(conflicts["a"]) == "a: workspace version 3.0.0 is excluded (b requires [<2.0.0], c requires [>=1.0.0])"
+    assert conflicts["eigen"].version is None
+    assert str(conflicts["eigen"]) == "eigen: constraints exclude each other (b requires [>=3.4], c requires [<3.3])"
@@ -0,0 +1,116 @@
+import json
+
+import pytest
+
+from ros2conan import generate_conanfiles
+from ros2conan.generate_conanfiles import MANIFEST_FILE, configuration_independence, generate_all
+from ros2conan.rospackageparser import parse_package_xml
+from ros2conan.utils import PkgTypeMeta
+from ros2conan.workspace import scan_workspace
+
+from .conftest import write_package_xml
+
+REPOS = {"repositories": {"repo": {"type": "git", "url": "https://example.com/repo.git", "version": "main"}}}
+
+@pytest.fixture
+def src_root(tmp_path):
+    """repo holds pkg_a, pkg_b depending on pkg_a and pkg_c"""
+    src = tmp_path / "src"
+    write_package_xml(src / "repo" / "pkg_a", "pkg_a")
+    write_package_xml(src / "repo" / "pkg_b", "pkg_b", deps=[("depend", "pkg_a")])
+    write_package_xml(src / "repo" / "pkg_c", "pkg_c")
+    return src
+
+def generate(src_root, out_dir, **kwargs):
+    index = scan_workspace(REPOS, str(src_root), workers=1)
+    return generate_all(index, str(out_dir), REPOS, str(src_root), **kwargs)
+
+def recipe_files(out_dir):
+    return {path.relative_to(out_dir).as_posix(): path.read_text() for path in sorted(out_dir.glob("*/*"))}
+
+def test_unchanged_recipes_are_skipped(tmp_path, src_root):
+    out_dir = tmp_path / "recipes"
+    report = generate(src_root, out_dir)
+    assert report.added == ["pkg_a", "pkg_b", "pkg_c"]
+    mtimes = {path: path.stat().st_mtime_ns for path in out_dir.glob("*/*")}
+
+    report = generate(src_root, out_dir)
+    assert (report.added, report.changed, report.unchanged) == ([], [], ["pkg_a", "pkg_b", "pkg_c"])
+    assert {path: path.stat().st_mtime_ns for path in out_dir.glob("*/*")} == mtimes
+
+def test_changed_fingerprints_are_regenerated(tmp_path, src_root):
+    out_dir = tmp_path / "recipes"
+    generate(src_root, out_dir)
+
+    # pkg_b requires pkg_a, a new version of pkg_a changes both fingerprints
+    write_package_xml(src_root / "repo" / "pkg_a", "pkg_a", version="1.1.0")
+    (out_dir / "pkg_c" / "conandata.yml").unlink()
+    report = generate(src_root, out_dir)
+
+    assert report.changed == ["pkg_a", "pkg_b", "pkg_c"]
+    assert 'version = "1.1.0"' in (out_dir / "pkg_a" / "conanfile.py").read_text()
+    assert (out_dir / "pkg_c" / "conandata.yml").is_file()
+    assert generate(src_root, out_dir, force=True).changed == ["pkg_a", "pkg_b", "pkg_c"]
+
+def test_manifest_records_the_last_run(tmp_path, src_root):
+    out_dir = tmp_path / "recipes"
+    generate(src_root, out_dir)
+    fingerprints = json.loads((out_dir / MANIFEST_FILE).read_text())["fingerprints"]
+    assert sorted(fingerprints) == ["pkg_a", "pkg_b", "pkg_c"]
+
+    (src_root / "repo" / "pkg_c" / "package.xml").unlink()
+    report = generate(src_root, out_dir)
+
+    manifest = json.loads((out_dir / MANIFEST_FILE).read_text())
+    assert report.removed == manifest["removed"] == ["pkg_c"]
+    assert manifest["unchanged"] == ["pkg_a", "pkg_b"]
+    assert manifest["fingerprints"] == {name: fingerprints[name] for name in ("pkg_a", "pkg_b")}
+
+def test_rendering_in_processes_matches_serial(tmp_path, src_root):
+    generate(src_root, tmp_path / "serial", workers=1)
+    generate(src_root, tmp_path / "processes", workers=2)
+    assert recipe_files(tmp_path / "processes") == recipe_files(tmp_path / "serial")
+
+@pytest.mark.parametrize("files, export, reason", [
+    (["setup.py"], "", "pure Python"),
+    ([], "<build_type>ament_python</build_type>", "pure Python"),
+    (["CMakeLists.txt", "msg/Foo.msg"], "", None),
+    (["CMakeLists.txt", "src/node.cpp"], "<architecture_independent/>", "architecture_independent"),
+    (["CMakeLists.txt"], "<metapackage/>", "metapackage"),
+    (["CMakeLists.txt", "cmake/macros.cmake", "data/config.yaml"], "", "no compiled sources"),
+    (["CMakeLists.txt", ".hidden/stale.cpp"], "", "no compiled sources"),
+    (["CMakeLists.txt", "src/node.cpp"], "", None),
+    (["CMakeLists.txt", "include/pkg/header.hpp"], "", None),
+    (["CMakeLists.txt"], "<build_type>ament_cmake</build_type><build_type>cmake</build_type>", "no compiled sources"),
+], ids=["setup_py", "ament_python", "interfaces", "architecture_independent", "metapackage", "cmake_modules",
+        "hidden_sources", "cpp_sources", "headers", "cmake_build_types"])
+def test_configuration_independence(tmp_path, files, export, reason):
+    pkg_xml = write_package_xml(tmp_path / "pkg", "pkg", export=export)
+    for name in files:
+        (tmp_path / "pkg" / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / "pkg" / name).write_text("")
+    parsed = parse_package_xml(pkg_xml)
+    parsed.type_meta = PkgTypeMeta(tmp_path / "pkg")
+    assert configuration_independence(parsed) == reason
+
+def test_configuration_independence_is_cached(tmp_path, src_root, monkeypatch):
+    walked = []
+    has_compiled_sources = generate_conanfiles.has_compiled_sources
+    monkeypatch.setattr(generate_conanfiles, "has_compiled_sources",
+                        lambda dirname: walked.append(dirname) or has_compiled_sources(dirname))
+    out_dir = tmp_path / "recipes"
+    generate(src_root, out_dir)
+    assert len(walked) == 3
+
+    walked.clear()
+    generate(src_root, out_dir)
+    assert walked == []
+
+    # a new package.xml or force walks the package tree again
+    write_package_xml(src_root / "repo" / "pkg_c", "pkg_c", version="1.1.0")
+    generate(src_root, out_dir)
+    assert walked == [str(src_root / "repo" / "pkg_c")]
+
+    walked.clear()
+    generate(src_root, out_dir, force=True)
+    assert len(walked) == 3
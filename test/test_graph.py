@@ -0,0 +1,91 @@
+import pytest
+
+from ros2conan.graph import REQUIRES, TEST_REQUIRES, TOOL_REQUIRES, CycleError, DependencyGraph
+from ros2conan.rospackageparser import parse_package_xml
+
+from .conftest import write_package_xml
+
+def make_graph(edges, names="abcdef"):
+    """edges are (name, dependency) requires, or (name, dependency, kind)"""
+    graph = DependencyGraph(names)
+    for name, dependency, *kind in edges:
+        graph.add_edge(kind[0] if kind else REQUIRES, name, dependency)
+    return graph
+
+@pytest.fixture
+def diamond():
+    """b and c depend on a, d on b and c, e on d, f is on its own"""
+    return make_graph([("b", "a"), ("c", "a"), ("d", "b"), ("d", "c", TOOL_REQUIRES), ("e", "d")])
+
+def test_from_index(tmp_path):
+    packages = {
+        "a": [],
+        "b": [("depend", "a"), ("depend", "eigen")],
+        "c": [("buildtool_depend", "b"), ("test_depend", "a"), ("exec_depend", "c")],
+    }
+    index = {name: parse_package_xml(write_package_xml(tmp_path / name, name, deps=deps)) for name, deps in packages.items()}
+
+    graph = DependencyGraph.from_index(index)
+    assert graph.adjacency == {REQUIRES: [[], [0], []], TOOL_REQUIRES: [[], [], [1]], TEST_REQUIRES: [[], [], [0]]}
+    assert graph.reverse_adjacency[TOOL_REQUIRES] == [[], [2], []]
+
+def test_add_edge_ignores_duplicates():
+    graph = make_graph([("b", "a"), ("b", "a")], "ab")
+    assert graph.adjacency[REQUIRES] == [[], [0]]
+    assert graph.reverse_adjacency[REQUIRES] == [[1], []]
+
+def test_dependencies_and_dependents(diamond):
+    d = diamond.ids["d"]
+    assert [diamond.names[node] for node in diamond.dependencies(d)] == ["b", "c"]
+    assert [diamond.names[node] for node in diamond.dependencies(d, [REQUIRES])] == ["b"]
+    assert [diamond.names[node] for node in diamond.dependents(diamond.ids["a"])] == ["b", "c"]
+
+def test_topological_order_and_waves(diamond):
+    order = diamond.topological_order()
+    assert all(order.index(name) > order.index(dep) for name, dep in [("b", "a"), ("c", "a"), ("d", "b"), ("d", "c"), ("e", "d")])
+    assert diamond.waves() == [["a", "f"], ["b", "c"], ["d"], ["e"]]
+    assert diamond.waves([TOOL_REQUIRES]) == [["a", "b", "c", "e", "f"], ["d"]]
+    assert DependencyGraph([]).waves() == []
+
+def test_critical_path(diamond):
+    assert diamond.critical_path() == (4.0, ["a", "b", "d", "e"])
+    assert diamond.critical_path(weights={"c": 10.0}) == (13.0, ["a", "c", "d", "e"])
+    assert diamond.critical_path(weights={"f": 20.0}) == (20.0, ["f"])
+    assert DependencyGraph([]).critical_path() == (0.0, [])
+
+def test_reverse_closure_and_rebuild_order(diamond):
+    closure = diamond.reverse_closure(["b"])
+    assert sorted(diamond.names[node] for node in closure) == ["b", "d", "e"]
+    assert diamond.rebuild_order(["b"]) == ["b", "d", "e"]
+    assert diamond.rebuild_order(["a"]) == ["a", "b", "c", "d", "e"]
+    assert diamond.rebuild_order(["c"], [REQUIRES]) == ["c"]
+    assert diamond.rebuild_order(["f"]) == ["f"]
+
+def test_find_cycle(diamond):
+    assert diamond.find_cycle() is None
+    diamond.add_edge(REQUIRES, "a", "e")
+    cycle = diamond.find_cycle()
+    assert cycle[0] == cycle[-1]
+    assert len(cycle) in (5, 6)
+    assert set(cycle) <= {"a", "b", "c", "d", "e"}
+    assert all(diamond.ids[dep] in diamond.dependencies(diamond.ids[name]) for name, dep in zip(cycle, cycle[1:]))
+
+def test_test_requires_cycles_are_ignored_by_default():
+    graph = make_graph([("b", "a"), ("a", "b", TEST_REQUIRES)], "ab")
+    assert graph.find_cycle() is None
+    assert graph.topological_order() == ["a", "b"]
+    assert graph.find_cycle([REQUIRES, TEST_REQUIRES]) == ["a", "b", "a"]
+
+@pytest.mark.parametrize("method", ["topological_order", "waves", "critical_path"])
+def test_cycle_error(method):
+    graph = make_graph([("a", "b"), ("b", "c"), ("c", "a"), ("d", "a")], "abcd")
+    with pytest.raises(CycleError) as error:
+        getattr(graph, method)()
+    assert error.value.cycle == ["a", "b", "c", "a"]
+    assert str(error.value) == "dependency cycle: a -> b -> c -> a"
+
+def test_rebuild_order_cycle_error():
+    graph = make_graph([("a", "b"), ("b", "a"), ("c", "d")], "abcd")
+    assert graph.rebuild_order(["d"]) == ["d", "c"]
+    with pytest.raises(CycleError, match="a -> b -> a"):
+        graph.rebuild_order(["a"])
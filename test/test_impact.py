@@ -0,0 +1,72 @@
+import pytest
+
+from ros2conan.impact import RepoChange, diff_repos, rebuild_impact
+from ros2conan.workspace import scan_workspace
+
+from .conftest import write_package_xml
+
+def repos(**versions):
+    return {"repositories": {repo: {"type": "git", "url": f"https://example.com/{repo}.git", "version": version}
+                             for repo, version in versions.items()}}
+
+OLD_VERSIONS = {"base": "1.0", "middleware": "2.0", "apps": "3.0", "tools": "4.0"}
+OLD_REPOS = repos(**OLD_VERSIONS)
+
+def test_diff_repos():
+    new_repos = repos(base="1.0", middleware="2.1", apps="3.0", extra="main")
+    new_repos["repositories"]["apps"]["url"] = "https://mirror.example.com/apps.git"
+
+    changes = diff_repos(OLD_REPOS, new_repos)
+    assert [(change.repo, change.old is not None, change.new is not None) for change in changes] == [
+        ("middleware", True, True), ("apps", True, True), ("extra", False, True), ("tools", True, False)]
+    assert [str(change) for change in changes] == [
+        "~ middleware version 2.0 -> 2.1",
+        "~ apps url https://example.com/apps.git -> https://mirror.example.com/apps.git",
+        "+ extra main",
+        "- tools 4.0",
+    ]
+    assert diff_repos(OLD_REPOS, OLD_REPOS) == []
+
+def test_fields_not_checked_out_are_ignored():
+    new_repos = repos(**OLD_VERSIONS)
+    new_repos["repositories"]["base"]["comment"] = "pinned"
+    assert diff_repos(OLD_REPOS, new_repos) == []
+
+@pytest.fixture
+def index(tmp_path):
+    """
+    base holds core, middleware holds comm requiring core, apps holds app requiring comm and
+    tests with core and viewer requiring core, tools holds lint using viewer as a tool
+    """
+    src = tmp_path / "src"
+    write_package_xml(src / "base" / "core", "core")
+    write_package_xml(src / "middleware" / "comm", "comm", deps=[("depend", "core")])
+    write_package_xml(src / "apps" / "app", "app", deps=[("depend", "comm"), ("test_depend", "core")])
+    write_package_xml(src / "apps" / "viewer", "viewer", deps=[("exec_depend", "core")])
+    write_package_xml(src / "tools" / "lint", "lint", deps=[("buildtool_depend", "viewer")])
+    return scan_workspace(OLD_REPOS, str(src), workers=1)
+
+@pytest.mark.parametrize("changed, rebuild", [
+    ({"base": "1.1"}, ["core", "comm", "viewer", "app", "lint"]),
+    ({"middleware": "2.1"}, ["comm", "app"]),
+    ({"apps": "3.1"}, ["app", "viewer", "lint"]),
+    ({"tools": "4.1"}, ["lint"]),
+    ({}, []),
+])
+def test_rebuild_impact(index, changed, rebuild):
+    impact = rebuild_impact(OLD_REPOS, repos(**{**OLD_VERSIONS, **changed}), index)
+
+    assert [change.repo for change in impact.changes] == list(changed)
+    assert sorted(impact.changed_packages) == sorted(name for name, parsed in index.items() if parsed.repo in changed)
+    assert sorted(impact.rebuild) == sorted(rebuild)
+    assert all(impact.rebuild.index(name) > impact.rebuild.index(dep)
+               for name, dep in [("comm", "core"), ("app", "comm"), ("viewer", "core"), ("lint", "viewer")]
+               if name in impact.rebuild and dep in impact.rebuild)
+
+def test_removed_repository_rebuilds_nothing(index):
+    new_repos = repos(base="1.0", middleware="2.0", apps="3.0")
+    del index["lint"]
+
+    impact = rebuild_impact(OLD_REPOS, new_repos, index)
+    assert impact.changes == [RepoChange("tools", OLD_REPOS["repositories"]["tools"], None)]
+    assert (impact.changed_packages, impact.rebuild) == ([], [])
@@ -0,0 +1,73 @@
+import json
+import shlex
+import sys
+
+import pytest
+
+from ros2conan.lockfile import conan_lockfile, diff_lockfile, resolve_replacements, used_replacements
+from ros2conan.rospackageparser import parse_package_xml
+from ros2conan.scheduler import CONAN_ENV_VAR
+
+from .conftest import write_package_xml
+
+# Answers conan list <ref> --format=json like a remote holding eigen 3.3.9 and 3.4.0,
+# refs of any other package match nothing
+CONAN_LIST_STUB = """
+import json, sys
+args = sys.argv[1:]
+assert args[0] == "list" and "--format=json" in args
+name = args[1].partition("/")[0]
+if name != "eigen":
+    print(json.dumps({"conancenter": {"error": f"Recipe '{args[1]}' not found"}}))
+else:
+    print(json.dumps({"conancenter": {"eigen/3.3.9": {}, "eigen/3.4.0": {}}}))
+"""
+
+@pytest.fixture
+def conan_list(tmp_path, monkeypatch):
+    stub = tmp_path / "conan_stub.py"
+    stub.write_text(CONAN_LIST_STUB)
+    monkeypatch.setenv(CONAN_ENV_VAR, shlex.join([sys.executable, str(stub)]))
+
+@pytest.fixture
+def index(tmp_path):
+    """a uses b as a tool, depends on eigen and tests with gtest, b needs cmake to build and curl"""
+    packages = {
+        "a": [("buildtool_depend", "b"), ("depend", "eigen"), ("test_depend", "gtest")],
+        "b": [("buildtool_depend", "cmake"), ("exec_depend", "curl"), ("exec_depend", "unmapped_key")],
+    }
+    index = {}
+    for name, deps in packages.items():
+        index[name] = parse_package_xml(write_package_xml(tmp_path / "src" / name, name, "1.2.0", deps))
+    return index
+
+REPLACEMENTS = {"eigen": "eigen/[>=3.4.0]", "gtest": "gtest/1.14.0", "cmake": "cmake/3.28.1",
+                "curl": "libcurl/8.6.0", "b": "not_used/1.0", "other": "other/1.0"}
+
+def test_used_replacements_skip_workspace_packages(index):
+    assert used_replacements(index, REPLACEMENTS) == {key: REPLACEMENTS[key] for key in ("eigen", "gtest", "cmake", "curl")}
+
+def test_resolve_replacements(conan_list):
+    resolved = resolve_replacements({"eigen": "eigen/[>=3.4.0]", "gtest": "gtest/1.14.0", "missing": "missing/[>=1]"})
+    assert resolved == {"eigen": "eigen/3.4.0", "gtest": "gtest/1.14.0"}
+
+def test_lockfile_locks_replacements(index, conan_list):
+    replacement_refs = resolve_replacements(used_replacements(index, REPLACEMENTS))
+    lockfile = conan_lockfile(index, replacement_refs)
+
+    assert lockfile["requires"] == ["libcurl/8.6.0", "gtest/1.14.0", "eigen/3.4.0", "b/1.2.0", "a/1.2.0"]
+    assert lockfile["build_requires"] == ["cmake/3.28.1", "b/1.2.0"]
+
+def test_lockfile_with_replacements_round_trips(tmp_path, index, conan_list):
+    replacement_refs = resolve_replacements(used_replacements(index, REPLACEMENTS))
+    lockfile_path = tmp_path / "conan.lock"
+    lockfile_path.write_text(json.dumps(conan_lockfile(index, replacement_refs), indent=4))
+
+    lockfile = json.loads(lockfile_path.read_text())
+    assert diff_lockfile(lockfile, index, replacement_refs).is_empty()
+
+    diff = diff_lockfile(lockfile, index, {**replacement_refs, "eigen": "eigen/3.4.1"})
+    assert diff.changed == [("eigen", "3.4.0", "3.4.1")]
+    diff = diff_lockfile(lockfile, index)
+    assert diff.extra == ["cmake/3.28.1", "eigen/3.4.0", "gtest/1.14.0", "libcurl/8.6.0"]
+    assert not diff.missing and not diff.changed
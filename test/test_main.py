@@ -0,0 +1,9 @@
+import pytest
+
+from ros2conan.main import main
+
+def test_impact_rejects_repos(tmp_path, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        main(["impact", "--repos", str(tmp_path / "other.repos"), "old.repos", "new.repos"])
+    assert exit_info.value.code == 2
+    assert "unrecognized arguments: --repos" in capsys.readouterr().err
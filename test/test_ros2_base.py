@@ -0,0 +1,103 @@
+from types import SimpleNamespace
+
+import pytest
+
+@pytest.fixture
+def batch_recipe(tmp_path, upstream, ros2_base):
+    """Ros2Base building pkg_a and pkg_b of the upstream repository in batch, colcon runs are recorded"""
+    url, commits = upstream
+    ros2_base.name = "pkg_a"
+    ros2_base.url = url
+    ros2_base.version = "1.0.0"
+    ros2_base.settings = SimpleNamespace(dumps=lambda: "build_type=Release")
+    ros2_base.options = "shared=False"
+    ros2_base.ros2_batch_packages = ["pkg_a", "pkg_b"]
+    ros2_base.source_folder = str(tmp_path / "source")
+    ros2_base.conf.define("user.ros2conan:batch_workspaces", str(tmp_path / "batch"))
+    ros2_base.commands = []
+    ros2_base.run = ros2_base.commands.append
+    ros2_base._fetch_repository(ros2_base.source_folder, "repo", {"url": url, "version": "v1"})
+    return ros2_base
+
+def test_batch_is_built_once_per_source_revision(upstream, batch_recipe):
+    url, commits = upstream
+    batch_recipe._colcon_build_batch()
+    assert len(batch_recipe.commands) == 1
+    assert "--packages-select pkg_a pkg_b" in batch_recipe.commands[0]
+
+    batch_recipe.name = "pkg_b"
+    batch_recipe._colcon_build_batch()
+    assert len(batch_recipe.commands) == 1
+
+    batch_recipe._fetch_repository(batch_recipe.source_folder, "repo", {"url": url, "version": "devel"})
+    batch_recipe._colcon_build_batch()
+    assert len(batch_recipe.commands) == 2
+
+def test_batch_workspace_per_source_revision(upstream, batch_recipe):
+    url, commits = upstream
+    ws_dir = batch_recipe._batch_ws_dir
+    batch_recipe.name, batch_recipe.version = "pkg_b", "2.0.0"
+    assert batch_recipe._batch_ws_dir == ws_dir
+
+    batch_recipe._fetch_repository(batch_recipe.source_folder, "repo", {"url": url, "version": "devel"})
+    assert batch_recipe._batch_ws_dir != ws_dir
+
+def test_batch_workspace_per_configuration(batch_recipe):
+    release_ws = batch_recipe._batch_ws_dir
+    batch_recipe.settings = SimpleNamespace(dumps=lambda: "build_type=Debug")
+    assert batch_recipe._batch_ws_dir != release_ws
+
+    batch_recipe._colcon_build_batch()
+    assert len(batch_recipe.commands) == 1
+
+@pytest.mark.parametrize("in_build_folder", [True, False])
+def test_package_install_tree_links_only_from_build_folder(tmp_path, ros2_base, in_build_folder):
+    ros2_base.name = "pkg"
+    ros2_base.build_folder = str(tmp_path / "build")
+    ros2_base.package_folder = str(tmp_path / "package")
+    install_dir = tmp_path / ("build" if in_build_folder else "batch") / "install" / "pkg"
+    (install_dir / "lib").mkdir(parents=True)
+    (install_dir / "lib" / "libpkg.so").write_bytes(b"library")
+
+    ros2_base._package_install_tree(str(install_dir), "python3.11")
+
+    packaged = tmp_path / "package" / "lib" / "libpkg.so"
+    assert packaged.read_bytes() == b"library"
+    assert packaged.samefile(install_dir / "lib" / "libpkg.so") == in_build_folder
+
+def test_reused_build_base_is_reconfigured_for_new_dependencies(tmp_path, ros2_base):
+    ros2_base.commands = []
+    ros2_base.run = ros2_base.commands.append
+    build_base = str(tmp_path / "build_dirs" / "pkg")
+    dependency = SimpleNamespace(package_folder=str(tmp_path / "p" / "dep1"))
+    ros2_base.dependencies = {"dep": dependency}
+
+    ros2_base._colcon_build_ws(cmake_args=["-DA=1"], build_base=build_base)
+    ros2_base._colcon_build_ws(cmake_args=["-DA=1"], build_base=build_base)
+    dependency.package_folder = str(tmp_path / "p" / "dep2")
+    ros2_base._colcon_build_ws(cmake_args=["-DA=1"], build_base=build_base)
+    ros2_base._colcon_build_ws(cmake_args=["-DA=2"], build_base=build_base)
+
+    assert ["--cmake-force-configure" in command for command in ros2_base.commands] == [False, False, True, True]
+
+@pytest.mark.parametrize("executable", ["/py", "/opt/a/very/long/path/to/a/virtual/env/bin/python3"])
+def test_relocated_shebang(tmp_path, ros2_base, monkeypatch, executable):
+    monkeypatch.setattr("sys.executable", executable)
+    scripts = {"absolute": "#!/usr/bin/python3\n", "venv": f"#!{executable}\n", "shell": "#!/bin/sh\n"}
+    for name, shebang in scripts.items():
+        (tmp_path / name).write_text(shebang + "print()\n")
+
+    relocated = {name: ros2_base._relocated_shebang(str(tmp_path / name), "python3.11") for name in scripts}
+
+    assert relocated == {"absolute": b"#!/usr/bin/env python3.11\n", "venv": b"#!/usr/bin/env python3.11\n", "shell": None}
+
+def test_build_base_per_cmake_generator(tmp_path, ros2_base):
+    ros2_base.name = "pkg"
+    ros2_base.settings = SimpleNamespace(dumps=lambda: "build_type=Release")
+    ros2_base.options = "shared=False"
+    ros2_base.conf.define("user.ros2conan:build_dirs", str(tmp_path / "build_dirs"))
+    default_build_base = ros2_base._build_base
+
+    ros2_base.conf.define("user.ros2conan:cmake_generator", "Ninja")
+    assert ros2_base._build_base != default_build_base
+    assert ros2_base._build_base.startswith(str(tmp_path / "build_dirs" / "pkg"))
@@ -0,0 +1,114 @@
+import hashlib
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from ros2conan.constraints import VersionConstraint
+from ros2conan.rospackageparser import (ConanRequirement, DepKind, Maintainer, convert_to_conandeps, get_build_types,
+                                       get_dependencies, package_metadata, parse_package_xml)
+
+from .conftest import write_package_xml
+
+def test_parse_metadata_and_file_stats(tmp_path):
+    pkg_xml = write_package_xml(tmp_path / "pkg", "pkg", "1.2.3")
+    content = pkg_xml.read_bytes()
+
+    parsed = parse_package_xml(pkg_xml)
+
+    assert parsed.metadata.name == "pkg"
+    assert parsed.metadata.version == "1.2.3"
+    assert parsed.metadata.license == ["Apache-2.0"]
+    assert parsed.metadata.maintainers == [Maintainer("Dev", "dev@example.com")]
+    assert parsed.path == str(pkg_xml)
+    assert parsed.sha256 == hashlib.sha256(content).hexdigest()
+    assert parsed.bytes_read == len(content)
+
+def test_dependency_kinds_are_merged(tmp_path):
+    deps = [("build_depend", "rclcpp"), ("exec_depend", "rclcpp"), ("depend", "std_msgs"),
+            ("buildtool_depend", "ament_cmake"), ("test_depend", "ament_lint_auto"), ("doc_depend", "doxygen")]
+    parsed = parse_package_xml(write_package_xml(tmp_path / "pkg", "pkg", deps=deps))
+
+    dependencies = get_dependencies(parsed)
+    assert list(dependencies) == ["rclcpp", "std_msgs", "ament_cmake", "ament_lint_auto", "doxygen"]
+    assert dependencies["rclcpp"].kinds == DepKind.BUILD_DEPEND | DepKind.EXEC_DEPEND
+    assert dependencies["rclcpp"].build_depend and dependencies["rclcpp"].exec_depend
+    assert not dependencies["rclcpp"].test_depend
+    assert dependencies["ament_cmake"].kinds == DepKind.BUILDTOOL_DEPEND
+
+def test_version_attributes_and_conditions(tmp_path):
+    deps = [("depend", "rclcpp", {"version_gte": "16.0.0", "version_lt": "17.0.0"}),
+            ("exec_depend", "rclcpp", {"version_gte": "16.0.1"}),
+            ("exec_depend", "python3-numpy", {"condition": "$ROS_PYTHON_VERSION == 3"})]
+    parsed = parse_package_xml(write_package_xml(tmp_path / "pkg", "pkg", deps=deps))
+
+    rclcpp = parsed.dependencies["rclcpp"]
+    # a later tag overrides the constraint of the same operator
+    assert set(rclcpp.constraints) == {VersionConstraint(">=", "16.0.1"), VersionConstraint("<", "17.0.0")}
+    assert (rclcpp.version_gte, rclcpp.version_lt, rclcpp.version_eq) == ("16.0.1", "17.0.0", None)
+    assert parsed.dependencies["python3-numpy"].constraints == ()
+    assert parsed.dependencies["python3-numpy"].exec_depend
+
+def test_export_section(tmp_path):
+    export = "<build_type>ament_python</build_type><architecture_independent/><deprecated> use other </deprecated>"
+    parsed = parse_package_xml(write_package_xml(tmp_path / "pkg", "pkg", export=export))
+
+    assert get_build_types(parsed) == ["ament_python"]
+    assert parsed.export_flags == {"architecture_independent": "", "deprecated": "use other"}
+
+def test_missing_required_tag(tmp_path):
+    pkg_xml = tmp_path / "package.xml"
+    pkg_xml.write_text('<package format="3"><name>pkg</name><version>1.0.0</version></package>')
+
+    parsed = parse_package_xml(pkg_xml)
+    assert parsed.metadata is None
+
+def test_malformed_xml(tmp_path):
+    pkg_xml = tmp_path / "package.xml"
+    pkg_xml.write_text('<package format="3"><name>pkg</name><version>1.0.0</package>')
+
+    with pytest.raises(ET.ParseError):
+        parse_package_xml(pkg_xml)
+
+@pytest.fixture
+def conan_deps_of(tmp_path):
+    """Converts deps of a package next to the workspace packages rclcpp 16.0.1 and ament_cmake 2.0.0"""
+    pkgs = {name: package_metadata(parse_package_xml(write_package_xml(tmp_path / name, name, version)))
+            for name, version in (("rclcpp", "16.0.1"), ("ament_cmake", "2.0.0"))}
+
+    def conan_deps_of(deps, replacements=None):
+        parsed = parse_package_xml(write_package_xml(tmp_path / "pkg", "pkg", deps=deps))
+        return convert_to_conandeps(get_dependencies(parsed), pkgs, replacements)
+    return conan_deps_of
+
+def test_convert_to_conandeps(conan_deps_of):
+    conan_deps = conan_deps_of([("depend", "rclcpp"), ("buildtool_depend", "ament_cmake"),
+                                ("test_depend", "rclcpp"), ("exec_depend", "eigen", {"version_gte": "3.3"})])
+
+    assert conan_deps.requires == [ConanRequirement("rclcpp", "[>=16.0.1]", True, True), ConanRequirement("eigen", "[>=3.3]")]
+    assert conan_deps.build_requirements.tool_requires == [ConanRequirement("ament_cmake", "[>=2.0.0]")]
+    # a separate copy, the test requirement does not share the traits of the regular one
+    assert conan_deps.build_requirements.test_requires == [ConanRequirement("rclcpp", "[>=16.0.1]", True, True)]
+    assert conan_deps.requires[0] is not conan_deps.build_requirements.test_requires[0]
+    assert conan_deps.unmapped == []
+
+def test_build_and_exec_dependency_is_required_once(conan_deps_of):
+    conan_deps = conan_deps_of([("build_depend", "rclcpp"), ("exec_depend", "rclcpp")])
+    assert conan_deps.requires == [ConanRequirement("rclcpp", "[>=16.0.1]")]
+    assert conan_deps.build_requirements == conan_deps_of([]).build_requirements
+
+def test_replacements(conan_deps_of):
+    replacements = {"eigen": "eigen/[>=3.4.0]", "cmake": "cmake/3.28.1", "rclcpp": "not_used/1.0"}
+    conan_deps = conan_deps_of([("depend", "eigen", {"version_gte": "3.3"}), ("buildtool_depend", "cmake"),
+                                ("exec_depend", "rclcpp"), ("exec_depend", "unmapped_key")], replacements)
+
+    # the workspace package wins over a replacement of the same name, the rosdep constraint is dropped
+    assert conan_deps.requires == [ConanRequirement("eigen", "[>=3.4.0]", True, True),
+                                   ConanRequirement("rclcpp", "[>=16.0.1]"), ConanRequirement("unmapped_key", "*")]
+    assert conan_deps.build_requirements.tool_requires == [ConanRequirement("cmake", "3.28.1")]
+    assert conan_deps.unmapped == ["unmapped_key"]
+    assert conan_deps_of([("exec_depend", "unmapped_key")]).unmapped == []
+
+def test_keys_replaced_by_the_same_reference_merge(conan_deps_of):
+    replacements = {"libfreetype6": "freetype/2.13.2", "libfreetype6-dev": "freetype/2.13.2"}
+    conan_deps = conan_deps_of([("exec_depend", "libfreetype6"), ("depend", "libfreetype6-dev")], replacements)
+    assert conan_deps.requires == [ConanRequirement("freetype", "2.13.2", True, True)]
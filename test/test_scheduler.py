@@ -0,0 +1,126 @@
+import json
+import shlex
+import sys
+
+import pytest
+
+from ros2conan.main import main
+from ros2conan.scheduler import CONAN_ENV_VAR, build_recipes
+
+# Stands in for conan create: sleeps, records when each build started and ended, and fails
+# the recipes listed in $FAIL_PKGS
+CONAN_STUB = """
+import os, sys, time
+events_file, args = sys.argv[1], sys.argv[2:]
+assert args[0] == "create"
+name = os.path.basename(args[1])
+with open(events_file, "a") as f:
+    f.write(f"start {name}\\n")
+time.sleep(0.1)
+with open(events_file, "a") as f:
+    f.write(f"end {name}\\n")
+sys.exit(1 if name in os.environ.get("FAIL_PKGS", "").split() else 0)
+"""
+
+def write_recipe(recipes_dir, name, requires=(), tool_requires=()):
+    recipe_dir = recipes_dir / name
+    recipe_dir.mkdir(parents=True)
+    lines = ["class Recipe:", f'    name = "{name}"', "    def requirements(self):"]
+    lines += [f'        self.requires("{dep}/1.0")' for dep in requires] or ["        pass"]
+    lines += ["    def build_requirements(self):"]
+    lines += [f'        self.tool_requires("{dep}/1.0")' for dep in tool_requires] or ["        pass"]
+    (recipe_dir / "conanfile.py").write_text("\n".join(lines) + "\n")
+
+@pytest.fixture
+def recipes_dir(tmp_path):
+    """b, c and e depend on a, d depends on b and c"""
+    recipes_dir = tmp_path / "recipes"
+    write_recipe(recipes_dir, "a")
+    write_recipe(recipes_dir, "b", requires=["a"])
+    write_recipe(recipes_dir, "c", tool_requires=["a"])
+    write_recipe(recipes_dir, "d", requires=["b", "c"])
+    write_recipe(recipes_dir, "e", requires=["a"])
+    return recipes_dir
+
+@pytest.fixture
+def conan_events(tmp_path, monkeypatch):
+    """Points ROS2CONAN_CONAN at the stub, returns a function listing its start/end events"""
+    stub = tmp_path / "conan_stub.py"
+    stub.write_text(CONAN_STUB)
+    events_file = tmp_path / "conan_events.txt"
+    monkeypatch.setenv(CONAN_ENV_VAR, shlex.join([sys.executable, str(stub), str(events_file)]))
+    monkeypatch.delenv("FAIL_PKGS", raising=False)
+
+    def events():
+        if not events_file.exists():
+            return []
+        return [tuple(line.split()) for line in events_file.read_text().splitlines()]
+    return events
+
+def test_builds_in_dependency_order(recipes_dir, conan_events):
+    results = build_recipes(str(recipes_dir), workers=4)
+
+    assert {name: result.status for name, result in results.items()} == dict.fromkeys("abcde", "success")
+    events = conan_events()
+    position = {event: i for i, event in enumerate(events)}
+    for name, deps in {"b": "a", "c": "a", "d": "bc", "e": "a"}.items():
+        for dep in deps:
+            assert position[("end", dep)] < position[("start", name)]
+    timings = json.loads((recipes_dir / ".build_logs" / "timings.json").read_text())
+    assert [timing["name"] for timing in timings] == list("abcde")
+
+def test_independent_builds_run_concurrently(recipes_dir, conan_events):
+    build_recipes(str(recipes_dir), workers=4)
+
+    events = conan_events()
+    started_before_first_end = events[1:events.index(next(e for e in events if e[0] == "end" and e[1] != "a"))]
+    assert len([event for event in started_before_first_end if event[0] == "start"]) > 1
+
+def test_fail_fast_starts_no_new_builds(recipes_dir, conan_events, monkeypatch):
+    monkeypatch.setenv("FAIL_PKGS", "a")
+
+    results = build_recipes(str(recipes_dir), workers=4)
+
+    assert results["a"].status == "failed"
+    assert all(results[name].status == "skipped" for name in "bcde")
+    assert conan_events() == [("start", "a"), ("end", "a")]
+    assert (recipes_dir / ".build_logs" / "a.log").exists()
+
+def test_keep_going_only_skips_dependents(recipes_dir, conan_events, monkeypatch):
+    monkeypatch.setenv("FAIL_PKGS", "b")
+
+    results = build_recipes(str(recipes_dir), workers=1, keep_going=True)
+
+    assert {name: result.status for name, result in results.items()} == \
+        {"a": "success", "b": "failed", "c": "success", "d": "skipped", "e": "success"}
+    assert ("start", "d") not in conan_events()
+
+def test_fail_fast_lets_running_builds_finish(recipes_dir, conan_events, monkeypatch):
+    monkeypatch.setenv("FAIL_PKGS", "b")
+
+    results = build_recipes(str(recipes_dir), workers=1)
+
+    assert results["b"].status == "failed"
+    assert results["d"].status == "skipped"
+    started = [name for event, name in conan_events() if event == "start"]
+    assert started[:2] == ["a", "b"]
+    assert len(started) == 2
+
+def test_unknown_packages_are_rejected(recipes_dir, conan_events):
+    with pytest.raises(ValueError, match="missing"):
+        build_recipes(str(recipes_dir), packages=["a", "missing"])
+    assert conan_events() == []
+
+def test_cli_reports_unknown_packages(recipes_dir, conan_events):
+    with pytest.raises(SystemExit) as exit_info:
+        main(["build", str(recipes_dir), "--packages", "missing"])
+    assert "no recipe" in str(exit_info.value.code)
+
+def test_cli_reports_cycles(tmp_path, conan_events, capsys):
+    recipes_dir = tmp_path / "recipes"
+    write_recipe(recipes_dir, "a", requires=["b"])
+    write_recipe(recipes_dir, "b", requires=["a"])
+
+    assert main(["build", str(recipes_dir)]) == 1
+    assert "dependency cycle:" in capsys.readouterr().err
+    assert conan_events() == []
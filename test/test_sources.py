@@ -0,0 +1,111 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("conan")
+from conan.errors import ConanException
+from conan.internal.model.conf import Conf
+
+from ros2conan.generate_conanfiles import CMAKE_TEMPLATE, PYTHON_TEMPLATE, render
+from ros2conan.rospackageparser import ConanDeps, PackageMetadata
+
+from .conftest import git
+
+@pytest.fixture(params=[CMAKE_TEMPLATE, PYTHON_TEMPLATE])
+def recipe(request, tmp_path):
+    """An instance of a recipe generated from each template, mirroring into tmp_path"""
+    metadata = PackageMetadata(name="pkg", version="1.0.0", description="", maintainers=[], license=[], url=[])
+    scope = {}
+    exec(render(metadata, ConanDeps(), request.param), scope)
+    recipe = scope["PkgRecipe"]()
+    # what conan.tools.scm.Git reads of the helpers conan sets up when it loads a recipe
+    recipe._conan_helpers = SimpleNamespace(global_conf=Conf())
+    recipe.conf = Conf()
+    recipe.conf.define("user.ros2conan:git_mirrors", str(tmp_path / "mirrors"))
+    return recipe
+
+@pytest.mark.parametrize("ref, expected", [("v1", "tagged"), ("devel", "devel"), ("main", "main")])
+def test_fetch_sources_of_tag_and_branch(tmp_path, upstream, recipe, ref, expected):
+    url, commits = upstream
+    target = tmp_path / "src"
+    recipe._fetch_sources(url, ref, None, str(target))
+
+    assert git("rev-parse", "HEAD", cwd=target) == commits[expected]
+    assert (target / "pkg" / "version.txt").read_text() == expected
+    assert git("status", "--porcelain", cwd=target) == ""
+
+def test_fetch_sources_of_commit(tmp_path, upstream, recipe):
+    url, commits = upstream
+    target = tmp_path / "src"
+    recipe._fetch_sources(url, commits["tagged"], None, str(target))
+
+    assert git("rev-parse", "HEAD", cwd=target) == commits["tagged"]
+    assert (target / "pkg" / "version.txt").read_text() == "tagged"
+
+def test_fetch_sources_reuses_mirror_with_sparse_checkout(tmp_path, upstream, recipe):
+    url, commits = upstream
+    recipe._fetch_sources(url, "v1", "pkg", str(tmp_path / "first"))
+    recipe._fetch_sources(url, "devel", "pkg", str(tmp_path / "second"))
+
+    assert len(list((tmp_path / "mirrors").glob("*.git"))) == 1
+    assert git("rev-parse", "HEAD", cwd=tmp_path / "second") == commits["devel"]
+    assert (tmp_path / "second" / "pkg" / "version.txt").read_text() == "devel"
+    assert not (tmp_path / "second" / "other").exists()
+
+@pytest.mark.parametrize("version, expected", [("v1", "tagged"), ("devel", "devel"), (None, "main")])
+def test_fetch_repository_of_tag_branch_and_default(tmp_path, upstream, ros2_base, version, expected):
+    url, commits = upstream
+    ros2_base._fetch_repository(str(tmp_path / "src"), "repo", {"type": "git", "url": url, "version": version})
+
+    target = tmp_path / "src" / "repo"
+    assert git("rev-parse", "HEAD", cwd=target) == commits[expected]
+    assert (target / "pkg" / "version.txt").read_text() == expected
+    assert git("status", "--porcelain", cwd=target) == ""
+
+def test_fetch_repository_of_commit_and_update(tmp_path, upstream, ros2_base):
+    url, commits = upstream
+    source_dir = str(tmp_path / "src")
+    ros2_base._fetch_repository(source_dir, "repo", {"url": url, "version": commits["tagged"]})
+    assert git("rev-parse", "HEAD", cwd=tmp_path / "src" / "repo") == commits["tagged"]
+
+    ros2_base._fetch_repository(source_dir, "repo", {"url": url, "version": "devel"})
+    assert git("rev-parse", "HEAD", cwd=tmp_path / "src" / "repo") == commits["devel"]
+    assert len(list((tmp_path / "mirrors").glob("*.git"))) == 1
+
+def test_import_repositories(tmp_path, upstream, ros2_base):
+    url, commits = upstream
+    repos_file = tmp_path / "ros2.repos"
+    repos_file.write_text(f"repositories:\n  one:\n    url: {url}\n    version: v1\n"
+                          f"  two:\n    url: {url}\n    version: devel\n")
+
+    fetch_times = ros2_base._import_repositories(str(tmp_path / "src"), str(repos_file))
+
+    assert sorted(fetch_times) == ["one", "two"]
+    assert git("rev-parse", "HEAD", cwd=tmp_path / "src" / "one") == commits["tagged"]
+    assert git("rev-parse", "HEAD", cwd=tmp_path / "src" / "two") == commits["devel"]
+
+def test_fetch_sources_of_ancestor_after_newer_ref(tmp_path, upstream, recipe):
+    url, commits = upstream
+    recipe._fetch_sources(url, "devel", None, str(tmp_path / "first"))
+    recipe._fetch_sources(url, "v1", None, str(tmp_path / "second"))
+
+    assert git("rev-parse", "HEAD", cwd=tmp_path / "second") == commits["tagged"]
+    assert (tmp_path / "second" / "pkg" / "version.txt").read_text() == "tagged"
+
+def test_fetch_sources_of_commit_in_mirror_is_offline(tmp_path, upstream, recipe):
+    url, commits = upstream
+    recipe._fetch_sources(url, commits["tagged"], None, str(tmp_path / "first"))
+    (tmp_path / "upstream.git").rename(tmp_path / "offline.git")
+
+    recipe._fetch_sources(url, commits["tagged"], None, str(tmp_path / "second"))
+    assert git("rev-parse", "HEAD", cwd=tmp_path / "second") == commits["tagged"]
+    with pytest.raises(ConanException):
+        recipe._fetch_sources(url, "v1", None, str(tmp_path / "third"))
+
+def test_fetch_repository_of_commit_in_mirror_is_offline(tmp_path, upstream, ros2_base):
+    url, commits = upstream
+    ros2_base._fetch_repository(str(tmp_path / "first"), "repo", {"url": url, "version": commits["tagged"]})
+    (tmp_path / "upstream.git").rename(tmp_path / "offline.git")
+
+    ros2_base._fetch_repository(str(tmp_path / "second"), "repo", {"url": url, "version": commits["tagged"]})
+    assert git("rev-parse", "HEAD", cwd=tmp_path / "second" / "repo") == commits["tagged"]
@@ -0,0 +1,126 @@
+import json
+import shlex
+import sys
+
+import pytest
+
+from ros2conan.system_dependencies import (ROSDEP_ENV_VAR, RosdepResolver, SystemDep, load_system_libraries,
+                                           save_system_libraries, parser, ros_dep_resolve_lexer)
+
+# Answers like rosdep resolve, keys starting with "bad" have no rule and the #ROSDEP[key] header
+# is only printed for several keys. Every invocation is appended to the calls file so tests can
+# count rosdep runs and chunks.
+ROSDEP_STUB = """
+import sys
+calls_file, args = sys.argv[1], sys.argv[2:]
+assert args[0] == "resolve"
+with open(calls_file, "a") as f:
+    f.write(" ".join(args[1:]) + "\\n")
+for key in args[1:]:
+    if key.startswith("bad"):
+        print(f"ERROR: no rosdep rule for '{key}'", file=sys.stderr)
+        continue
+    if len(args) > 2:
+        print(f"#ROSDEP[{key}]")
+    print(f"#apt\\nlib{key}-dev lib{key}2")
+"""
+
+@pytest.fixture
+def rosdep_calls(tmp_path, monkeypatch):
+    """Points ROS2CONAN_ROSDEP at the stub, returns a function listing the keys of every rosdep run"""
+    stub = tmp_path / "rosdep_stub.py"
+    stub.write_text(ROSDEP_STUB)
+    calls_file = tmp_path / "rosdep_calls.txt"
+    monkeypatch.setenv(ROSDEP_ENV_VAR, shlex.join([sys.executable, str(stub), str(calls_file)]))
+
+    def calls():
+        if not calls_file.exists():
+            return []
+        return [line.split() for line in calls_file.read_text().splitlines()]
+    return calls
+
+def test_parser_yields_every_block():
+    output = "#ROSDEP[eigen]\n#apt\nlibeigen3-dev\n#ROSDEP[curl]\n#apt\nlibcurl4-openssl-dev curl\n"
+    deps = parser(ros_dep_resolve_lexer(output))
+    assert deps == [SystemDep("eigen", ["libeigen3-dev"]), SystemDep("curl", ["libcurl4-openssl-dev", "curl"])]
+
+def test_resolve_misses_in_chunks(tmp_path, rosdep_calls):
+    cache_file = tmp_path / "system_libraries.json"
+    keys = [f"key{i}" for i in range(5)]
+
+    resolver = RosdepResolver(cache_file, chunk_size=2)
+    deps = resolver.resolve(keys)
+
+    assert [dep.name for dep in deps] == keys
+    assert deps[0].system_libs == ["libkey0-dev", "libkey02"]
+    assert (resolver.hits, resolver.misses) == (0, 5)
+    assert sorted(len(call) for call in rosdep_calls()) == [1, 2, 2]
+    assert sorted(dep.name for dep in load_system_libraries(cache_file)) == keys
+
+def test_warm_cache_does_not_run_rosdep(tmp_path, rosdep_calls):
+    cache_file = tmp_path / "system_libraries.json"
+    RosdepResolver(cache_file).resolve(["eigen", "curl"])
+
+    resolver = RosdepResolver(cache_file)
+    deps = resolver.resolve(["curl", "eigen", "curl"])
+
+    assert [dep.name for dep in deps] == ["curl", "eigen"]
+    assert (resolver.hits, resolver.misses) == (2, 0)
+    assert len(rosdep_calls()) == 1
+
+def test_only_misses_are_resolved_and_replace_with_is_kept(tmp_path, rosdep_calls):
+    cache_file = tmp_path / "system_libraries.json"
+    save_system_libraries(cache_file, [SystemDep("eigen", ["libeigen3-dev"], "eigen/[>=3.4.0]")])
+
+    resolver = RosdepResolver(cache_file)
+    resolver.resolve(["eigen", "tinyxml2"])
+
+    assert rosdep_calls() == [["tinyxml2"]]
+    assert (resolver.hits, resolver.misses) == (1, 1)
+    cached = {dep.name: dep for dep in load_system_libraries(cache_file)}
+    assert cached["eigen"].replace_with == "eigen/[>=3.4.0]"
+    assert cached["tinyxml2"].system_libs == ["libtinyxml2-dev", "libtinyxml22"]
+
+def test_unresolved_keys_are_cached(tmp_path, rosdep_calls):
+    cache_file = tmp_path / "system_libraries.json"
+    resolver = RosdepResolver(cache_file)
+    deps = resolver.resolve(["eigen", "bad_key"])
+
+    assert [dep.name for dep in deps] == ["eigen"]
+    assert resolver.unresolved == {"bad_key"}
+    entries = {entry["name"]: entry for entry in json.loads(cache_file.read_text())}
+    assert entries["bad_key"]["unresolved"] is True
+    assert "unresolved" not in entries["eigen"]
+
+    resolver = RosdepResolver(cache_file)
+    assert [dep.name for dep in resolver.resolve(["eigen", "bad_key"])] == ["eigen"]
+    assert resolver.unresolved == {"bad_key"}
+    assert (resolver.hits, resolver.misses) == (2, 0)
+    assert len(rosdep_calls()) == 1
+
+def test_refresh_retries_unresolved_keys(tmp_path, rosdep_calls):
+    cache_file = tmp_path / "system_libraries.json"
+    RosdepResolver(cache_file).resolve(["eigen", "bad_key"])
+
+    resolver = RosdepResolver(cache_file, refresh=True)
+    resolver.resolve(["eigen", "bad_key"])
+
+    assert rosdep_calls()[-1] == ["bad_key"]
+    assert (resolver.hits, resolver.misses) == (1, 1)
+
+def test_single_key_miss_is_resolved(tmp_path, rosdep_calls):
+    cache_file = tmp_path / "system_libraries.json"
+    RosdepResolver(cache_file).resolve(["eigen", "curl"])
+
+    resolver = RosdepResolver(cache_file)
+    deps = resolver.resolve(["eigen", "curl", "tinyxml2"])
+
+    assert rosdep_calls()[-1] == ["tinyxml2"]
+    assert [dep.name for dep in deps] == ["eigen", "curl", "tinyxml2"]
+    assert deps[2].system_libs == ["libtinyxml2-dev", "libtinyxml22"]
+    assert resolver.unresolved == set()
+
+def test_single_unresolvable_key(tmp_path, rosdep_calls):
+    resolver = RosdepResolver(tmp_path / "system_libraries.json")
+    assert resolver.resolve(["bad_key"]) == []
+    assert resolver.unresolved == {"bad_key"}
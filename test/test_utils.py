@@ -0,0 +1,63 @@
+import pytest
+
+from ros2conan import tracing
+from ros2conan.utils import IGNORE_MARKERS, discover_packages, has_compiled_sources
+
+from .conftest import write_package_xml
+
+@pytest.fixture
+def tracer(monkeypatch):
+    tracer = tracing.Tracer()
+    tracer.enabled = True
+    monkeypatch.setattr(tracing, "tracer", tracer)
+    return tracer
+
+@pytest.fixture
+def repo(tmp_path):
+    """pkg_a with a nested package.xml that is not descended into, pkg_b and pkg_c in group/"""
+    write_package_xml(tmp_path / "pkg_a", "pkg_a")
+    (tmp_path / "pkg_a" / "CMakeLists.txt").write_text("")
+    write_package_xml(tmp_path / "pkg_a" / "test" / "fixture_pkg", "fixture_pkg")
+    write_package_xml(tmp_path / "group" / "pkg_b", "pkg_b")
+    (tmp_path / "group" / "pkg_b" / "setup.py").write_text("")
+    write_package_xml(tmp_path / "group" / "pkg_c", "pkg_c")
+    (tmp_path / "group" / "docs").mkdir()
+    return tmp_path
+
+def test_discover_packages(repo, tracer):
+    packages = discover_packages(repo)
+
+    assert [(pkg.path, pkg.type_meta.is_cpp_pkg(), pkg.type_meta.is_python_pkg()) for pkg in packages] == [
+        ("group/pkg_b", False, True), ("group/pkg_c", False, False), ("pkg_a", True, False)]
+    # root, group, docs and the three package directories, pkg_a/test is never listed
+    assert tracer.counters == {"directories_listed": 6, "packages_discovered": 3}
+
+@pytest.mark.parametrize("marker", IGNORE_MARKERS)
+def test_ignore_markers_prune(repo, tracer, marker):
+    (repo / "group" / marker).write_text("")
+    assert [pkg.path for pkg in discover_packages(repo)] == ["pkg_a"]
+    assert tracer.counters["directories_listed"] == 3
+
+def test_ignored_package_is_skipped(repo):
+    (repo / "group" / "pkg_b" / "COLCON_IGNORE").write_text("")
+    assert [pkg.path for pkg in discover_packages(repo)] == ["group/pkg_c", "pkg_a"]
+
+@pytest.mark.parametrize("dirname", [".git", ".hidden", "__pycache__"])
+def test_hidden_directories_are_pruned(repo, tracer, dirname):
+    write_package_xml(repo / dirname / "pkg_d", "pkg_d")
+    assert [pkg.path for pkg in discover_packages(repo)] == ["group/pkg_b", "group/pkg_c", "pkg_a"]
+    assert tracer.counters["directories_listed"] == 6
+
+def test_missing_root(tmp_path):
+    assert discover_packages(tmp_path / "missing") == []
+
+def test_has_compiled_sources(tmp_path):
+    (tmp_path / "cmake").mkdir()
+    (tmp_path / "cmake" / "macros.cmake").write_text("")
+    assert not has_compiled_sources(tmp_path)
+    (tmp_path / ".git").mkdir()
+    (tmp_path / ".git" / "hook.c").write_text("")
+    assert not has_compiled_sources(tmp_path)
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "Node.CPP").write_text("")
+    assert has_compiled_sources(tmp_path)
@@ -0,0 +1,61 @@
+import pytest
+
+from ros2conan.cache import ParseCache
+from ros2conan.workspace import scan_workspace
+
+from .conftest import write_package_xml
+
+@pytest.fixture
+def src_root(tmp_path):
+    """
+    repo_a holds the cmake package pkg_a and the Python package pkg_b in nested/, repo_b the
+    Python package pkg_c and a second pkg_a
+    """
+    src = tmp_path / "src"
+    write_package_xml(src / "repo_a" / "pkg_a", "pkg_a")
+    (src / "repo_a" / "pkg_a" / "CMakeLists.txt").write_text("")
+    write_package_xml(src / "repo_a" / "nested" / "pkg_b", "pkg_b")
+    (src / "repo_a" / "nested" / "pkg_b" / "setup.py").write_text("")
+    write_package_xml(src / "repo_b" / "pkg_c", "pkg_c")
+    (src / "repo_b" / "pkg_c" / "setup.cfg").write_text("")
+    write_package_xml(src / "repo_b" / "copy_of_pkg_a", "pkg_a", version="9.9.9")
+    return src
+
+def summary(index):
+    return {name: (parsed.repo, parsed.path, parsed.type_meta.is_cpp_pkg(), parsed.type_meta.is_python_pkg())
+            for name, parsed in index.items()}
+
+@pytest.mark.parametrize("workers, executor", [(1, "process"), (4, "thread"), (4, "process")])
+def test_scan_workspace(src_root, workers, executor):
+    index = scan_workspace(["repo_a", "repo_b"], str(src_root), workers=workers, executor=executor)
+
+    assert summary(index) == {
+        "pkg_b": ("repo_a", str(src_root / "repo_a" / "nested" / "pkg_b" / "package.xml"), False, True),
+        "pkg_a": ("repo_a", str(src_root / "repo_a" / "pkg_a" / "package.xml"), True, False),
+        "pkg_c": ("repo_b", str(src_root / "repo_b" / "pkg_c" / "package.xml"), False, True),
+    }
+
+def test_duplicate_names_keep_the_first_package(src_root):
+    index = scan_workspace(["repo_a", "repo_b"], str(src_root), workers=1)
+    assert index["pkg_a"].metadata.version == "1.0.0"
+
+    index = scan_workspace(["repo_b", "repo_a"], str(src_root), workers=1)
+    assert index["pkg_a"].metadata.version == "9.9.9"
+
+def test_scan_workspace_of_repos_file_dict(src_root):
+    repos = {"repositories": {"repo_b": {"type": "git", "url": "", "version": "main"}}}
+    assert list(scan_workspace(repos, str(src_root), workers=1)) == ["pkg_a", "pkg_c"]
+
+def test_cached_scan_matches(tmp_path, src_root):
+    index = scan_workspace(["repo_a", "repo_b"], str(src_root), workers=2, executor="thread")
+    with ParseCache(tmp_path / "cache") as cache:
+        scan_workspace(["repo_a", "repo_b"], str(src_root), workers=2, executor="thread", cache=cache)
+    with ParseCache(tmp_path / "cache") as cache:
+        cached_index = scan_workspace(["repo_a", "repo_b"], str(src_root), workers=2, executor="thread", cache=cache)
+
+    assert (cache.hits, cache.misses) == (4, 0)
+    assert summary(cached_index) == summary(index)
+
+def test_unknown_executor(src_root):
+    with pytest.raises(ValueError):
+        scan_workspace(["repo_a", "repo_b"], str(src_root), workers=2, executor="fiber")